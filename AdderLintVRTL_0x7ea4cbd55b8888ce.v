@@ -0,0 +1,64 @@
+//-----------------------------------------------------------------------------
+// AdderLintVRTL_0x7ea4cbd55b8888ce
+//-----------------------------------------------------------------------------
+// PyMTL: dump_vcd = True
+// PyMTL: verilog_test {"nbits": 8}
+// PyMTL: verilator_xinit = zeros
+`default_nettype none
+module AdderLintVRTL_0x7ea4cbd55b8888ce
+(
+  input  wire [   0:0] cin,
+  input  wire [   0:0] clk,
+  output wire [   0:0] cout,
+  input  wire [   7:0] in0,
+  input  wire [   7:0] in1,
+  output wire [   7:0] out,
+  input  wire [   0:0] reset
+);
+
+  // Imported Verilog source from:
+  // /root/package/pymtl/tools/integration/verilog_tests/AdderLintVRTL.v
+
+  AdderLintVRTL#(
+    .nbits ( 8 )
+  )  verilog_module
+  (
+    .reset ( reset ),
+    .cout  ( cout ),
+    .clk   ( clk ),
+    .in0   ( in0 ),
+    .cin   ( cin ),
+    .in1   ( in1 ),
+    .out   ( out )
+  );
+
+endmodule // AdderLintVRTL_0x7ea4cbd55b8888ce
+`default_nettype wire
+
+`line 1 "AdderLintVRTL.v" 0
+//------------------------------------------------------------------------
+// Adder with Lint Problem
+//------------------------------------------------------------------------
+module AdderLintVRTL
+#(
+  parameter nbits = 1
+)(
+  input              clk,
+  input              reset,
+  input  [nbits-1:0] in0,
+  input  [nbits-1:0] in1,
+  input              cin,
+  output [nbits-1:0] out,
+  output             cout
+);
+
+  reg [nbits:0] temp;
+
+  always @( * ) begin
+    temp = (in0 + in1) + cin;
+  end
+
+  assign cout = temp[nbits];
+  assign out  = temp[nbits-1:0];
+
+endmodule
@@ -0,0 +1,124 @@
+//-----------------------------------------------------------------------------
+// EnResetRegParamVRTL_0x5412d6ae3a48441c
+//-----------------------------------------------------------------------------
+// PyMTL: dump_vcd = True
+// PyMTL: verilog_test {"p_id": 0, "p_nbits": 6, "p_reset_value": 2}
+// PyMTL: verilator_xinit = zeros
+`default_nettype none
+module EnResetRegParamVRTL_0x5412d6ae3a48441c
+(
+  input  wire [   0:0] clk,
+  input  wire [   5:0] d,
+  input  wire [   0:0] en,
+  output wire [   5:0] q,
+  input  wire [   0:0] reset
+);
+
+  // Imported Verilog source from:
+  // /root/package/pymtl/tools/integration/verilog_tests/EnResetRegParamVRTL.v
+
+  EnResetRegParamVRTL#(
+    .p_nbits ( 6 ),
+    .p_reset_value ( 2 ),
+    .p_id ( 0 )
+  )  verilog_module
+  (
+    .reset ( reset ),
+    .q     ( q ),
+    .en    ( en ),
+    .d     ( d ),
+    .clk   ( clk )
+  );
+
+endmodule // EnResetRegParamVRTL_0x5412d6ae3a48441c
+`default_nettype wire
+
+`line 1 "EnResetRegParamVRTL.v" 0
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop with enable and reset
+//------------------------------------------------------------------------
+
+`line 1 "vc-assert.v" 0
+//========================================================================
+// vc-Assert
+//========================================================================
+
+`ifndef VC_ASSERT_V
+`define VC_ASSERT_V
+
+//------------------------------------------------------------------------
+// VC_PROPAGATE_X
+//------------------------------------------------------------------------
+
+`define VC_PROPAGATE_X( i_, o_ )                                        \
+  if ((|(i_ ^ i_)) == 1'b0);                                            \
+  else                                                                  \
+    o_ = o_ + 1'bx
+
+//------------------------------------------------------------------------
+// VC_ASSERT
+//------------------------------------------------------------------------
+
+`define VC_ASSERT( expr_ )                                              \
+  if ( expr_ );                                                         \
+  else begin                                                            \
+    $display( "\n VC_ASSERT FAILED\n  - assertion       :%s\n  - module instance : %m\n  - time            : %0d\n", \
+              "expr_", $time );                                         \
+    $finish;                                                            \
+  end                                                                   \
+  if (1)
+
+//------------------------------------------------------------------------
+// VC_ASSERT_FAIL
+//------------------------------------------------------------------------
+
+`define VC_ASSERT_FAIL( msg_ )                                         \
+  $display( "\n VC_ASSERT FAILED\n  - assertion       :%s\n  - module instance : %m\n  - time            : %0d\n", \
+            msg_, $time );                                             \
+  $finish;                                                             \
+  if (1)
+
+//------------------------------------------------------------------------
+// VC_ASSERT_NOT_X
+//------------------------------------------------------------------------
+
+`define VC_ASSERT_NOT_X( net_ )                                         \
+  if ((|(net_ ^ net_)) == 1'b0);                                        \
+  else begin                                                            \
+    $display( "\n VC_ASSERT FAILED\n  - assertion that net not contain X's failed\n  - module instance : %m\n  - net             :%s\n  - time            : %0d\n", \
+              "net_", $time );                                          \
+    $finish;                                                            \
+  end                                                                   \
+  if (1)
+
+`endif /* VC_ASSERT_V */
+
+
+`line 6 "EnResetRegParamVRTL.v" 0
+
+module EnResetRegParamVRTL
+#(
+  parameter p_nbits       = 1,
+  parameter p_reset_value = 0,
+  parameter p_id          = 0
+)(
+  input                clk,   // Clock input
+  input                reset, // Sync reset input (sampled on rising edge)
+  output [p_nbits-1:0] q,     // Data output
+  input  [p_nbits-1:0] d,     // Data input (sampled on rising clk edge)
+  input                en     // Enable input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    if ( reset || en )
+      q <= reset ? p_reset_value : d;
+
+  // Assertions
+
+  always @( posedge clk )
+    if ( !reset )
+      `VC_ASSERT_NOT_X( en );
+
+endmodule
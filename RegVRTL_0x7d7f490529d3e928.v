@@ -0,0 +1,51 @@
+//-----------------------------------------------------------------------------
+// RegVRTL_0x7d7f490529d3e928
+//-----------------------------------------------------------------------------
+// PyMTL: dump_vcd = True
+// PyMTL: verilog_test {"p_nbits": 128}
+// PyMTL: verilator_xinit = zeros
+`default_nettype none
+module RegVRTL_0x7d7f490529d3e928
+(
+  input  wire [   0:0] clk,
+  input  wire [ 127:0] d,
+  output wire [ 127:0] q,
+  input  wire [   0:0] reset
+);
+
+  // Imported Verilog source from:
+  // /root/package/pymtl/tools/integration/verilog_tests/RegVRTL.v
+
+  RegVRTL#(
+    .p_nbits ( 128 )
+  )  verilog_module
+  (
+    .reset ( reset ),
+    .q     ( q ),
+    .d     ( d ),
+    .clk   ( clk )
+  );
+
+endmodule // RegVRTL_0x7d7f490529d3e928
+`default_nettype wire
+
+`line 1 "RegVRTL.v" 0
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop
+//------------------------------------------------------------------------
+module RegVRTL
+#(
+  parameter p_nbits = 1
+)(
+  input                clk,   // Clock input
+  input                reset, // Clock input
+  output [p_nbits-1:0] q,     // Data output
+  input  [p_nbits-1:0] d      // Data input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    q <= d;
+
+endmodule
@@ -46,3 +46,10 @@ class InValRdyRandStallAdapter (object):
 
     s.in_.rdy.next = ( s.data == None ) and ( s.rgen.random() > s.stall_prob )
 
+  def checkpoint_state( s ):
+    return ( s.data, s.rgen.getstate() )
+
+  def restore_state( s, state ):
+    s.data, rgen_state = state
+    s.rgen.setstate( rgen_state )
+
@@ -59,6 +59,18 @@ class OutValRdyInelasticPipeAdapter (object):
         # Advance the pipeline
         s.pipe.advance()
 
+  def checkpoint_state( s ):
+    if s.nstages > 0:
+      return ( s.out_q.checkpoint_state(), s.pipe.checkpoint_state() )
+    else:
+      return ( s.out_q.checkpoint_state(), None )
+
+  def restore_state( s, state ):
+    out_q_state, pipe_state = state
+    s.out_q.restore_state( out_q_state )
+    if s.nstages > 0:
+      s.pipe.restore_state( pipe_state )
+
   def __str__( s ):
     if s.nstages > 0:
       return ''.join([ ("*" if x != None else ' ') for x in s.pipe.data ])
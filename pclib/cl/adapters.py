@@ -41,6 +41,13 @@ class InValRdyQueueAdapter (object):
       s.data.append( deepcopy(s.in_.msg) )
     s.in_.rdy.next = ( len( s.data ) != s.data.maxlen )
 
+  def checkpoint_state( s ):
+    return list( s.data )
+
+  def restore_state( s, state ):
+    s.data.clear()
+    s.data.extend( state )
+
 #-------------------------------------------------------------------------
 # OutValRdyQueueAdapter
 #-------------------------------------------------------------------------
@@ -75,3 +82,10 @@ class OutValRdyQueueAdapter (object):
       s.out.msg.next = s.data[0]
     s.out.val.next = ( len( s.data ) != 0 )
 
+  def checkpoint_state( s ):
+    return list( s.data )
+
+  def restore_state( s, state ):
+    s.data.clear()
+    s.data.extend( state )
+
@@ -30,3 +30,10 @@ class Pipeline( object ):
   def advance( self ):
     self.data.rotate()
 
+  def checkpoint_state( self ):
+    return list( self.data )
+
+  def restore_state( self, state ):
+    self.data.clear()
+    self.data.extend( state )
+
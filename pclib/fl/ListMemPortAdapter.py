@@ -6,9 +6,14 @@
 # port-based memory interface. We use greenlets to enable us to wait
 # until the response has come back before returning to the function
 # accessing the list.
+#
+# The co_getitem() and co_setitem() methods are generator-based versions
+# for @tick_fl blocks run as coroutines (see fl_scheduler.py).
 
 from greenlet import greenlet
 
+from pymtl.tools.simulation.fl_scheduler import Return, wait_until
+
 #-------------------------------------------------------------------------
 # ListMemPortAdapter
 #-------------------------------------------------------------------------
@@ -154,6 +159,108 @@ class ListMemPortAdapter (object):
     s.memreq.val.next  = 0
     s.memresp.rdy.next = 0
 
+  #-----------------------------------------------------------------------
+  # co_getitem
+  #-----------------------------------------------------------------------
+
+  def co_getitem( s, key ):
+
+    nbytes = s._send_request( s.MemReqMsgType.TYPE_READ, key )
+
+    # Yield so we wait at least one cycle for the ready/response
+
+    yield
+
+    # Wait for the memory request to be accepted and for the response
+
+    yield s._wait_response()
+
+    # When memory response has arrived, return the corresponding data
+
+    raise Return( s.memresp.msg.data[0:nbytes*8].int() )
+
+  #-----------------------------------------------------------------------
+  # co_setitem
+  #-----------------------------------------------------------------------
+
+  def co_setitem( s, key, value ):
+
+    s._send_request( s.MemReqMsgType.TYPE_WRITE, key, value )
+
+    # Yield so we wait at least one cycle for the response
+
+    yield
+
+    # Wait for the memory request to be accepted and for the response
+
+    yield s._wait_response()
+
+  #-----------------------------------------------------------------------
+  # _send_request
+  #-----------------------------------------------------------------------
+  # Sends a memory request for the given list index or slice, returning
+  # the number of bytes accessed.
+
+  def _send_request( s, type_, key, value=None ):
+
+    # Calculate base address and length for request
+
+    if isinstance( key, slice ):
+      addr   = int(key.start)
+      nbytes = int(key.stop) - int(key.start)
+    else:
+      addr   = int(key)
+      nbytes = 4
+
+    len_ = nbytes if nbytes < s.memreq.msg.data.nbits/8 else 0
+
+    # Create a memory request to send out memory request port
+
+    s.trace = "r" if type_ == s.MemReqMsgType.TYPE_READ else "w"
+
+    memreq_msg       = s.MemReqMsgType()
+    memreq_msg.type_ = type_
+    memreq_msg.addr  = s.base + 4 * addr
+    memreq_msg.len   = len_
+    if value is not None:
+      memreq_msg.data = value
+
+    s.memreq.msg.next  = memreq_msg
+    s.memreq.val.next  = 1
+    s.memresp.rdy.next = 1
+
+    return nbytes
+
+  #-----------------------------------------------------------------------
+  # _wait_response
+  #-----------------------------------------------------------------------
+  # Coroutine waiting until the memory request is accepted and the memory
+  # response has arrived.
+
+  def _wait_response( s ):
+
+    # If memory request is not ready yet then wait
+
+    s.memreq.val.next  = 1
+    s.memresp.rdy.next = 1
+
+    if not s.memreq.rdy:
+      s.trace = ";"
+      yield wait_until( s.memreq.rdy )
+
+    # If memory response has not arrived, then wait
+
+    s.memreq.val.next  = 0
+    s.memresp.rdy.next = 1
+
+    if not s.memresp.val:
+      s.trace = ":"
+      yield wait_until( s.memresp.val )
+
+    s.trace = " "
+    s.memreq.val.next  = 0
+    s.memresp.rdy.next = 0
+
   def set_base( s, addr ):
     s.base = addr
     s.base_set = True
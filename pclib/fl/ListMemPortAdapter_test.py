@@ -0,0 +1,104 @@
+#=========================================================================
+# ListMemPortAdapter_test
+#=========================================================================
+
+from __future__ import print_function
+
+import struct
+import pytest
+
+from pymtl      import *
+from pclib.test import TestMemory
+from pclib.ifcs import MemMsg4B, MemReqMsg4B, MemRespMsg4B
+from pclib.ifcs import InValRdyBundle, OutValRdyBundle
+
+from ListMemPortAdapter import ListMemPortAdapter
+
+#-------------------------------------------------------------------------
+# ArrayIncr
+#-------------------------------------------------------------------------
+# Increments each element of an array in memory, either from a
+# greenlet-based or from a coroutine-based @tick_fl block.
+
+class ArrayIncr( Model ):
+
+  def __init__( s, base, size, coroutine=False ):
+
+    s.memreq  = OutValRdyBundle( MemReqMsg4B  )
+    s.memresp = InValRdyBundle ( MemRespMsg4B )
+
+    s.mem = ListMemPortAdapter( s.memreq, s.memresp )
+    s.mem.set_base( base )
+    s.mem.set_size( size )
+
+    s.done = False
+
+    if not coroutine:
+      @s.tick_fl
+      def logic():
+        if not s.done:
+          for i in range( size ):
+            s.mem[i] = s.mem[i] + 1
+          s.done = True
+
+    else:
+      @s.tick_fl
+      def logic():
+        if not s.done:
+          for i in range( size ):
+            value = yield s.mem.co_getitem( i )
+            yield s.mem.co_setitem( i, value + 1 )
+          s.done = True
+
+  def line_trace( s ):
+    return s.mem.line_trace()
+
+#-------------------------------------------------------------------------
+# TestHarness
+#-------------------------------------------------------------------------
+
+class TestHarness( Model ):
+
+  def __init__( s, size, stall_prob, latency, coroutine ):
+
+    s.incr = ArrayIncr ( 0x1000, size, coroutine )
+    s.mem  = TestMemory( MemMsg4B(), 1, stall_prob, latency )
+
+    s.connect( s.incr.memreq,  s.mem.reqs[0]  )
+    s.connect( s.incr.memresp, s.mem.resps[0] )
+
+  def line_trace( s ):
+    return s.incr.line_trace() + " " + s.mem.line_trace()
+
+#-------------------------------------------------------------------------
+# test
+#-------------------------------------------------------------------------
+# The coroutine version behaves exactly like the greenlet version.
+
+@pytest.mark.parametrize( "stall_prob,latency", [
+  ( 0.0, 0 ),
+  ( 0.5, 3 ),
+])
+def test( stall_prob, latency ):
+
+  data   = [ 3, 1, 4, 1, 5, 9 ]
+  traces = []
+
+  for coroutine in [ False, True ]:
+
+    model = TestHarness( len(data), stall_prob, latency, coroutine )
+    model.elaborate()
+    model.mem.write_mem( 0x1000, struct.pack( "<6I", *data ) )
+
+    sim = SimulationTool( model )
+    sim.reset()
+    trace = []
+    while not model.incr.done:
+      trace.append( model.line_trace() )
+      sim.cycle()
+    traces.append( trace )
+
+    result = struct.unpack( "<6I", model.mem.read_mem( 0x1000, 24 ) )
+    assert list( result ) == [ x + 1 for x in data ]
+
+  assert traces[0] == traces[1]
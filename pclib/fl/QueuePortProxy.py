@@ -6,9 +6,14 @@
 # into a val/rdy port-based interface. We use greenlets to enable us to
 # wait until data is ready via the val/rdy interface before returning to
 # function calling the popleft() or append() method.
+#
+# The co_popleft() and co_append() methods are generator-based versions
+# for @tick_fl blocks run as coroutines (see fl_scheduler.py).
 
 from greenlet import greenlet
 
+from pymtl.tools.simulation.fl_scheduler import Return, wait_until
+
 #=========================================================================
 # InQueuePortProxy
 #=========================================================================
@@ -51,6 +56,33 @@ class InQueuePortProxy (object):
     s.in_.rdy.next = 0
     return s.in_.msg
 
+  #-----------------------------------------------------------------------
+  # co_popleft
+  #-----------------------------------------------------------------------
+
+  def co_popleft( s ):
+
+    # Set the rdy signal
+
+    s.in_.rdy.next = 1
+    s.trace = "+"
+
+    # Yield so we wait at least one cycle for the response
+
+    yield
+
+    # If input interface is not valid then wait until it is
+
+    if not s.in_.val:
+      s.trace = ":"
+      yield wait_until( s.in_.val )
+
+    # Input interface is valid so reset rdy signal and return message
+
+    s.trace = " "
+    s.in_.rdy.next = 0
+    raise Return( s.in_.msg )
+
   #-----------------------------------------------------------------------
   # line_trace
   #-----------------------------------------------------------------------
@@ -100,6 +132,33 @@ class OutQueuePortProxy (object):
     s.trace = " "
     s.out.val.next = 0
 
+  #-----------------------------------------------------------------------
+  # co_append
+  #-----------------------------------------------------------------------
+
+  def co_append( s, msg ):
+
+    # Set the val signal and message
+
+    s.out.msg.next = msg
+    s.out.val.next = 1
+    s.trace = "+"
+
+    # Yield so we wait at least one cycle for the rdy
+
+    yield
+
+    # If output interface is not ready then wait until it is
+
+    if not s.out.rdy:
+      s.trace = ":"
+      yield wait_until( s.out.rdy )
+
+    # Output interface is ready so reset val signal
+
+    s.trace = " "
+    s.out.val.next = 0
+
   #-----------------------------------------------------------------------
   # line_trace
   #-----------------------------------------------------------------------
@@ -24,6 +24,18 @@ def queue_copy( n, in_queue, out_queue ):
   for _ in range(n):
     out_queue.append( in_queue.popleft() )
 
+#-------------------------------------------------------------------------
+# Coroutine Implementation
+#-------------------------------------------------------------------------
+# The same function written as a coroutine, for @tick_fl blocks which are
+# run by the FL scheduler instead of in a greenlet.
+
+def queue_copy_co( n, in_queue, out_queue ):
+
+  for _ in range(n):
+    msg = yield in_queue.co_popleft()
+    yield out_queue.co_append( msg )
+
 #-------------------------------------------------------------------------
 # Test for underlying queue_copy
 #-------------------------------------------------------------------------
@@ -45,7 +57,7 @@ def test_queue_copy():
 # interface to an output val/rdy interface.
 class QueueCopy( Model ):
 
-  def __init__( s, dtype, nmsgs ):
+  def __init__( s, dtype, nmsgs, coroutine=False ):
 
     s.nmsgs = nmsgs
 
@@ -75,9 +87,18 @@ class QueueCopy( Model ):
     # queue port proxy objects include infinite internal queues so the
     # output queue can never stall.
 
-    @s.tick_fl
-    def logic():
-      queue_copy( s.nmsgs, s.in_queue, s.out_queue )
+    if not coroutine:
+      @s.tick_fl
+      def logic():
+        queue_copy( s.nmsgs, s.in_queue, s.out_queue )
+
+    # The coroutine version yields to the FL scheduler when it has to
+    # wait instead of switching greenlets.
+
+    else:
+      @s.tick_fl
+      def logic():
+        yield queue_copy_co( s.nmsgs, s.in_queue, s.out_queue )
 
   #-----------------------------------------------------------------------
   # line_trace
@@ -92,10 +113,11 @@ class QueueCopy( Model ):
 
 class TestHarness (Model):
 
-  def __init__( s, src_msgs, sink_msgs, src_delay, sink_delay ):
+  def __init__( s, src_msgs, sink_msgs, src_delay, sink_delay,
+                coroutine=False ):
 
     s.src   = TestSource ( 32, src_msgs,  src_delay  )
-    s.qcopy = QueueCopy  ( 32, len(src_msgs)         )
+    s.qcopy = QueueCopy  ( 32, len(src_msgs), coroutine )
     s.sink  = TestSink   ( 32, sink_msgs, sink_delay )
 
     s.connect( s.src.out,   s.qcopy.in_ )
@@ -112,12 +134,13 @@ class TestHarness (Model):
 #-------------------------------------------------------------------------
 # test
 #-------------------------------------------------------------------------
+@pytest.mark.parametrize( "coroutine", [ False, True ] )
 @pytest.mark.parametrize( "src_delay,sink_delay", [
   (  0, 0  ),
   ( 10, 5  ),
   (  5, 10 ),
 ])
-def test( dump_vcd, src_delay, sink_delay ):
+def test( dump_vcd, src_delay, sink_delay, coroutine ):
 
   # Test messages
 
@@ -127,7 +150,8 @@ def test( dump_vcd, src_delay, sink_delay ):
 
   # Instantiate and elaborate the model
 
-  model = TestHarness( src_msgs, sink_msgs, src_delay, sink_delay )
+  model = TestHarness( src_msgs, sink_msgs, src_delay, sink_delay,
+                       coroutine )
   model.vcd_file = dump_vcd
   model.elaborate()
 
@@ -150,3 +174,30 @@ def test( dump_vcd, src_delay, sink_delay ):
   sim.cycle()
   sim.cycle()
 
+
+#-------------------------------------------------------------------------
+# test_coroutine_timing
+#-------------------------------------------------------------------------
+# The coroutine version behaves exactly like the greenlet version.
+
+@pytest.mark.parametrize( "src_delay,sink_delay", [
+  ( 0, 0 ),
+  ( 3, 7 ),
+])
+def test_coroutine_timing( src_delay, sink_delay ):
+
+  data   = [ 11, 12, 13, 14, 15, 16 ]
+  traces = []
+
+  for coroutine in [ False, True ]:
+    model = TestHarness( data, data, src_delay, sink_delay, coroutine )
+    model.elaborate()
+    sim   = SimulationTool( model )
+    sim.reset()
+    trace = []
+    while not model.done():
+      trace.append( model.line_trace() )
+      sim.cycle()
+    traces.append( trace )
+
+  assert traces[0] == traces[1]
@@ -8,6 +8,8 @@ from Queue                 import Queue
 from ListMemPortAdapter    import ListMemPortAdapter
 from ListMemPortAdapterOld import ListMemPortAdapterOld
 
+from pymtl.tools.simulation.fl_scheduler import Return, wait_until
+
 # Other names
 
 from QueuePortProxy import InQueuePortProxy  as InValRdyQueueAdapter
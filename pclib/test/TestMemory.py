@@ -159,6 +159,30 @@ class TestMemory( Model ):
 
     return trace_str
 
+  #-----------------------------------------------------------------------
+  # checkpoint_state
+  #-----------------------------------------------------------------------
+  # Saves the memory contents and the messages buffered in the adapters.
+
+  def checkpoint_state( s ):
+    return (
+      str( s.mem ),
+      [ req_q .checkpoint_state() for req_q  in s.reqs_q  ],
+      [ resp_q.checkpoint_state() for resp_q in s.resps_q ],
+    )
+
+  #-----------------------------------------------------------------------
+  # restore_state
+  #-----------------------------------------------------------------------
+
+  def restore_state( s, state ):
+    mem, reqs_q_state, resps_q_state = state
+    s.mem[:] = mem
+    for req_q, req_q_state in zip( s.reqs_q, reqs_q_state ):
+      req_q.restore_state( req_q_state )
+    for resp_q, resp_q_state in zip( s.resps_q, resps_q_state ):
+      resp_q.restore_state( resp_q_state )
+
   #-----------------------------------------------------------------------
   # write_mem
   #-----------------------------------------------------------------------
@@ -13,6 +13,8 @@ from pclib.ifcs import InValRdyBundle, OutValRdyBundle
 class TestRandomDelay( Model ):
   'Inserts random delays between input and output val/rdy interfaces.'
 
+  line_trace_attrs = ( 'counter', )
+
   def __init__( s, dtype, max_random_delay = 0, seed=0xb601bc01 ):
 
     s.in_  = InValRdyBundle ( dtype )
@@ -49,6 +51,7 @@ class TestRandomDelay( Model ):
       # an explicit elaborate function.
 
       if s.max_random_delay == 0:
+        s.idle()
         return
 
       # At the end of the cycle, we AND together the val/rdy bits to
@@ -86,7 +89,26 @@ class TestRandomDelay( Model ):
       s.in_.rdy.next = ( s.counter == 0 ) and not s.buf_full
       s.out.val.next = ( s.counter == 0 ) and     s.buf_full
 
+      # Without a transaction, the val/rdy bits did not change. We are
+      # then either waiting for a transaction, or counting down the delay
+      # with both bits low until the counter reaches zero.
+
+      if not in_go and not out_go and s.in_.rdy != s.out.val:
+        s.idle()
+      elif not in_go and not out_go and s.counter > 0:
+        s.idle( s.counter - 1 )
+
+  def skip_cycles( s, ncycles ):
+    s.counter -= ncycles
+
   def line_trace( s ):
 
     return "{} ({:2}) {}".format( s.in_, s.counter, s.out )
 
+  def checkpoint_state( s ):
+    return ( s.buf, s.buf_full, s.counter, s.rgen.getstate() )
+
+  def restore_state( s, state ):
+    s.buf, s.buf_full, s.counter, rgen_state = state
+    s.rgen.setstate( rgen_state )
+
@@ -83,3 +83,40 @@ def test_delay( dump_vcd, random_delay ):
   sim.cycle()
   sim.cycle()
   sim.cycle()
+
+#-----------------------------------------------------------------------
+# test_skip_idle
+#-----------------------------------------------------------------------
+# Skipping the cycles where the source, sink and random delay are idle
+# gives the same state at each simulated cycle.
+@pytest.mark.parametrize('random_delay', [
+   0,
+   5,
+  20,
+])
+def test_skip_idle( random_delay ):
+
+  test_msgs = [ 0x0000, 0x0a0a, 0x0b0b, 0x0c0c, 0x0d0d, 0xf0f0 ]
+
+  traces = []
+  for skip_idle in [ False, True ]:
+
+    model = TestHarness( 16, test_msgs, random_delay )
+    model.elaborate()
+
+    sim = SimulationTool( model )
+    sim.reset()
+
+    trace = []
+    def done():
+      trace.append( ( sim.ncycles, model.line_trace() ) )
+      return model.done()
+
+    sim.run( until=done, skip_idle=skip_idle )
+    traces.append( trace )
+
+  full, skipped = traces
+  assert full[-1] == skipped[-1]
+  assert set( skipped ) <= set( full )
+  if random_delay > 1:
+    assert len( skipped ) < len( full )
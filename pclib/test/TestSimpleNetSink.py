@@ -16,6 +16,8 @@ from pclib.ifcs import InValRdyBundle, OutValRdyBundle
 # information
 class TestSimpleNetSink( Model ):
 
+  line_trace_attrs = ( 'idx', )
+
   def __init__( s, dtype, msgs ):
 
     s.in_  = InValRdyBundle( dtype )
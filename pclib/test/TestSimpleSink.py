@@ -16,6 +16,8 @@ class TestSinkError( Exception ):
 
 class TestSimpleSink( Model ):
 
+  line_trace_attrs = ( 'idx', )
+
   def __init__( s, dtype, msgs ):
 
     s.in_  = InValRdyBundle( dtype )
@@ -71,7 +73,18 @@ class TestSimpleSink( Model ):
         s.in_.rdy.next = False
         s.done   .next = True
 
+      # Nothing happens until the next message arrives (the ready and done
+      # signals are only both low during reset)
+
+      if not in_go and ( s.in_.rdy or s.done ):
+        s.idle()
 
   def line_trace( s ):
     return "{} ({:2})".format( s.in_, s.idx )
 
+  def checkpoint_state( s ):
+    return s.idx
+
+  def restore_state( s, state ):
+    s.idx = state
+
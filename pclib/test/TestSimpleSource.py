@@ -13,6 +13,8 @@ from pclib.ifcs import OutValRdyBundle
 class TestSimpleSource( Model ):
   'Outputs data provided in ``msgs`` onto a val/rdy interface.'
 
+  line_trace_attrs = ( 'idx', )
+
   def __init__( s, dtype, msgs ):
 
     s.out  = OutValRdyBundle( dtype )
@@ -40,6 +42,8 @@ class TestSimpleSource( Model ):
           s.out.msg.next = s.msgs[0]
         s.out.val  .next = False
         s.done     .next = True
+        if s.done:
+          s.idle()
         return
 
       # At the end of the cycle, we AND together the val/rdy bits to
@@ -64,7 +68,18 @@ class TestSimpleSource( Model ):
         s.out.val.next = False
         s.done   .next = True
 
+      # Nothing happens until the sink is ready for the current message
+
+      if not out_go and s.out.val:
+        s.idle()
+
   def line_trace( s ):
 
     return "({:2}) {}".format( s.idx, s.out )
 
+  def checkpoint_state( s ):
+    return s.idx
+
+  def restore_state( s, state ):
+    s.idx = state
+
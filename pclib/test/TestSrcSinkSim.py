@@ -32,21 +32,33 @@ class TestSrcSinkSim( object ):
   #-----------------------------------------------------------------------
   # run_test
   #-----------------------------------------------------------------------
-  def run_test( self ):
+  # The line trace is printed every cycle. If trace_depth is given, the
+  # line traces of the last trace_depth cycles are recorded instead and
+  # only printed if the test fails. If golden is the path of an npz file,
+  # the output ports of the source, the model and the sink are checked
+  # against the trace saved there, or saved to it (see run_sim).
+  def run_test( self, trace_depth=None, golden=None ):
 
     # Create a simulator using the simulation tool
 
     self.model.elaborate()
     sim = SimulationTool( self.model )
 
+    if golden:
+      from pymtl.tools.simulation.golden_trace import GoldenTraceRecorder
+      golden_trace = GoldenTraceRecorder( sim )
+
     # Run the simulation
 
     print()
 
     sim.reset()
-    while not self.model.done():
-      sim.print_line_trace()
-      sim.cycle()
+    if trace_depth is None:
+      sim.run( until=self.model.done, trace=True )
+    else:
+      recorder = sim.record_line_trace( trace_depth )
+      with recorder.dump_on_error():
+        sim.run( until=self.model.done, trace=recorder.capture )
 
     # Add a couple extra ticks so that the VCD dump is nicer
 
@@ -54,6 +66,9 @@ class TestSrcSinkSim( object ):
     sim.cycle()
     sim.cycle()
 
+    if golden:
+      golden_trace.check( golden )
+
 #-------------------------------------------------------------------------
 # TestSourceSinkHarness
 #-------------------------------------------------------------------------
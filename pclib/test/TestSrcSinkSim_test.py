@@ -67,3 +67,27 @@ def test_TestSrcSinkSim( dump_vcd, src_delay, sink_delay ):
 
 
 
+
+#-------------------------------------------------------------------------
+# test_golden
+#-------------------------------------------------------------------------
+def test_golden( tmpdir ):
+  'The first run saves a golden trace, later runs are compared with it.'
+
+  golden   = str( tmpdir.join( 'ValRdyBuffer.npz' ) )
+  src_msgs = sink_msgs = range( 15 )
+
+  def create_sim( sink_delay ):
+    model = ValRdyBuffer( 8 )
+    model.vcd_file = None
+    return TestSrcSinkSim( model, src_msgs, sink_msgs, 0, sink_delay )
+
+  for i in range( 2 ):
+    create_sim( 0 ).run_test( golden=golden )
+
+  # Delays change the cycle-level behavior
+
+  sim = create_sim( 3 )
+  with pytest.raises( AssertionError ) as e:
+    sim.run_test( golden=golden )
+  assert 'differs from golden trace' in str( e.value )
@@ -56,8 +56,7 @@ class TestVectorSimulator( object ):
       if self.wait_cycles == 0:
         sim.eval_combinational()
       else:
-        for i in range(self.wait_cycles):
-          sim.cycle()
+        sim.run( self.wait_cycles )
 
       # Print the line trace
       sim.print_line_trace()
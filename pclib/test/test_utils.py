@@ -41,7 +41,19 @@ def mk_test_case_table( raw_test_case_table ):
 # run sim
 #-------------------------------------------------------------------------
 
-def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
+# Runs the simulation until model.done() or for at most max_cycles
+# cycles, printing the line trace every cycle. If trace_depth is given,
+# the line traces of the last trace_depth cycles are recorded instead
+# and only printed if the simulation fails.
+#
+# If golden is the path of an npz file, the output ports of the model
+# and of its submodels are recorded each cycle. The trace is saved to
+# the file if it does not exist, otherwise the simulation fails at the
+# first cycle where it differs from the saved trace (see
+# pymtl/tools/simulation/golden_trace.py).
+
+def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000,
+             trace_depth=None, golden=None ):
 
   # Setup the model
 
@@ -54,20 +66,27 @@ def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
 
   sim = SimulationTool( model )
 
+  if golden:
+    from pymtl.tools.simulation.golden_trace import GoldenTraceRecorder
+    golden_trace = GoldenTraceRecorder( sim )
+
   # Reset model
 
   sim.reset()
   print()
 
-  # Run simulation
-
-  while not model.done() and sim.ncycles < max_cycles:
-    sim.print_line_trace()
-    sim.cycle()
+  # Run simulation, force a test failure if we timed out
 
-  # Force a test failure if we timed out
+  if trace_depth is None:
+    sim.run( max_cycles - sim.ncycles, until=model.done, trace=True )
+    assert sim.ncycles < max_cycles
 
-  assert sim.ncycles < max_cycles
+  else:
+    recorder = sim.record_line_trace( trace_depth )
+    with recorder.dump_on_error():
+      sim.run( max_cycles - sim.ncycles, until=model.done,
+               trace=recorder.capture )
+      assert sim.ncycles < max_cycles
 
   # Extra ticks to make VCD easier to read
 
@@ -75,6 +94,9 @@ def run_sim( model, dump_vcd=None, test_verilog=False, max_cycles=5000 ):
   sim.cycle()
   sim.cycle()
 
+  if golden:
+    golden_trace.check( golden )
+
 #-------------------------------------------------------------------------
 # run_test_vector_sim
 #-------------------------------------------------------------------------
@@ -127,6 +127,18 @@ class Bits( SignalValue ):
       )
     self._next._uint = (value & self._mask)
 
+  #---------------------------------------------------------------------
+  # flop
+  #---------------------------------------------------------------------
+  # Overrides SignalValue.flop. Compares the integer payloads directly
+  # and skips the update (and notifying the simulator) when unchanged.
+  # The value in _next was already checked by write_next.
+  def flop( self ):
+    if self._uint != self._next._uint:
+      self._uint = self._next._uint
+      self.notify_sim_comb_update()
+      for func in self._slices: func()
+
   #---------------------------------------------------------------------
   # bit_length
   #---------------------------------------------------------------------
@@ -13,9 +13,11 @@ import copy
 # (InPort, OutPort, Wire), needs to subclass SignalValue.
 class SignalValue( object ):
 
-  constant    = False
-  _callbacks  = []
-  _slices     = []
+  constant        = False
+  _callbacks      = []
+  _callback_masks = None
+  _slices         = []
+  _flop_pending   = False
 
   #---------------------------------------------------------------------
   # Write v property
@@ -50,16 +52,14 @@ class SignalValue( object ):
   def next( self ):
     return self._next
 
+  # Note: the simulator only queues a signal for flopping once per cycle
+  # (see _flop_pending), so multiple writes are cheap.
   @n.setter
   def n( self, value ):
-    # TODO: add optimization?
-    #if value != self._next:
     self.write_next( value )
     self.notify_sim_seq_update()
   @next.setter
   def next( self, value ):
-    # TODO: add optimization?
-    #if value != self._next:
     self.write_next( value )
     self.notify_sim_seq_update()
 
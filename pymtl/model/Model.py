@@ -110,6 +110,33 @@ class Model( object ):
 
   vmark_as_bram = False
 
+  # Option: line_trace_attrs
+  #
+  # Names of Python attributes (rather than signals) shown by the line
+  # trace of the model which the line trace recorder of the simulator
+  # should capture along with the values of the nets, so that line
+  # traces can be rendered for past cycles. Attributes holding immutable
+  # values (e.g., ints) read by line_trace() itself, such as the index
+  # of the next message of a test source, are found without being
+  # listed; list those read in other ways. These attributes should hold
+  # immutable values.
+  #
+  #   line_trace_attrs = ( 'idx', )
+
+  line_trace_attrs = ()
+
+  # Option: checkpoint_stateless
+  #
+  # Set to True on models whose blocks keep no state in Python
+  # attributes (only in signals), so that their whole state is saved by
+  # simulator checkpoints without implementing checkpoint_state(). Like
+  # models implementing checkpoint_state(), they can be rewound by
+  # SimulationTool.run() with check_every > 1.
+  #
+  #   checkpoint_stateless = True
+
+  checkpoint_stateless = False
+
   #=====================================================================
   # Modeling API
   #=====================================================================
@@ -137,6 +164,7 @@ class Model( object ):
     inst._posedge_clk_blocks   = []
     inst._combinational_blocks = []
     inst._connections          = set()
+    inst._idle                 = 0
 
     return inst
 
@@ -313,6 +341,14 @@ class Model( object ):
     >>> @s.tick_fl
     >>> def my_logic()
     >>>   s.out.next = s.in_
+
+    Blocks containing a yield statement are instead run as coroutines
+    by the simulator's FL scheduler (see fl_scheduler.py).
+
+    >>> @s.tick_fl
+    >>> def my_logic()
+    >>>   msg = yield s.in_q.co_popleft()
+    >>>   s.out.next = msg
     """
 
     return self.tick( func )
@@ -414,6 +450,64 @@ class Model( object ):
     """
     return ""
 
+  #-----------------------------------------------------------------------
+  # checkpoint_state
+  #-----------------------------------------------------------------------
+  def checkpoint_state( self ):
+    """Returns a picklable object capturing any Model state kept in
+    Python attributes rather than in signals (e.g., the contents of
+    a test memory), or None if there is no such state.
+
+    Model subclasses with Python-side state should implement this method
+    and restore_state() if they would like to support simulator
+    checkpoints. Bits values may be included in the returned object.
+    """
+    return None
+
+  #-----------------------------------------------------------------------
+  # restore_state
+  #-----------------------------------------------------------------------
+  def restore_state( self, state ):
+    """Restores Python-side Model state from an object previously
+    returned by checkpoint_state().
+    """
+    pass
+
+  #-----------------------------------------------------------------------
+  # idle
+  #-----------------------------------------------------------------------
+  def idle( self, ncycles=None ):
+    """Declares that the sequential blocks of this Model have no activity
+    for the next ncycles cycles, or until one of the nets they read
+    changes if ncycles is None.
+
+    A sequential block may call this at the end of a cycle where the
+    values it wrote to .next did not change any net, if the blocks of
+    the Model would not change any net either (or do anything else
+    visible outside of the Model) during the next ncycles cycles as long
+    as their inputs do not change. When every Model of the design is
+    idle, ``SimulationTool.run( skip_idle=True )`` advances the cycle
+    count in a single step instead of simulating these cycles. The
+    declaration only holds for the current cycle.
+
+    >>> if s.counter > 0 and not in_go:
+    >>>   s.idle( s.counter - 1 )
+    """
+    self._idle = float( 'inf' ) if ncycles is None else ncycles
+
+  #-----------------------------------------------------------------------
+  # skip_cycles
+  #-----------------------------------------------------------------------
+  def skip_cycles( self, ncycles ):
+    """Called by the simulator when it skipped ncycles cycles while this
+    Model was idle (see idle()).
+
+    Model subclasses which count cycles in Python attributes should
+    implement this method to advance them as if the skipped cycles had
+    been simulated.
+    """
+    pass
+
   #---------------------------------------------------------------------
   # elaborate_logic
   #---------------------------------------------------------------------
@@ -558,17 +652,28 @@ class Model( object ):
   #---------------------------------------------------------------------
   # _check_type
   #---------------------------------------------------------------------
-  def _check_type( self, current_model, name, obj, nested=False ):
-    """Specialize elaboration actions based on object type."""
+  def _check_type( self, current_model, name, obj, nested=False,
+                   path=None ):
+    """Specialize elaboration actions based on object type.
+
+    The path of each signal relative to its parent model is recorded as
+    a tuple of attribute names and list indexes, so that tools can
+    access the signal without parsing its name.
+    """
+
+    if path is None:
+      path = ( name, )
 
     if   isinstance( obj, Wire ):
       obj.name              = name
       obj.parent            = current_model
+      obj._path             = path
       current_model._wires += [ obj ]
 
     elif isinstance( obj, InPort ):
       obj.name                = name
       obj.parent              = current_model
+      obj._path               = path
       current_model._inports += [ obj ]
       if not nested:
         current_model._hports  += [ obj ]
@@ -576,6 +681,7 @@ class Model( object ):
     elif isinstance( obj, OutPort ):
       obj.name                 = name
       obj.parent               = current_model
+      obj._path                = path
       current_model._outports += [ obj ]
       if not nested:
         current_model._hports  += [ obj ]
@@ -584,7 +690,8 @@ class Model( object ):
     elif isinstance( obj, PortBundle ):
       obj.name = name
       for port in obj.get_ports():
-        self._check_type(current_model, name+'.'+port.name, port, nested=True)
+        self._check_type(current_model, name+'.'+port.name, port, nested=True,
+                         path=path+(port.name,))
       if not nested:
         current_model._hports += [ obj ]
 
@@ -625,7 +732,8 @@ class Model( object ):
       # _check_type() utility function
       for i, item in enumerate(obj):
         item_name = "%s[%d]" % (name, i)
-        self._check_type( current_model, item_name, item, nested=True )
+        self._check_type( current_model, item_name, item, nested=True,
+                          path=path+(i,) )
 
   #---------------------------------------------------------------------
   # strify_keys
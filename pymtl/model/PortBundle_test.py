@@ -457,3 +457,43 @@ def test_portbundle_bitstruct_param_queue_sim( dump_vcd ):
 
   sim = TestVectorSimulator( model, test_vectors, tv_in, tv_out )
   sim.run_test()
+
+#-----------------------------------------------------------------------
+# Test Signal Paths
+#-----------------------------------------------------------------------
+# The path of each signal recorded during elaboration is used by the
+# simulator to replace signals with their values.
+
+class SignalPaths( Model ):
+
+  def __init__( s ):
+
+    s.in_  = InValRdyBundle( 8 )
+    s.out  = [ OutValRdyBundle( 8 ) for _ in range( 2 ) ]
+    s.wire = [ [ Wire( 4 ) for _ in range( 2 ) ] for _ in range( 2 ) ]
+
+    for i in range( 2 ):
+      s.connect( s.in_.msg, s.out[i].msg )
+      s.connect( s.in_.val, s.out[i].val )
+    s.connect( s.in_.rdy, s.out[0].rdy )
+
+def test_signal_paths():
+
+  m = SignalPaths()
+  m.elaborate()
+
+  assert m.in_.msg._path     == ( 'in_', 'msg' )
+  assert m.out[1].rdy._path  == ( 'out', 1, 'rdy' )
+  assert m.wire[1][0]._path  == ( 'wire', 1, 0 )
+  assert m.clk._path         == ( 'clk', )
+
+  sim = SimulationTool( m )
+  m.in_.msg.value = 0xab
+  m.out[0].rdy.value = 1
+  m.wire[1][0].value = 3
+  sim.eval_combinational()
+
+  assert m.out[0].msg == 0xab
+  assert m.out[1].msg == 0xab
+  assert m.in_.rdy    == 1
+  assert m.wire[1][0] == 3
@@ -42,6 +42,7 @@ class Signal( object ):
     self.connections   = []
 
     self._addr         = None
+    self._path         = None
     self._signal       = self
     self._signalvalue  = None
 
@@ -0,0 +1,1054 @@
+#=======================================================================
+# EnsembleSimulationTool.py
+#=======================================================================
+# Tool for simulating many stimulus variants of one hardware model at
+# once.
+#
+# The model is elaborated only once. Every net is then stored as a NumPy
+# array with one lane per variant, and the @combinational, @tick and
+# @posedge_clk blocks of the design are recompiled so that each
+# statement operates on all lanes at the same time. Data-dependent if
+# statements are executed under a lane mask: both branches run, but each
+# one only writes the lanes where its condition holds.
+#
+# Only the translatable subset of PyMTL is supported: nets must be Bits
+# or BitStructs of at most 64 bits, and blocks cannot use while loops,
+# early returns or exceptions.
+#
+# Requires NumPy.
+
+from __future__ import print_function
+
+import ast
+import collections
+import copy
+import time
+
+import numpy as np
+
+import sim_utils as sim
+
+from SimulationTool                 import SimulationTool, RunStats
+from pymtl.datatypes.Bits           import Bits
+from pymtl.datatypes.SignalValue    import SignalValue
+from pymtl.model.Model              import Model
+from pymtl.model.PortBundle         import PortBundle
+from pymtl.tools.ast_helpers        import get_method_ast
+
+_MAX_NBITS = 64
+_MASK64    = ( 1 << 64 ) - 1
+
+#-----------------------------------------------------------------------
+# EnsembleError
+#-----------------------------------------------------------------------
+class EnsembleError( Exception ):
+  def __init__( self, message, lineno=None ):
+    super( EnsembleError, self ).__init__( message )
+    self.lineno = lineno
+
+#-----------------------------------------------------------------------
+# EnsembleSimulationTool
+#-----------------------------------------------------------------------
+# User visible class implementing a tool for simulating nlanes copies of
+# a hardware model in lockstep.
+#
+# Stimulus is written and results are read as arrays with one element
+# per lane, either by indexing the tool with a signal of the model:
+#
+#   sim = EnsembleSimulationTool( model, 1000 )
+#   sim[ model.in_ ] = numpy.random.randint( 0, 256, 1000 )
+#   sim.cycle()
+#   print( sim[ model.out ] )
+#
+# or through sim.top, which mirrors the model hierarchy:
+#
+#   sim.top.in_.value = 5
+#
+# Lanes finish independently with run( until=... ), after which their
+# state is frozen and the cycle they finished on is in done_cycle.
+class EnsembleSimulationTool( object ):
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  def __init__( self, model, nlanes ):
+
+    if nlanes < 1:
+      raise ValueError( "an ensemble needs at least one lane!" )
+
+    # Elaborate the design with the scalar simulator, which creates one
+    # SignalValue per net and finds the nets each block writes.
+
+    self._sim       = SimulationTool( model, static_schedule=True )
+
+    self.model      = model
+    self.nlanes     = nlanes
+    self.ncycles    = 0
+    self.done       = np.zeros( nlanes, dtype=bool )
+    self.done_cycle = np.full ( nlanes, -1, dtype=np.int64 )
+
+    self._lanes     = {}
+    self._views     = {}
+    self._next      = {}
+    self._base      = None
+    self._mask      = None
+    self._stack     = []
+    self._index     = np.arange( nlanes )
+
+    for net in self._sim._nets:
+      self._create_lanes( iter( net ).next()._signalvalue )
+
+    self.top = self._view( model )
+
+    # Recompile all blocks to operate on lanes
+
+    self._tick_blocks = [ self._compile_block( func )
+                          for func in _get_tick_blocks( model ) ]
+
+    self._eval_order  = self._create_eval_order()
+
+  #---------------------------------------------------------------------
+  # __getitem__
+  #---------------------------------------------------------------------
+  # Returns a copy of the value of a signal in every lane.
+  def __getitem__( self, signal ):
+    return self._get_lanes( signal ).lanes.copy()
+
+  #---------------------------------------------------------------------
+  # __setitem__
+  #---------------------------------------------------------------------
+  # Writes a signal in every lane, from a scalar or an array of values.
+  def __setitem__( self, signal, values ):
+    lanes = self._get_lanes( signal )
+    lanes.lanes[:] = np.asarray( values, dtype=np.uint64 ) & lanes._mask
+
+  #---------------------------------------------------------------------
+  # reset
+  #---------------------------------------------------------------------
+  # Sets the reset signal high in every lane and cycles the simulator.
+  def reset( self ):
+    self[ self.model.reset ] = 1
+    self.cycle()
+    self.cycle()
+    self[ self.model.reset ] = 0
+
+  #---------------------------------------------------------------------
+  # eval_combinational
+  #---------------------------------------------------------------------
+  # Evaluates all @combinational blocks and slice connections, in
+  # dependency order, in every lane.
+  def eval_combinational( self ):
+    for func in self._eval_order:
+      func()
+
+  #---------------------------------------------------------------------
+  # cycle
+  #---------------------------------------------------------------------
+  # Advances every lane which is not done by a single clock cycle.
+  def cycle( self ):
+
+    self.eval_combinational()
+
+    for func in self._tick_blocks:
+      func()
+
+    for lanes, next_lanes in self._next.values():
+      lanes.lanes[:] = next_lanes
+    self._next.clear()
+
+    self.eval_combinational()
+    self.ncycles += 1
+
+  #---------------------------------------------------------------------
+  # run
+  #---------------------------------------------------------------------
+  # Advances the simulator by multiple clock cycles, like
+  # SimulationTool.run(). The until predicate is either a signal of the
+  # model or a callable, and is evaluated per lane: lanes where it is
+  # true are marked as done before the next cycle and are frozen from
+  # then on. The simulation stops after ncycles cycles or once all lanes
+  # are done.
+  def run( self, ncycles=None, until=None ):
+
+    if ncycles is None and until is None:
+      raise ValueError( "run() needs either ncycles or an until predicate!" )
+
+    start_cycle = self.ncycles
+    start_time  = time.time()
+
+    remaining = ncycles if ncycles is not None else float( 'inf' )
+
+    while remaining > 0:
+
+      if until is not None:
+        self._update_done( until )
+        if self.done.all():
+          break
+
+      self.cycle()
+      remaining -= 1
+
+    seconds = time.time() - start_time
+    cycles  = self.ncycles - start_cycle
+
+    return RunStats( cycles, seconds, cycles / seconds if seconds else 0.0 )
+
+  #---------------------------------------------------------------------
+  # _update_done
+  #---------------------------------------------------------------------
+  def _update_done( self, until ):
+
+    # Note: check for signals first since Bits are callable
+
+    if isinstance( until, ( SignalValue, _Vec ) ):
+      value = self._get_lanes( until )
+    else:
+      value = until()
+
+    new = _truth( value ) & ~self.done
+    if isinstance( new, np.ndarray ) and new.any():
+      self.done      |= new
+      self.done_cycle[ new ] = self.ncycles
+      self._base = self._mask = ~self.done
+
+  #---------------------------------------------------------------------
+  # _get_lanes
+  #---------------------------------------------------------------------
+  def _get_lanes( self, signal ):
+    if isinstance( signal, _NetLanes ):
+      return signal
+    try:
+      return self._lanes[ id( signal ) ]
+    except KeyError:
+      raise KeyError( "{} is not a signal of the simulated model"
+                      .format( signal ) )
+
+  #---------------------------------------------------------------------
+  # _create_lanes
+  #---------------------------------------------------------------------
+  def _create_lanes( self, signal_value ):
+
+    if not isinstance( signal_value, Bits ):
+      raise EnsembleError( "cannot simulate nets of type {}, only Bits "
+                           "and BitStructs are supported"
+                           .format( type( signal_value ).__name__ ) )
+    if signal_value.nbits > _MAX_NBITS:
+      raise EnsembleError( "cannot simulate nets wider than {} bits"
+                           .format( _MAX_NBITS ) )
+
+    lanes = _NetLanes( self, signal_value )
+    self._lanes[ id( signal_value ) ] = lanes
+
+  #---------------------------------------------------------------------
+  # _view
+  #---------------------------------------------------------------------
+  # Returns the lane view of an object reachable from the model: nets are
+  # replaced by their lanes, models and bundles by views, and lists by
+  # lists of views which also support per-lane indexing.
+  def _view( self, obj ):
+
+    if isinstance( obj, SignalValue ):
+      try:
+        return self._lanes[ id( obj ) ]
+      except KeyError:
+        return obj
+
+    if isinstance( obj, ( Model, PortBundle ) ):
+      try:
+        return self._views[ id( obj ) ]
+      except KeyError:
+        view = self._views[ id( obj ) ] = _ModelView( self, obj )
+        return view
+
+    if isinstance( obj, list ):
+      return _LanesList( self, [ self._view( x ) for x in obj ] )
+
+    return obj
+
+  #---------------------------------------------------------------------
+  # _compile_block
+  #---------------------------------------------------------------------
+  # Recompiles a block so that it operates on lanes. Free variables of
+  # the block (usually the model s) are replaced by their views.
+  def _compile_block( self, func ):
+
+    tree, _ = get_method_ast( func )
+    tree    = copy.deepcopy( tree )
+
+    funcdef = tree.body[0]
+    funcdef.decorator_list = []
+
+    _VectorizeBlock( func ).visit( funcdef )
+
+    freevars = func.func_code.co_freevars
+    closure  = func.func_closure or ()
+
+    factory = ast.FunctionDef(
+      name = '_create_block',
+      args = ast.arguments(
+        args     = [ ast.Name( id=x, ctx=ast.Param() ) for x in freevars ],
+        vararg   = None,
+        kwarg    = None,
+        defaults = [],
+      ),
+      body = [
+        funcdef,
+        ast.Return( value=ast.Name( id=funcdef.name, ctx=ast.Load() ) ),
+      ],
+      decorator_list = [],
+    )
+
+    module = ast.Module( body=[ factory ] )
+    ast.fix_missing_locations( module )
+    ast.increment_lineno( module, func.func_code.co_firstlineno - 1 )
+
+    scope = dict( func.func_globals )
+    scope.update( _ens=self, concat=_concat )
+
+    exec( compile( module, func.func_code.co_filename, 'exec' ) ) in scope
+
+    values = [ self._view( cell.cell_contents ) for cell in closure ]
+    return scope[ '_create_block' ]( *values )
+
+  #---------------------------------------------------------------------
+  # _create_eval_order
+  #---------------------------------------------------------------------
+  # Levelizes @combinational blocks and slice connections. Blocks in a
+  # combinational loop are evaluated repeatedly until the nets they
+  # write settle.
+  def _create_eval_order( self ):
+
+    comb_writes = self._sim._comb_writes
+
+    nodes  = []
+    reads  = {}
+    writes = {}
+
+    for m, func in _get_comb_blocks( self.model ):
+      if comb_writes.get( func ) is None:
+        raise EnsembleError( "cannot determine the signals written by "
+                             "@combinational block {}".format( func.__name__ ) )
+      node = self._compile_block( func )
+      nodes.append( node )
+      reads [ node ] = [ id( x ) for x in m._newsenses.get( func, [] ) ]
+      writes[ node ] = [ id( x ) for x in comb_writes[ func ] ]
+
+    for src, conns in self._group_slices():
+      node = self._create_slice_node( src, conns )
+      nodes.append( node )
+      reads [ node ] = [ id( src ) ]
+      writes[ node ] = [ id( c.dest_node._signalvalue ) for c in conns ]
+
+    readers = {}
+    for node in nodes:
+      for net_id in reads[ node ]:
+        lst = readers.setdefault( net_id, [] )
+        if node not in lst:
+          lst.append( node )
+
+    succs = {}
+    for node in nodes:
+      succs[ node ] = lst = []
+      for net_id in writes[ node ]:
+        for reader in readers.get( net_id, [] ):
+          if reader is not node and reader not in lst:
+            lst.append( reader )
+
+    order = []
+    for scc in sim._topo_sort_sccs( nodes, succs ):
+      if len( scc ) == 1:
+        order.append( scc[0] )
+      else:
+        nets = set( x for node in scc for x in writes[ node ] )
+        order.append( self._create_loop_node(
+          scc, [ self._lanes[ x ] for x in nets if x in self._lanes ] ) )
+
+    return order
+
+  #---------------------------------------------------------------------
+  # _group_slices
+  #---------------------------------------------------------------------
+  # Returns the slice connections grouped by source net. Slices of
+  # constants were already written by the scalar simulator, so they are
+  # part of the initial value of the lanes.
+  def _group_slices( self ):
+
+    groups = collections.OrderedDict()
+    for c in self._sim._slice_connects:
+      src = c.src_node._signalvalue
+      if not isinstance( src, int ):
+        groups.setdefault( id( src ), ( src, [] ) )[1].append( c )
+
+    return groups.values()
+
+  #---------------------------------------------------------------------
+  # _create_slice_node
+  #---------------------------------------------------------------------
+  def _create_slice_node( self, src, conns ):
+
+    src   = self._lanes[ id( src ) ]
+    parts = []
+
+    for c in conns:
+      dest = self._lanes[ id( c.dest_node._signalvalue ) ]
+      src_start,  _ = sim._slice_range( c.src_slice,  src.nbits  )
+      dest_start, _ = sim._slice_range( c.dest_slice, dest.nbits )
+      parts.append( ( dest.lanes,
+                      np.uint64( src_start ),
+                      np.uint64( ( 1 << c.nbits ) - 1 ),
+                      np.uint64( dest_start ),
+                      _keep_mask( c, dest ) ) )
+
+    def slice_node():
+      value = src.lanes
+      for dest, src_start, mask, dest_start, keep in parts:
+        dest[:] = ( value >> src_start & mask ) << dest_start | dest & keep
+
+    return slice_node
+
+  #---------------------------------------------------------------------
+  # _create_loop_node
+  #---------------------------------------------------------------------
+  def _create_loop_node( self, blocks, nets, max_iterations=1000 ):
+
+    def loop_node():
+      for i in xrange( max_iterations ):
+        before = [ x.lanes.copy() for x in nets ]
+        for func in blocks:
+          func()
+        if all( np.array_equal( x, y.lanes ) for x, y in zip( before, nets ) ):
+          return
+      raise EnsembleError( "combinational loop did not settle after {} "
+                           "iterations".format( max_iterations ) )
+
+    return loop_node
+
+  #---------------------------------------------------------------------
+  # Lane masks
+  #---------------------------------------------------------------------
+  # The methods below are called by the recompiled blocks. An if
+  # statement pushes the mask of the lanes executing its body, flips it
+  # to the lanes executing the else branch, and pops it at the end. The
+  # mask is None when all lanes are active.
+
+  def push( self, cond ):
+    parent = self._mask
+    cond   = _truth( cond )
+    self._stack.append( ( parent, cond ) )
+    if cond is True or cond is False:
+      return cond
+    self._mask = mask = cond if parent is None else parent & cond
+    return mask.any()
+
+  def flip( self ):
+    parent, cond = self._stack[-1]
+    if cond is True or cond is False:
+      self._mask = parent
+      return not cond
+    self._mask = mask = ~cond if parent is None else parent & ~cond
+    return mask.any()
+
+  def pop( self ):
+    self._mask = self._stack.pop()[0]
+
+  #---------------------------------------------------------------------
+  # write
+  #---------------------------------------------------------------------
+  # Writes a value to the active lanes of an array.
+  def write( self, lanes, value, mask ):
+    value = _operand( value )[0] & mask
+    if self._mask is None:
+      lanes[:] = value
+    else:
+      np.copyto( lanes, value, where=self._mask )
+
+  #---------------------------------------------------------------------
+  # next_lanes
+  #---------------------------------------------------------------------
+  # Returns the array holding the next value of a net, which is copied
+  # to the net at the end of the cycle.
+  def next_lanes( self, net ):
+    try:
+      return self._next[ id( net ) ][1]
+    except KeyError:
+      next_lanes = net.lanes.copy()
+      self._next[ id( net ) ] = ( net, next_lanes )
+      return next_lanes
+
+  #---------------------------------------------------------------------
+  # merge
+  #---------------------------------------------------------------------
+  # Merges the value assigned to a local variable under a mask with its
+  # previous value.
+  def merge( self, new, old ):
+    if self._mask is None or old is None or new is old:
+      return new
+    x, xn = _operand( new )
+    y, yn = _operand( old )
+    return _Vec( max( xn, yn ), np.where( self._mask, x, y ) )
+
+  #---------------------------------------------------------------------
+  # mux
+  #---------------------------------------------------------------------
+  # Implements conditional expressions ( x if cond else y ).
+  def mux( self, cond, x, y ):
+    cond = _truth( cond )
+    if cond is True:  return x
+    if cond is False: return y
+    x, xn = _operand( x )
+    y, yn = _operand( y )
+    return _Vec( max( xn, yn ), np.where( cond, x, y ) )
+
+  #---------------------------------------------------------------------
+  # land, lor, lnot
+  #---------------------------------------------------------------------
+  # Implement the and, or and not operators, which Python does not allow
+  # to overload.
+
+  def land( self, *args ):
+    x = args[0]
+    for y in args[1:]:
+      x = self.mux( _truth( x ), y, x )
+    return x
+
+  def lor( self, *args ):
+    x = args[0]
+    for y in args[1:]:
+      x = self.mux( _truth( x ), x, y )
+    return x
+
+  def lnot( self, x ):
+    cond = _truth( x )
+    if cond is True or cond is False:
+      return not cond
+    return _Vec( 1, ( ~cond ).astype( np.uint64 ) )
+
+  #---------------------------------------------------------------------
+  # check
+  #---------------------------------------------------------------------
+  # Implements assert statements, which must hold in all active lanes.
+  def check( self, cond, msg=None ):
+    cond = _truth( cond )
+    if cond is True or cond is False:
+      ok = cond
+    else:
+      ok = cond.all() if self._mask is None else cond[ self._mask ].all()
+    if not ok:
+      raise AssertionError( msg ) if msg is not None else AssertionError()
+
+  #---------------------------------------------------------------------
+  # gather
+  #---------------------------------------------------------------------
+  # Reads a list element selected by a different index in each lane.
+  def gather( self, items, index ):
+    values = [ _operand( x ) for x in items ]
+    nbits  = max( xn for _, xn in values )
+    table  = np.empty( ( len( items ), self.nlanes ), dtype=np.uint64 )
+    for row, ( x, _ ) in zip( table, values ):
+      row[:] = x
+    index  = np.minimum( index.lanes, np.uint64( len( items ) - 1 ) )
+    return _Vec( nbits, table[ index, self._index ] )
+
+#-----------------------------------------------------------------------
+# _Vec
+#-----------------------------------------------------------------------
+# Value of an nbits wide expression in every lane. Operators follow the
+# width rules of Bits.
+class _Vec( object ):
+
+  def __init__( self, nbits, lanes ):
+    self.nbits = nbits
+    self.lanes = lanes
+
+  def __repr__( self ):
+    return "Lanes({}, {})".format( self.nbits, self.lanes )
+
+  def __nonzero__( self ):
+    raise EnsembleError( "the truth value of a signal differs between "
+                         "lanes, use an if statement instead" )
+
+  def uint( self ):
+    return self
+
+  # Arithmetic and logic operators
+
+  def __invert__( self ):
+    return _Vec( self.nbits, ~self.lanes & _nbits_mask( self.nbits ) )
+
+  def __add__( self, other ): return _binop( self, other, np.add,      1 )
+  def __sub__( self, other ): return _binop( self, other, np.subtract, 1 )
+  def __mul__( self, other ): return _binop( self, other, np.multiply, 2 )
+  def __and__( self, other ): return _binop( self, other, np.bitwise_and, 1 )
+  def __or__ ( self, other ): return _binop( self, other, np.bitwise_or,  1 )
+  def __xor__( self, other ): return _binop( self, other, np.bitwise_xor, 1 )
+
+  def __div__( self, other ):
+    with np.errstate( divide='ignore' ):
+      return _binop( self, other, np.floor_divide, 2 )
+
+  __floordiv__ = __div__
+
+  def __mod__( self, other ):
+    with np.errstate( divide='ignore' ):
+      return _binop( self, other, np.remainder, 2 )
+
+  def __radd__( self, other ): return _binop( self, other, np.add,      1 )
+  def __rmul__( self, other ): return _binop( self, other, np.multiply, 2 )
+  def __rand__( self, other ): return _binop( self, other, np.bitwise_and, 1 )
+  def __ror__ ( self, other ): return _binop( self, other, np.bitwise_or,  1 )
+  def __rxor__( self, other ): return _binop( self, other, np.bitwise_xor, 1 )
+
+  def __rsub__( self, other ):
+    return _binop( _Vec( max( _const_nbits( other ), self.nbits ),
+                         _operand( other )[0] ), self, np.subtract, 1 )
+
+  def __lshift__( self, other ):
+    y = _operand( other )[0]
+    return _Vec( self.nbits,
+                 np.where( y >= self.nbits, np.uint64( 0 ),
+                           self.lanes << ( y & np.uint64( 63 ) ) )
+                 & _nbits_mask( self.nbits ) )
+
+  def __rshift__( self, other ):
+    y = _operand( other )[0]
+    return _Vec( self.nbits,
+                 np.where( y >= self.nbits, np.uint64( 0 ),
+                           self.lanes >> ( y & np.uint64( 63 ) ) ) )
+
+  # Comparison operators
+
+  def __eq__( self, other ): return _compare( self, other, np.equal )
+  def __ne__( self, other ): return _compare( self, other, np.not_equal )
+  def __lt__( self, other ): return _compare( self, other, np.less )
+  def __le__( self, other ): return _compare( self, other, np.less_equal )
+  def __gt__( self, other ): return _compare( self, other, np.greater )
+  def __ge__( self, other ): return _compare( self, other, np.greater_equal )
+
+  __hash__ = None
+
+  # Bit selection
+
+  def __getitem__( self, addr ):
+    start, nbits = _bit_range( self, addr )
+    return _Vec( nbits, self.lanes >> start & _nbits_mask( nbits ) )
+
+  # Extension
+
+  def _zext( self, new_width ):
+    return _Vec( new_width, self.lanes )
+
+  def _sext( self, new_width ):
+    ext  = _nbits_mask( new_width ) & ~_nbits_mask( self.nbits )
+    sign = self.lanes >> np.uint64( self.nbits - 1 ) & np.uint64( 1 )
+    return _Vec( new_width, self.lanes | ext * sign )
+
+#-----------------------------------------------------------------------
+# _NetLanes
+#-----------------------------------------------------------------------
+# Value of a net in every lane. Writes through .value and .next only
+# update the lanes active under the current mask.
+class _NetLanes( _Vec ):
+
+  def __init__( self, ens, signal_value ):
+    super( _NetLanes, self ).__init__(
+      signal_value.nbits,
+      np.full( ens.nlanes, signal_value.uint(), dtype=np.uint64 ) )
+    self.ens     = ens
+    self._mask   = _nbits_mask( self.nbits )
+    self._fields = getattr( signal_value, '_bitfields', {} )
+
+  def __getattr__( self, name ):
+    try:
+      return self[ self._fields[ name ] ]
+    except KeyError:
+      raise AttributeError( name )
+
+  @property
+  def value( self ):
+    return self
+  @value.setter
+  def value( self, value ):
+    self.ens.write( self.lanes, value, self._mask )
+
+  @property
+  def next( self ):
+    return _NextLanes( self )
+  @next.setter
+  def next( self, value ):
+    self.ens.write( self.ens.next_lanes( self ), value, self._mask )
+
+  v = value
+  n = next
+
+  def __getitem__( self, addr ):
+    return _SliceLanes( self, addr )
+
+  def __setitem__( self, addr, value ):
+    _write_bits( self, self.lanes, addr, value )
+
+#-----------------------------------------------------------------------
+# _NextLanes
+#-----------------------------------------------------------------------
+# Next value of a net, to support writes such as s.out.next[0:4] = x.
+class _NextLanes( _Vec ):
+
+  def __init__( self, net ):
+    self.net = net
+    super( _NextLanes, self ).__init__( net.nbits,
+                                        net.ens.next_lanes( net ) )
+
+  def __setitem__( self, addr, value ):
+    _write_bits( self.net, self.lanes, addr, value )
+
+#-----------------------------------------------------------------------
+# _SliceLanes
+#-----------------------------------------------------------------------
+# A bit range of a net, or of a BitStruct field, which can be written.
+class _SliceLanes( _Vec ):
+
+  def __init__( self, net, addr ):
+    self.net     = net
+    self.addr    = addr
+    start, nbits = _bit_range( net, addr )
+    super( _SliceLanes, self ).__init__(
+      nbits, net.lanes >> start & _nbits_mask( nbits ) )
+
+  @property
+  def value( self ):
+    return self
+  @value.setter
+  def value( self, value ):
+    _write_bits( self.net, self.net.lanes, self.addr, value )
+
+  @property
+  def next( self ):
+    return self
+  @next.setter
+  def next( self, value ):
+    net = self.net
+    _write_bits( net, net.ens.next_lanes( net ), self.addr, value )
+
+  v = value
+  n = next
+
+#-----------------------------------------------------------------------
+# _GatherLanes
+#-----------------------------------------------------------------------
+# List element selected by a different index in each lane. Writes go to
+# the element selected in each active lane.
+class _GatherLanes( _Vec ):
+
+  def __init__( self, ens, items, index ):
+    vec = ens.gather( items, index )
+    super( _GatherLanes, self ).__init__( vec.nbits, vec.lanes )
+    self.ens   = ens
+    self.items = items
+    self.index = index
+
+  def _scatter( self, attr, value ):
+    ens = self.ens
+    for i, item in enumerate( self.items ):
+      if ens.push( self.index == i ):
+        setattr( item, attr, value )
+      ens.pop()
+
+  @property
+  def value( self ):
+    return self
+  @value.setter
+  def value( self, value ):
+    self._scatter( 'value', value )
+
+  @property
+  def next( self ):
+    return self
+  @next.setter
+  def next( self, value ):
+    self._scatter( 'next', value )
+
+  v = value
+  n = next
+
+#-----------------------------------------------------------------------
+# _LanesList
+#-----------------------------------------------------------------------
+# List of views which can also be indexed by a per-lane value.
+class _LanesList( list ):
+
+  def __init__( self, ens, items ):
+    super( _LanesList, self ).__init__( items )
+    self.ens = ens
+
+  def __getitem__( self, index ):
+    if isinstance( index, _Vec ):
+      return _GatherLanes( self.ens, self, index )
+    return list.__getitem__( self, index )
+
+#-----------------------------------------------------------------------
+# _ModelView
+#-----------------------------------------------------------------------
+# Mirror of a model (or port bundle) whose signals are replaced by their
+# lanes. Other attributes are forwarded to the model.
+class _ModelView( object ):
+
+  def __init__( self, ens, model ):
+    self.__dict__[ '_ens'   ] = ens
+    self.__dict__[ '_model' ] = model
+
+  def __getattr__( self, name ):
+    value = self._ens._view( getattr( self._model, name ) )
+    if isinstance( value, ( _Vec, _ModelView, _LanesList ) ):
+      self.__dict__[ name ] = value
+    return value
+
+  def __setattr__( self, name, value ):
+    setattr( self._model, name, value )
+
+#-----------------------------------------------------------------------
+# _VectorizeBlock
+#-----------------------------------------------------------------------
+# Rewrites the AST of a block so that it can execute on all lanes:
+#
+# - if statements push a lane mask for each branch
+# - and, or, not and conditional expressions call lane-aware functions
+# - locals assigned under a mask are merged with their previous value
+# - assert statements check all active lanes
+#
+# Constructs which cannot be executed under a mask are rejected.
+class _VectorizeBlock( ast.NodeTransformer ):
+
+  def __init__( self, func ):
+    self.func   = func
+    self.depth  = 0
+    self.merged = []
+    self.nested = False
+
+  def error( self, node, msg ):
+    raise EnsembleError( "{} in block {} is not supported by the "
+                         "ensemble simulator".format( msg, self.func.__name__ ),
+                         getattr( node, 'lineno', None ) )
+
+  def visit_FunctionDef( self, node ):
+    if self.nested:
+      self.error( node, 'nested function definition' )
+    self.nested = True
+    self.generic_visit( node )
+    # Locals merged under a mask need a previous value
+    init = [ ast.Assign( targets=[ ast.Name( id=x, ctx=ast.Store() ) ],
+                         value=ast.Name( id='None', ctx=ast.Load() ) )
+             for x in self.merged ]
+    node.body = init + node.body
+    return node
+
+  def visit_If( self, node ):
+    test = self.visit( node.test )
+    self.depth += 1
+    body   = [ self.visit( x ) for x in node.body   ]
+    orelse = [ self.visit( x ) for x in node.orelse ]
+    self.depth -= 1
+
+    stmts = [ ast.If( test=_call( 'push', test ), body=_flatten( body ),
+                      orelse=[] ) ]
+    if orelse:
+      stmts.append( ast.If( test=_call( 'flip' ), body=_flatten( orelse ),
+                            orelse=[] ) )
+    stmts.append( ast.Expr( value=_call( 'pop' ) ) )
+    return [ ast.copy_location( x, node ) for x in stmts ]
+
+  def visit_Assign( self, node ):
+    self.generic_visit( node )
+    if self.depth:
+      for target in node.targets:
+        if isinstance( target, ast.Name ):
+          node.value = self.merge( target.id, node.value )
+        elif not isinstance( target, ( ast.Attribute, ast.Subscript ) ):
+          self.error( node, 'unpacking assignment under a condition' )
+    return node
+
+  def visit_AugAssign( self, node ):
+    self.generic_visit( node )
+    if self.depth and isinstance( node.target, ast.Name ):
+      name  = node.target.id
+      value = ast.BinOp( left=ast.Name( id=name, ctx=ast.Load() ),
+                         op=node.op, right=node.value )
+      return ast.copy_location(
+        ast.Assign( targets=[ node.target ],
+                    value=self.merge( name, value ) ), node )
+    return node
+
+  def merge( self, name, value ):
+    if name not in self.merged:
+      self.merged.append( name )
+    return _call( 'merge', value, ast.Name( id=name, ctx=ast.Load() ) )
+
+  def visit_BoolOp( self, node ):
+    self.generic_visit( node )
+    op = 'land' if isinstance( node.op, ast.And ) else 'lor'
+    return ast.copy_location( _call( op, *node.values ), node )
+
+  def visit_UnaryOp( self, node ):
+    self.generic_visit( node )
+    if isinstance( node.op, ast.Not ):
+      return ast.copy_location( _call( 'lnot', node.operand ), node )
+    return node
+
+  def visit_IfExp( self, node ):
+    self.generic_visit( node )
+    return ast.copy_location(
+      _call( 'mux', node.test, node.body, node.orelse ), node )
+
+  def visit_Compare( self, node ):
+    self.generic_visit( node )
+    if len( node.ops ) == 1:
+      return node
+    operands = [ node.left ] + node.comparators
+    pairs    = [ ast.Compare( left=x, ops=[ op ], comparators=[ y ] )
+                 for x, op, y in zip( operands, node.ops, operands[1:] ) ]
+    return ast.copy_location( _call( 'land', *pairs ), node )
+
+  def visit_Assert( self, node ):
+    self.generic_visit( node )
+    args = [ node.test ] + ( [ node.msg ] if node.msg else [] )
+    return ast.copy_location( ast.Expr( value=_call( 'check', *args ) ),
+                              node )
+
+  def visit_While( self, node ):
+    self.error( node, 'while loop' )
+
+  def visit_TryExcept( self, node ):
+    self.error( node, 'exception handling' )
+
+  visit_TryFinally = visit_TryExcept
+
+  def visit_With( self, node ):
+    self.error( node, 'with statement' )
+
+  def visit_Yield( self, node ):
+    self.error( node, 'yield' )
+
+  def visit_Return( self, node ):
+    if self.depth: self.error( node, 'return under a condition' )
+    return node
+
+  def visit_Break( self, node ):
+    if self.depth: self.error( node, 'break under a condition' )
+    return node
+
+  visit_Continue = visit_Break
+
+  def visit_Raise( self, node ):
+    if self.depth: self.error( node, 'raise under a condition' )
+    return node
+
+#-----------------------------------------------------------------------
+# Helpers
+#-----------------------------------------------------------------------
+
+def _call( name, *args ):
+  return ast.Call( func=ast.Attribute( value=ast.Name( id='_ens',
+                                                       ctx=ast.Load() ),
+                                       attr=name, ctx=ast.Load() ),
+                   args=list( args ), keywords=[],
+                   starargs=None, kwargs=None )
+
+def _flatten( stmts ):
+  flat = []
+  for x in stmts:
+    flat.extend( x if isinstance( x, list ) else [ x ] )
+  return flat
+
+def _nbits_mask( nbits ):
+  return np.uint64( ( 1 << nbits ) - 1 )
+
+def _const_nbits( value ):
+  return max( int( value ).bit_length(), 1 )
+
+# Returns the lanes (or scalar) and the bit width of an operand.
+def _operand( x ):
+  if isinstance( x, _Vec ):
+    return x.lanes, x.nbits
+  if isinstance( x, Bits ):
+    return np.uint64( x.uint() ), x.nbits
+  if isinstance( x, np.ndarray ):
+    return x.astype( np.uint64 ), _MAX_NBITS
+  return np.uint64( int( x ) & _MASK64 ), _const_nbits( x )
+
+# Returns a bool array with the truth value in every lane, or a bool if
+# the value is the same in all lanes.
+def _truth( x ):
+  if isinstance( x, _Vec ):
+    return x.lanes != 0
+  if isinstance( x, np.ndarray ):
+    return x != 0
+  return bool( x )
+
+def _binop( x, y, op, scale ):
+  nbits = x.nbits if not isinstance( y, ( _Vec, Bits ) ) else \
+          max( x.nbits, y.nbits )
+  nbits = min( scale * nbits, _MAX_NBITS )
+  return _Vec( nbits, op( x.lanes, _operand( y )[0] ) & _nbits_mask( nbits ) )
+
+def _compare( x, y, op ):
+  return _Vec( 1, op( x.lanes, _operand( y )[0] ).astype( np.uint64 ) )
+
+# Returns the first bit and width of an index or slice of a value.
+def _bit_range( x, addr ):
+  if isinstance( addr, slice ):
+    if addr.step:
+      raise IndexError( 'Bits slicing using steps [start:stop:step] '
+                        'is not supported' )
+    start = 0       if addr.start is None else int( addr.start )
+    stop  = x.nbits if addr.stop  is None else int( addr.stop  )
+    if not ( 0 <= start < stop <= x.nbits ):
+      raise IndexError( 'Bits slice indices [{}:{}] out of range [0 - {}]'
+                        .format( start, stop, x.nbits ) )
+    return np.uint64( start ), stop - start
+  if isinstance( addr, _Vec ):
+    return addr.lanes, 1
+  if not ( 0 <= int( addr ) < x.nbits ):
+    raise IndexError( 'Bits index [{}] out of range [0 - {}]'
+                      .format( addr, x.nbits ) )
+  return np.uint64( addr ), 1
+
+# Writes a bit range of the active lanes of an array.
+def _write_bits( net, lanes, addr, value ):
+  start, nbits = _bit_range( net, addr )
+  mask  = _nbits_mask( nbits )
+  value = ( _operand( value )[0] & mask ) << start
+  net.ens.write( lanes, lanes & ~( mask << start ) | value, net._mask )
+
+def _keep_mask( c, dest ):
+  start, _ = sim._slice_range( c.dest_slice, dest.nbits )
+  return dest._mask & ~np.uint64( ( ( 1 << c.nbits ) - 1 ) << start )
+
+# Lane-aware version of concat(), which replaces the Bits version in the
+# recompiled blocks.
+def _concat( *args ):
+  nbits = sum( _operand( x )[1] for x in args )
+  value = np.uint64( 0 )
+  for x in args:
+    lanes, xn = _operand( x )
+    value = value << np.uint64( xn ) | lanes
+  return _Vec( nbits, value )
+
+def _get_models( model ):
+  models = [ model ]
+  for m in model.get_submodules():
+    models.extend( _get_models( m ) )
+  return models
+
+def _get_tick_blocks( model ):
+  blocks = []
+  for m in _get_models( model ):
+    for func in m.get_tick_blocks() + m.get_posedge_clk_blocks():
+      decorators = sim._get_block_info( func ).decorators
+      if 'tick_fl' in decorators or 'tick_cl' in decorators:
+        raise EnsembleError( "cannot simulate FL/CL block {}, only "
+                             "translatable blocks are supported"
+                             .format( func.__name__ ) )
+      blocks.append( func )
+  return blocks
+
+def _get_comb_blocks( model ):
+  return [ ( m, func ) for m in _get_models( model )
+                       for func in m.get_combinational_blocks() ]
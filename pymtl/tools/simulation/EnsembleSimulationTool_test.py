@@ -0,0 +1,200 @@
+#=======================================================================
+# EnsembleSimulationTool_test.py
+#=======================================================================
+
+import pytest
+
+np = pytest.importorskip( 'numpy' )
+
+from pymtl import *
+
+from EnsembleSimulationTool import EnsembleSimulationTool, EnsembleError
+from pclib.rtl.queues       import NormalQueue
+from pclib.rtl.RegisterFile import RegisterFile
+from pclib.rtl.arbiters     import RoundRobinArbiter
+
+#-----------------------------------------------------------------------
+# ensemble_tester
+#-----------------------------------------------------------------------
+# Simulates each lane of an ensemble with the scalar simulator and checks
+# the outputs match in every cycle. Inputs maps port names to arrays of
+# shape ( ncycles, nlanes ).
+
+def get_port( model, name ):
+  for attr in name.split( '.' ):
+    if attr.isdigit(): model = model[ int( attr ) ]
+    else:              model = getattr( model, attr )
+  return model
+
+def ensemble_tester( create_model, inputs, outputs, reset=True ):
+
+  ncycles, nlanes = inputs.values()[0].shape
+
+  model = create_model()
+  model.elaborate()
+  ens   = EnsembleSimulationTool( model, nlanes )
+  if reset:
+    ens.reset()
+
+  trace = []
+  for t in range( ncycles ):
+    for name, values in inputs.items():
+      ens[ get_port( model, name ) ] = values[t]
+    ens.eval_combinational()
+    trace.append( [ ens[ get_port( model, name ) ] for name in outputs ] )
+    ens.cycle()
+
+  for lane in range( nlanes ):
+    model = create_model()
+    model.elaborate()
+    sim   = SimulationTool( model )
+    if reset:
+      sim.reset()
+    for t in range( ncycles ):
+      for name, values in inputs.items():
+        get_port( model, name ).value = int( values[t][lane] )
+      sim.eval_combinational()
+      for name, values in zip( outputs, trace[t] ):
+        assert get_port( model, name ) == values[ lane ]
+      sim.cycle()
+
+#-----------------------------------------------------------------------
+# test_NormalQueue
+#-----------------------------------------------------------------------
+def test_NormalQueue():
+  rng = np.random.RandomState( 0 )
+  ensemble_tester(
+    lambda: NormalQueue( 4, 8 ),
+    { 'enq.val' : rng.randint( 0,   2, ( 40, 8 ) ),
+      'enq.msg' : rng.randint( 0, 256, ( 40, 8 ) ),
+      'deq.rdy' : rng.randint( 0,   2, ( 40, 8 ) ) },
+    [ 'enq.rdy', 'deq.val', 'deq.msg', 'num_free_entries' ],
+  )
+
+#-----------------------------------------------------------------------
+# test_RegisterFile
+#-----------------------------------------------------------------------
+# Each lane reads and writes a different register.
+def test_RegisterFile():
+  rng = np.random.RandomState( 1 )
+  ensemble_tester(
+    lambda: RegisterFile( dtype=8, nregs=8, const_zero=True ),
+    { 'rd_addr.0' : rng.randint( 0,   8, ( 30, 8 ) ),
+      'wr_addr'   : rng.randint( 0,   8, ( 30, 8 ) ),
+      'wr_data'   : rng.randint( 0, 256, ( 30, 8 ) ),
+      'wr_en'     : rng.randint( 0,   2, ( 30, 8 ) ) },
+    [ 'rd_data.0' ],
+    reset=False,
+  )
+
+#-----------------------------------------------------------------------
+# test_RoundRobinArbiter
+#-----------------------------------------------------------------------
+def test_RoundRobinArbiter():
+  rng = np.random.RandomState( 3 )
+  ensemble_tester(
+    lambda: RoundRobinArbiter( 4 ),
+    { 'reqs' : rng.randint( 0, 16, ( 30, 8 ) ) },
+    [ 'grants' ],
+  )
+
+#-----------------------------------------------------------------------
+# MaskedLogic
+#-----------------------------------------------------------------------
+class MaskedLogic( Model ):
+  def __init__( s ):
+    s.sel  = InPort ( 2 )
+    s.a    = InPort ( 8 )
+    s.b    = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.flag = OutPort( 1 )
+    s.acc  = OutPort( 8 )
+
+    @s.combinational
+    def comb():
+      tmp = s.a
+      if   s.sel == 0: tmp = s.a + s.b
+      elif s.sel == 1: tmp = s.a - s.b
+      elif s.sel == 2:
+        if s.a[7]: tmp = ~s.b
+        else:      tmp = s.b >> 2
+      s.out.value  = tmp
+      s.flag.value = not s.a and s.b[0] or ( s.sel == 3 )
+
+    @s.posedge_clk
+    def seq():
+      if s.reset:
+        s.acc.next = 0
+      else:
+        tmp = s.acc[0:4] + ( s.a if s.sel[0] else s.b )
+        s.acc.next = concat( s.sel, s.flag, s.sel[1], tmp[0:4] )
+
+def test_MaskedLogic():
+  rng = np.random.RandomState( 2 )
+  ensemble_tester(
+    MaskedLogic,
+    { 'sel' : rng.randint( 0,   4, ( 30, 16 ) ),
+      'a'   : rng.randint( 0, 256, ( 30, 16 ) ),
+      'b'   : rng.randint( 0, 256, ( 30, 16 ) ) },
+    [ 'out', 'flag', 'acc' ],
+  )
+
+#-----------------------------------------------------------------------
+# CountTo
+#-----------------------------------------------------------------------
+class CountTo( Model ):
+  def __init__( s ):
+    s.limit = InPort ( 8 )
+    s.count = OutPort( 8 )
+    s.done  = OutPort( 1 )
+
+    @s.posedge_clk
+    def seq():
+      if s.reset: s.count.next = 0
+      else:       s.count.next = s.count + 1
+
+    @s.combinational
+    def comb():
+      s.done.value = s.count == s.limit
+
+def test_LaneDone():
+  model = CountTo()
+  model.elaborate()
+  ens   = EnsembleSimulationTool( model, 4 )
+  ens[ model.limit ] = [ 3, 10, 5, 200 ]
+  ens.reset()
+
+  stats = ens.run( 20, until=model.done )
+  assert stats.cycles == 20
+  assert list( ens.done       ) == [ True, True, True, False ]
+  assert list( ens.done_cycle ) == [ 5, 12, 7, -1 ]
+
+  # Lanes which are done are frozen
+
+  assert list( ens[ model.count ] ) == [ 3, 10, 5, 20 ]
+
+  stats = ens.run( until=lambda: ens.top.count >= 25 )
+  assert stats.cycles == 5
+  assert ens.done.all()
+  assert list( ens[ model.count ] ) == [ 3, 10, 5, 25 ]
+
+#-----------------------------------------------------------------------
+# test_Unsupported
+#-----------------------------------------------------------------------
+class WhileLoop( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 4 )
+    s.out = OutPort( 4 )
+
+    @s.combinational
+    def comb():
+      i = 0
+      while i < s.in_:
+        i += 1
+      s.out.value = i
+
+def test_Unsupported():
+  model = WhileLoop()
+  model.elaborate()
+  with pytest.raises( EnsembleError ):
+    EnsembleSimulationTool( model, 4 )
@@ -4,7 +4,32 @@
 
 from __future__ import print_function
 
+import array
+import collections
+import math
 import pickle
+import struct
+import sys
+
+# Names of the per-cycle metrics, in the order of the columns printed by
+# SimulationMetrics and of the records in a StreamingSimulationMetrics
+# spill file.
+
+METRIC_FIELDS = (
+  'input_add_events', 'input_add_callbk', 'input_comb_evals',
+  'clock_add_events', 'clock_add_callbk', 'clock_comb_evals',
+  'slice_comb_evals', 'redun_comb_evals', 'slice_callbk',
+)
+
+CycleMetrics = collections.namedtuple( 'CycleMetrics', METRIC_FIELDS )
+
+# Spill files hold a header followed by the fields of each record as
+# little-endian unsigned ints of _spill_itemsize bytes
+
+_SPILL_MAGIC    = 'PYMTLMET'
+_SPILL_TYPECODE = 'I'
+_spill_header   = struct.Struct( '<8sI' )
+_spill_itemsize = array.array( _SPILL_TYPECODE ).itemsize
 
 #-------------------------------------------------------------------------
 # SimulationMetrics
@@ -33,8 +58,9 @@ class SimulationMetrics( object ):
     self.clock_comb_evals_per_cycle              = [ 0 ]
     self.slice_comb_evals_per_cycle              = [ 0 ]
     self.redun_comb_evals_per_cycle              = [ 0 ]
+    self.slice_callbk_per_cycle                  = [ 0 ]
     self.is_slice                                = dict()
-    self.has_run                                 = dict()
+    self.last_run                                = dict()
 
   #-----------------------------------------------------------------------
   # comb_evals_per_cycle
@@ -67,7 +93,6 @@ class SimulationMetrics( object ):
   #-----------------------------------------------------------------------
   # Register an eval block in the design.
   def reg_eval( self, eval, is_slice = False ):
-    self.has_run [ eval ] = False
     self.is_slice[ eval ] = is_slice
     if is_slice:
       self.num_slice_blocks += 1
@@ -88,8 +113,7 @@ class SimulationMetrics( object ):
     self.clock_comb_evals_per_cycle += [ 0 ]
     self.slice_comb_evals_per_cycle += [ 0 ]
     self.redun_comb_evals_per_cycle += [ 0 ]
-    for key in self.has_run:
-      self.has_run[ key ] = False
+    self.slice_callbk_per_cycle     += [ 0 ]
 
   #-----------------------------------------------------------------------
   # start_tick
@@ -130,14 +154,24 @@ class SimulationMetrics( object ):
     else:
       self.clock_comb_evals_per_cycle[ self._ncycles ] += 1
 
-    if   self.has_run[ eval ]:
+    # Evals remember the last cycle they ran in, so there is nothing to
+    # reset at the end of each cycle
+
+    if   self.last_run.get( eval ) == self._ncycles:
       self.redun_comb_evals_per_cycle[ self._ncycles ] += 1
     else:
-      self.has_run[ eval ] = True
+      self.last_run[ eval ] = self._ncycles
 
-    if   self.is_slice[ eval ]:
+    if   self.is_slice.get( eval ):
       self.slice_comb_evals_per_cycle[ self._ncycles ] += 1
 
+  #-----------------------------------------------------------------------
+  # incr_slice_callbk
+  #-----------------------------------------------------------------------
+  # Increment the number of compiled slice callbacks we executed.
+  def incr_slice_callbk( self ):
+    self.slice_callbk_per_cycle[ self._ncycles ] += 1
+
   #-----------------------------------------------------------------------
   # print_metrics
   #-----------------------------------------------------------------------
@@ -157,11 +191,11 @@ class SimulationMetrics( object ):
     if not detailed:
       return
     print()
-    print("          pre-tick          post-tick         other       ")
-    print("cycle     adde  clbk  eval  adde  clbk  eval  slice  redun")
-    print("--------  ----  ----  ----  ----  ----  ----  -----  -----")
+    print("          pre-tick          post-tick         other              ")
+    print("cycle     adde  clbk  eval  adde  clbk  eval  slice  redun  slcbk")
+    print("--------  ----  ----  ----  ----  ----  ----  -----  -----  -----")
     for i in range( self._ncycles ):
-      print("{:8}  {:4}  {:4}  {:4}  {:4}  {:4}  {:4}  {:5}  {:5}".format(
+      print("{:8}  {:4}  {:4}  {:4}  {:4}  {:4}  {:4}  {:5}  {:5}  {:5}".format(
                    i, self.input_add_events_per_cycle[ i ],
                       self.input_add_callbk_per_cycle[ i ],
                       self.input_comb_evals_per_cycle[ i ],
@@ -170,6 +204,7 @@ class SimulationMetrics( object ):
                       self.clock_comb_evals_per_cycle[ i ],
                       self.slice_comb_evals_per_cycle[ i ],
                       self.redun_comb_evals_per_cycle[ i ],
+                      self.slice_callbk_per_cycle[ i ],
                    ))
     print("-"*72)
 
@@ -180,9 +215,294 @@ class SimulationMetrics( object ):
   # for creating matplotlib plots.
   def pickle_metrics( self, filename ):
     del self.is_slice
-    del self.has_run
+    del self.last_run
     pickle.dump( self, open( filename, 'wb' ) )
 
+#-------------------------------------------------------------------------
+# MetricStats
+#-------------------------------------------------------------------------
+# Running summary statistics of a per-cycle metric. Values are counted in
+# a histogram with power-of-two buckets: bucket 0 holds zeros, and bucket
+# i holds values in [ 2**(i-1), 2**i ).
+class MetricStats( object ):
+
+  def __init__( self ):
+    self.count = 0
+    self.total = 0
+    self.sumsq = 0
+    self.min   = None
+    self.max   = None
+    self.hist  = [ 0 ]
+
+  def add( self, value ):
+    self.count += 1
+    self.total += value
+    self.sumsq += value * value
+    if self.min is None or value < self.min: self.min = value
+    if self.max is None or value > self.max: self.max = value
+    bucket = value.bit_length()
+    if bucket >= len( self.hist ):
+      self.hist.extend( [ 0 ] * ( bucket - len( self.hist ) + 1 ) )
+    self.hist[ bucket ] += 1
+
+  @property
+  def mean( self ):
+    return float( self.total ) / self.count if self.count else 0.0
+
+  @property
+  def stdev( self ):
+    if not self.count:
+      return 0.0
+    var = float( self.sumsq ) / self.count - self.mean ** 2
+    return math.sqrt( max( var, 0.0 ) )
+
+  # Returns ( low, high, count ) tuples for the non-empty buckets of the
+  # histogram, where values in the bucket are in [ low, high ].
+  def buckets( self ):
+    return [ ( 0 if i == 0 else 1 << ( i - 1 ), max( ( 1 << i ) - 1, 0 ), n )
+             for i, n in enumerate( self.hist ) if n ]
+
+#-------------------------------------------------------------------------
+# StreamingSimulationMetrics
+#-------------------------------------------------------------------------
+# Collects the same metrics as SimulationMetrics in constant memory, so
+# metrics can be enabled on very long simulations. Instead of keeping a
+# list entry per cycle, each metric is summarized with running statistics
+# and a histogram (see MetricStats). Per-cycle records can optionally be
+# spilled to a binary file in chunks, and read back later with
+# read_metrics_spill().
+#
+# To use it, pass an instance as the collect_metrics argument of the
+# simulator:
+#
+#   metrics = StreamingSimulationMetrics( spill_file='metrics.bin' )
+#   sim     = SimulationTool( model, collect_metrics=metrics )
+#
+class StreamingSimulationMetrics( object ):
+
+  FIELDS = METRIC_FIELDS
+
+  #-----------------------------------------------------------------------
+  # __init__
+  #-----------------------------------------------------------------------
+  def __init__( self, spill_file = None, chunk_cycles = 4096 ):
+    self._ncycles                 = 0
+    self._pre_tick                = True
+    self.num_modules              = 0
+    self.num_tick_blocks          = 0
+    self.num_posedge_clk_blocks   = 0
+    self.num_combinational_blocks = 0
+    self.num_slice_blocks         = 0
+    self.stats                    = collections.OrderedDict(
+                                      ( name, MetricStats() )
+                                      for name in self.FIELDS )
+    self.is_slice                 = dict()
+    self.last_run                 = dict()
+    self.spill_file               = spill_file
+    self._chunk_cycles            = chunk_cycles
+    self._chunk                   = array.array( _SPILL_TYPECODE )
+    self._spill                   = None
+    self._reset_counts()
+
+    if spill_file:
+      self._spill = open( spill_file, 'wb' )
+      self._spill.write( _spill_header.pack( _SPILL_MAGIC,
+                                             len( self.FIELDS ) ) )
+
+  def _reset_counts( self ):
+    self._input_add_events = 0
+    self._input_add_callbk = 0
+    self._input_comb_evals = 0
+    self._clock_add_events = 0
+    self._clock_add_callbk = 0
+    self._clock_comb_evals = 0
+    self._slice_comb_evals = 0
+    self._redun_comb_evals = 0
+    self._slice_callbk     = 0
+
+  #-----------------------------------------------------------------------
+  # reg_model
+  #-----------------------------------------------------------------------
+  def reg_model( self, model ):
+    self.num_modules              += 1
+    self.num_tick_blocks          += len( model.get_tick_blocks() )
+    self.num_posedge_clk_blocks   += len( model.get_posedge_clk_blocks() )
+    self.num_combinational_blocks += len( model.get_combinational_blocks() )
+
+  #-----------------------------------------------------------------------
+  # reg_eval
+  #-----------------------------------------------------------------------
+  def reg_eval( self, eval, is_slice = False ):
+    self.is_slice[ eval ] = is_slice
+    if is_slice:
+      self.num_slice_blocks += 1
+
+  #-----------------------------------------------------------------------
+  # incr_metrics_cycle
+  #-----------------------------------------------------------------------
+  # Folds the counts of the cycle which just finished into the running
+  # statistics, and appends them to the spill file if there is one.
+  def incr_metrics_cycle( self ):
+    record = ( self._input_add_events, self._input_add_callbk,
+               self._input_comb_evals, self._clock_add_events,
+               self._clock_add_callbk, self._clock_comb_evals,
+               self._slice_comb_evals, self._redun_comb_evals,
+               self._slice_callbk )
+
+    for stats, value in zip( self.stats.itervalues(), record ):
+      stats.add( value )
+
+    if self._spill:
+      self._chunk.extend( record )
+      if len( self._chunk ) >= self._chunk_cycles * len( record ):
+        self.flush()
+
+    self._pre_tick  = True
+    self._ncycles  += 1
+    self._reset_counts()
+
+  #-----------------------------------------------------------------------
+  # start_tick
+  #-----------------------------------------------------------------------
+  def start_tick( self ):
+    self._pre_tick = False
+
+  #-----------------------------------------------------------------------
+  # incr_add_events
+  #-----------------------------------------------------------------------
+  def incr_add_events( self ):
+    if self._pre_tick: self._input_add_events += 1
+    else:              self._clock_add_events += 1
+
+  #-----------------------------------------------------------------------
+  # incr_add_callbk
+  #-----------------------------------------------------------------------
+  def incr_add_callbk( self ):
+    if self._pre_tick: self._input_add_callbk += 1
+    else:              self._clock_add_callbk += 1
+
+  #-----------------------------------------------------------------------
+  # incr_comb_evals
+  #-----------------------------------------------------------------------
+  def incr_comb_evals( self, eval ):
+    if self._pre_tick: self._input_comb_evals += 1
+    else:              self._clock_comb_evals += 1
+
+    if self.last_run.get( eval ) == self._ncycles:
+      self._redun_comb_evals += 1
+    else:
+      self.last_run[ eval ] = self._ncycles
+
+    if self.is_slice.get( eval ):
+      self._slice_comb_evals += 1
+
+  #-----------------------------------------------------------------------
+  # incr_slice_callbk
+  #-----------------------------------------------------------------------
+  def incr_slice_callbk( self ):
+    self._slice_callbk += 1
+
+  #-----------------------------------------------------------------------
+  # flush
+  #-----------------------------------------------------------------------
+  # Writes the buffered per-cycle records to the spill file.
+  def flush( self ):
+    if not self._spill:
+      return
+    if sys.byteorder == 'big':
+      self._chunk.byteswap()
+    self._chunk.tofile( self._spill )
+    self._spill.flush()
+    del self._chunk[:]
+
+  #-----------------------------------------------------------------------
+  # close
+  #-----------------------------------------------------------------------
+  def close( self ):
+    if self._spill:
+      self.flush()
+      self._spill.close()
+      self._spill = None
+
+  #-----------------------------------------------------------------------
+  # print_metrics
+  #-----------------------------------------------------------------------
+  # Print metrics to the commandline. The detailed output includes the
+  # histogram of each metric.
+  def print_metrics( self, detailed = True ):
+    print("-"*72)
+    print("Simulation Metrics")
+    print("-"*72)
+    print()
+    print("ncycles:               {:4}".format(self._ncycles                ))
+    print("modules:               {:4}".format(self.num_modules             ))
+    print("@tick blocks:          {:4}".format(self.num_tick_blocks         ))
+    print("@posedge_clk blocks:   {:4}".format(self.num_posedge_clk_blocks  ))
+    print("@combinational blocks: {:4}".format(self.num_combinational_blocks))
+    print("slice blocks:          {:4}".format(self.num_slice_blocks        ))
+    print("-"*72)
+    print()
+    print("metric (per cycle)      total      mean     stdev     min     max")
+    print("----------------  ----------  --------  --------  ------  ------")
+    for name, stats in self.stats.items():
+      print("{:16}  {:10}  {:8.2f}  {:8.2f}  {:6}  {:6}".format(
+              name, stats.total, stats.mean, stats.stdev,
+              stats.min or 0, stats.max or 0 ))
+    print("-"*72)
+    if not detailed:
+      return
+    for name, stats in self.stats.items():
+      print()
+      print(name)
+      for low, high, count in stats.buckets():
+        print("  {:>17}  {:10}".format(
+                "{}-{}".format( low, high ) if low != high else low, count ))
+    print("-"*72)
+
+  #-----------------------------------------------------------------------
+  # pickle_metrics
+  #-----------------------------------------------------------------------
+  # Pickle the aggregated metrics to a file. The spill file, if any, is
+  # flushed but stays open.
+  def pickle_metrics( self, filename ):
+    self.flush()
+    with open( filename, 'wb' ) as f:
+      pickle.dump( self, f )
+
+  def __getstate__( self ):
+    state = self.__dict__.copy()
+    for key in [ 'is_slice', 'last_run', '_chunk', '_spill' ]:
+      del state[ key ]
+    return state
+
+  def __setstate__( self, state ):
+    self.__dict__.update( state )
+    self.is_slice = dict()
+    self.last_run = dict()
+    self._chunk   = array.array( _SPILL_TYPECODE )
+    self._spill   = None
+
+#-------------------------------------------------------------------------
+# read_metrics_spill
+#-------------------------------------------------------------------------
+# Iterates over the per-cycle records in a file written by
+# StreamingSimulationMetrics. Records are read a chunk at a time and
+# returned as CycleMetrics tuples.
+def read_metrics_spill( filename, chunk_cycles = 4096 ):
+  with open( filename, 'rb' ) as f:
+    magic, nfields = _spill_header.unpack( f.read( _spill_header.size ) )
+    if magic != _SPILL_MAGIC or nfields != len( METRIC_FIELDS ):
+      raise ValueError( "{} is not a metrics spill file".format( filename ) )
+    while True:
+      chunk = array.array( _SPILL_TYPECODE )
+      chunk.fromstring( f.read( _spill_itemsize * nfields * chunk_cycles ) )
+      if not chunk:
+        return
+      if sys.byteorder == 'big':
+        chunk.byteswap()
+      for i in xrange( 0, len( chunk ), nfields ):
+        yield CycleMetrics( *chunk[ i:i+nfields ] )
+
 #-------------------------------------------------------------------------
 # DummyMetrics
 #-------------------------------------------------------------------------
@@ -200,3 +520,4 @@ class DummyMetrics( object ):
   def incr_add_events( self ): pass
   def incr_add_callbk( self ): pass
   def incr_comb_evals( self, eval ): pass
+  def incr_slice_callbk( self ): pass
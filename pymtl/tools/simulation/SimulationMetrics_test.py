@@ -0,0 +1,89 @@
+#=======================================================================
+# SimulationMetrics_test.py
+#=======================================================================
+
+import pickle
+import pytest
+import random
+import sys
+
+from pymtl import *
+
+from SimulationMetrics import ( SimulationMetrics, METRIC_FIELDS,
+                                StreamingSimulationMetrics,
+                                read_metrics_spill )
+from pclib.rtl.queues  import NormalQueue
+
+# Metrics are only collected by the dev version of cycle()
+
+pytestmark = pytest.mark.skipif( sys.flags.optimize,
+                                 reason="metrics are not collected with -O" )
+
+#-----------------------------------------------------------------------
+# run_queue
+#-----------------------------------------------------------------------
+# Simulates a queue with random stimulus, collecting metrics.
+def run_queue( metrics, ncycles=50 ):
+  rgen  = random.Random( 0 )
+  model = NormalQueue( 4, 8 )
+  model.elaborate()
+  sim   = SimulationTool( model, collect_metrics=metrics )
+  sim.reset()
+  for i in range( ncycles ):
+    model.enq.val.value = rgen.randint( 0, 1 )
+    model.enq.msg.value = rgen.randint( 0, 255 )
+    model.deq.rdy.value = rgen.randint( 0, 1 )
+    sim.cycle()
+  return sim
+
+#-----------------------------------------------------------------------
+# test_SimulationMetrics
+#-----------------------------------------------------------------------
+# Designs with @combinational blocks can be simulated with metrics.
+def test_SimulationMetrics():
+  sim = run_queue( True )
+  assert sim.metrics._ncycles == sim.ncycles
+  assert sim.metrics.num_modules == 4 # queue, ctrl, dpath, regfile
+  assert sim.metrics.num_combinational_blocks > 0
+  assert sum( sim.metrics.comb_evals_per_cycle ) > 0
+  sim.metrics.print_metrics()
+
+#-----------------------------------------------------------------------
+# test_StreamingSimulationMetrics
+#-----------------------------------------------------------------------
+# Streaming metrics summarize the same per-cycle counts.
+def test_StreamingSimulationMetrics( tmpdir ):
+
+  spill_file = str( tmpdir.join( 'metrics.bin' ) )
+
+  expected = run_queue( True ).metrics
+  metrics  = StreamingSimulationMetrics( spill_file, chunk_cycles=16 )
+  sim      = run_queue( metrics )
+  metrics.close()
+
+  for name in METRIC_FIELDS:
+    per_cycle = getattr( expected, name + '_per_cycle' )[ :sim.ncycles ]
+    stats     = metrics.stats[ name ]
+    assert stats.count == sim.ncycles
+    assert stats.total == sum( per_cycle )
+    assert stats.min   == min( per_cycle )
+    assert stats.max   == max( per_cycle )
+    assert sum( n for low, high, n in stats.buckets() ) == sim.ncycles
+
+  # Per-cycle records can be read back from the spill file
+
+  records = list( read_metrics_spill( spill_file, chunk_cycles=7 ) )
+  assert len( records ) == sim.ncycles
+  for name in METRIC_FIELDS:
+    assert [ getattr( x, name ) for x in records ] == \
+           getattr( expected, name + '_per_cycle' )[ :sim.ncycles ]
+
+  # Aggregates are kept when pickling
+
+  metrics.print_metrics()
+  metrics.pickle_metrics( str( tmpdir.join( 'metrics.pkl' ) ) )
+  with open( str( tmpdir.join( 'metrics.pkl' ) ), 'rb' ) as f:
+    loaded = pickle.load( f )
+  assert loaded._ncycles == sim.ncycles
+  assert loaded.stats[ 'input_comb_evals' ].total == \
+         metrics.stats[ 'input_comb_evals' ].total
@@ -11,11 +11,15 @@ from __future__ import print_function
 import pprint
 import collections
 import inspect
+import time
 import warnings
 import sim_utils as sim
 
 from sys               import flags
 from SimulationMetrics import SimulationMetrics, DummyMetrics
+from fl_scheduler      import FLScheduler
+
+_INF = float( 'inf' )
 
 #-----------------------------------------------------------------------
 # SimulationTool
@@ -30,7 +34,17 @@ class SimulationTool( object ):
   # __init__
   #---------------------------------------------------------------------
   # Construct a simulator based on the provided model.
-  def __init__( self, model, collect_metrics = False ):
+  #
+  # If static_schedule is True, @combinational blocks are levelized at
+  # construction and evaluated in a single pass, in dependency order,
+  # each time eval_combinational() is called. Only combinational loops
+  # are still evaluated using the event queue.
+  #
+  # If specialize is True, the blocks of the design are recompiled with
+  # the lookups of signals and submodels bound to the objects they
+  # resolve to, and with integer parameters folded (see specialize.py).
+  def __init__( self, model, collect_metrics = False, static_schedule = False,
+                specialize = False ):
 
     # Check that the model has been elaborated
     if not model.is_elaborated():
@@ -45,6 +59,10 @@ class SimulationTool( object ):
     self._sequential_blocks   = []
     self._register_queue      = []
     self._current_func        = None
+    self._static_schedule     = None
+    self._fl_scheduler        = FLScheduler()
+    self._idle_models         = None
+    self._cycle_hooks         = []
 
     self._nets                = None # TODO: remove me
 
@@ -52,10 +70,13 @@ class SimulationTool( object ):
 
 
     # Only collect metrics if they are enabled, otherwise replace
-    # with a dummy collection class.
+    # with a dummy collection class. Instead of True, collect_metrics can
+    # be a metrics collection object such as StreamingSimulationMetrics.
 
-    if collect_metrics:
+    if collect_metrics is True:
       self.metrics            = SimulationMetrics()
+    elif collect_metrics:
+      self.metrics            = collect_metrics
     else:
       self.metrics            = DummyMetrics()
 
@@ -74,22 +95,58 @@ class SimulationTool( object ):
 
     signals                 = sim.collect_signals( model )
     nets, slice_connections = sim.signals_to_nets( signals )
-    sequential_blocks       = sim.register_seq_blocks( model )
+    sequential_blocks       = sim.register_seq_blocks( model,
+                                                   self._fl_scheduler )
 
     sim.insert_signal_values( self, nets )
 
-    sim.register_comb_blocks  ( model, self._event_queue )
-    sim.create_slice_callbacks( slice_connections, self._event_queue )
+    comb_writes = {} if static_schedule else None
+
+    sim.register_comb_blocks  ( model, self._event_queue, comb_writes )
+    sim.create_slice_callbacks( slice_connections, self._event_queue,
+                                self.metrics if collect_metrics else None )
     sim.register_cffi_updates ( model )
 
+    if collect_metrics:
+      models = [ model ]
+      for m in models:
+        self.metrics.reg_model( m )
+        models.extend( m.get_submodules() )
+
     self._nets              = nets
+    self._slice_connects    = slice_connections
+    self._comb_writes       = comb_writes
     self._sequential_blocks = sequential_blocks
 
+    # Levelize combinational blocks if a static schedule was requested
+
+    if static_schedule:
+      self._create_static_schedule( comb_writes, slice_connections )
+
+    # Specialize blocks for the design if requested
+
+    if specialize:
+      from specialize import specialize_blocks
+      specialize_blocks( self )
+
+    # Nets only written through .next are flopped every cycle by the
+    # generated cycle() function, so they no longer add themselves to the
+    # register queue
+
+    self._static_flops = sim.get_static_flops( model )
+    for net in self._static_flops:
+      if 'notify_sim_seq_update' in net.__dict__:
+        del net.notify_sim_seq_update
+
     # Setup vcd dumping if it's configured
 
     if hasattr( model, 'vcd_file' ) and model.vcd_file:
-      from vcd import VCDUtil
-      VCDUtil( self, model.vcd_file )
+      from vcd import create_vcd_writer
+      create_vcd_writer( self, model.vcd_file )
+
+    # Generate a cycle() function specialized for the design
+
+    self._create_cycle()
 
   #---------------------------------------------------------------------
   # reset
@@ -101,6 +158,195 @@ class SimulationTool( object ):
     self.cycle()
     self.model.reset.v = 0
 
+  #---------------------------------------------------------------------
+  # run
+  #---------------------------------------------------------------------
+  # Advances the simulator by multiple clock cycles. The simulation stops
+  # after ncycles cycles, or as soon as the until() predicate returns
+  # True, whichever happens first. Like the usual harness loop:
+  #
+  #   while not model.done():
+  #     sim.print_line_trace()
+  #     sim.cycle()
+  #
+  # the predicate is checked before each cycle. With check_every=N it is
+  # only checked every N cycles, which reduces the overhead of expensive
+  # predicates. The state of the simulator is saved in memory before
+  # each batch of N cycles (see checkpoint.py), and if the predicate
+  # became True during the batch, the simulator is rewound to its start
+  # and the batch is replayed one cycle at a time, so the simulation
+  # still stops at the exact cycle where the predicate first became
+  # True. This needs every model with blocks to implement
+  # checkpoint_state() and restore_state(), or to be declared
+  # checkpoint_stateless, otherwise the predicate is checked every cycle.
+  # It is also checked every cycle while the state cannot be saved (a
+  # @tick_fl block is paused), or when replaying cycles would repeat
+  # their side effects: a line trace, cycle hooks (e.g., a VCD file) or
+  # metrics. If trace is True, the line trace is
+  # printed before each cycle. Trace can also be a function called
+  # instead, such as the capture() method of a LineTraceRecorder.
+  #
+  # If skip_idle is True, the simulator jumps over the cycles where no
+  # sequential block has anything to do: after each cycle where every
+  # model with sequential blocks declared itself idle with Model.idle(),
+  # every generator-based @tick_fl block is sleeping or waiting for a
+  # net to change, and no event is pending, the cycle count is advanced
+  # to the first cycle where a model (or a sleeping @tick_fl block)
+  # expects to be active again. Nets cannot change during these cycles,
+  # so the until() predicate is not checked and no line trace is printed
+  # for them. Cycles are never skipped while metrics are collected or a
+  # VCD file is written, since both record every cycle.
+  #
+  # Returns a RunStats tuple with the number of cycles executed, the wall
+  # clock time in seconds, and the simulation speed in cycles/second.
+  def run( self, ncycles=None, until=None, check_every=1, trace=False,
+           skip_idle=False ):
+
+    if ncycles is None and until is None:
+      raise ValueError( "run() needs either ncycles or an until predicate!" )
+    if check_every < 1:
+      raise ValueError( "check_every must be a positive number of cycles!" )
+
+    from checkpoint import ( CheckpointError, dumps_checkpoint,
+                             loads_checkpoint, saves_all_state )
+
+    if not isinstance( self.metrics, DummyMetrics ) or hasattr( self, 'vcd' ):
+      skip_idle   = False
+      check_every = 1
+    if trace or self._cycle_hooks or not saves_all_state( self.model ):
+      check_every = 1
+
+    if skip_idle:
+      idle_models = self._get_idle_models()
+      for m in idle_models:
+        m._idle = 0
+
+    cycle       = self.cycle
+    line_trace  = self.print_line_trace if trace is True else trace
+    start_cycle = self.ncycles
+    start_time  = time.time()
+
+    stop_cycle  = start_cycle + ncycles if ncycles is not None else _INF
+    replay_stop = start_cycle
+    saved       = None
+
+    while True:
+
+      # The predicate is also checked after the last batch, which may have
+      # to be replayed
+
+      if self.ncycles >= stop_cycle and saved is None:
+        break
+
+      if until is not None and until():
+        if saved is None:
+          break
+
+        # The predicate became True during the last batch, rewind to its
+        # start and replay it one cycle at a time
+
+        replay_stop = self.ncycles
+        loads_checkpoint( self, saved )
+        saved = None
+        continue
+
+      if self.ncycles >= stop_cycle:
+        break
+
+      remaining = stop_cycle - self.ncycles
+      batch     = min( check_every, remaining )
+      saved     = None
+
+      if self.ncycles < replay_stop:
+        batch = 1
+      elif batch > 1 and until is not None:
+        self.eval_combinational()
+        try:
+          saved = dumps_checkpoint( self )
+        except CheckpointError:
+          batch = 1
+
+      if skip_idle:
+        i = 0
+        while i < batch:
+          if trace:
+            line_trace()
+          cycle()
+          i += 1 + self._skip_idle( idle_models, remaining - i - 1 )
+      elif trace:
+        for i in xrange( batch ):
+          line_trace()
+          cycle()
+      else:
+        for i in xrange( batch ):
+          cycle()
+
+    seconds = time.time() - start_time
+    cycles  = self.ncycles - start_cycle
+
+    return RunStats( cycles, seconds, cycles / seconds if seconds else 0.0 )
+
+  #---------------------------------------------------------------------
+  # _get_idle_models
+  #---------------------------------------------------------------------
+  # Returns the models which must declare themselves idle for cycles to
+  # be skipped: those with sequential blocks other than generator-based
+  # @tick_fl blocks, which are run by the FL scheduler.
+  def _get_idle_models( self ):
+
+    if self._idle_models is None:
+      self._idle_models = []
+      models = [ self.model ]
+      for m in models:
+        models.extend( m.get_submodules() )
+        for func in m.get_tick_blocks() + m.get_posedge_clk_blocks():
+          if not hasattr( func, '_fl_task' ):
+            self._idle_models.append( m )
+            break
+
+    return self._idle_models
+
+  #---------------------------------------------------------------------
+  # _skip_idle
+  #---------------------------------------------------------------------
+  # Called after each cycle by run( skip_idle=True ). Skips up to limit
+  # cycles if the whole design is idle, clears the idle declarations of
+  # the models and returns the number of cycles skipped.
+  def _skip_idle( self, idle_models, limit ):
+
+    ncycles = limit
+    for m in idle_models:
+      if m._idle < ncycles:
+        ncycles = m._idle
+      m._idle = 0
+
+    # A design idle forever keeps being simulated cycle by cycle, since
+    # only the until() predicate can tell when to stop
+
+    if not 0 < ncycles < _INF:
+      return 0
+    if self._event_queue.len() or self._register_queue:
+      return 0
+
+    # Coroutines waiting on a net only resume after it changed, others
+    # must be sleeping
+
+    fl = self._fl_scheduler
+    if fl.tasks:
+      if fl._ready or fl._waiting or fl._changed:
+        return 0
+      if fl._timers:
+        ncycles = min( ncycles, fl._timers[0][0] - fl.ncycles - 1 )
+        if ncycles <= 0:
+          return 0
+
+    self.ncycles += ncycles
+    fl.ncycles   += ncycles
+    for m in idle_models:
+      m.skip_cycles( ncycles )
+
+    return ncycles
+
   #---------------------------------------------------------------------
   # print_line_trace
   #---------------------------------------------------------------------
@@ -108,6 +354,116 @@ class SimulationTool( object ):
   def print_line_trace( self ):
     print( "{:>3}:".format( self.ncycles ), self.model.line_trace() )
 
+  #---------------------------------------------------------------------
+  # record_line_trace
+  #---------------------------------------------------------------------
+  # Returns a LineTraceRecorder, which captures the raw values shown by
+  # the line trace each time its capture() method is called and only
+  # formats the line traces of the last depth captured cycles on demand
+  # (see line_trace.py):
+  #
+  #   recorder = sim.record_line_trace()
+  #   with recorder.dump_on_error():
+  #     sim.run( until=model.done, trace=recorder.capture )
+  #
+  def record_line_trace( self, depth=1000 ):
+    from line_trace import LineTraceRecorder
+    return LineTraceRecorder( self, depth )
+
+  #---------------------------------------------------------------------
+  # record_waveform
+  #---------------------------------------------------------------------
+  # Returns a WaveformWriter, which records the changes of the selected
+  # signals in a compact binary file with random access, read with a
+  # Waveform (see waveform.py). The file is complete once the writer is
+  # closed.
+  #
+  #   writer = sim.record_waveform( 'trace.wave', include=['top.core.*'] )
+  #   sim.run( until=model.done )
+  #   writer.close()
+  #
+  def record_waveform( self, path, include=None, exclude=None, depth=None ):
+    from waveform import WaveformWriter
+    return WaveformWriter( self, path, include, exclude, depth )
+
+  #---------------------------------------------------------------------
+  # checkpoint
+  #---------------------------------------------------------------------
+  # Saves the complete simulator state to the file at path: the value of
+  # every net and its shadow (.next) value, the registers waiting to be
+  # flopped, the cycle count, and the Python-side state returned by the
+  # checkpoint_state() method of each model. See checkpoint.py for the
+  # file format.
+  def checkpoint( self, path ):
+    from checkpoint import save_checkpoint
+    save_checkpoint( self, path )
+
+  #---------------------------------------------------------------------
+  # restore
+  #---------------------------------------------------------------------
+  # Creates a simulator for model with the state saved in the checkpoint
+  # file at path. The model must be a freshly elaborated instance of the
+  # design the checkpoint was created from. Additional keyword arguments
+  # are passed to the constructor.
+  @classmethod
+  def restore( cls, model, path, **kwargs ):
+    from checkpoint import load_checkpoint
+    sim = cls( model, **kwargs )
+    load_checkpoint( sim, path )
+    return sim
+
+  #---------------------------------------------------------------------
+  # fork_map
+  #---------------------------------------------------------------------
+  # Runs many divergent continuations of the current simulation in
+  # parallel. For each variant, a child process is created with
+  # os.fork(), which starts from the current simulator state (shared
+  # copy-on-write) and calls fn( sim, variant ). The function typically
+  # applies the stimulus of the variant, runs the simulation and returns
+  # a small picklable result, such as a cycle count or some net values.
+  #
+  # Up to workers children run at once (by default, one per CPU). Returns
+  # the list of results in the order of variants. The state of this
+  # simulator is not modified.
+  def fork_map( self, fn, variants, workers=None ):
+    from parallel import fork_map
+    return fork_map( self, fn, variants, workers )
+
+  #---------------------------------------------------------------------
+  # profile
+  #---------------------------------------------------------------------
+  # Starts recording the invocation count and wall time of every
+  # sequential and combinational block of the design. With
+  # sample_every=N, only one in N invocations of each block is timed to
+  # bound the overhead. Returns a BlockProfiler, which can print a
+  # report sorted by time per block and per model, or write a collapsed
+  # stack file for flame graph tools:
+  #
+  #   profiler = sim.profile()
+  #   sim.run( 10000 )
+  #   profiler.report()
+  #   profiler.write_collapsed( 'sim.folded' )
+  #
+  def profile( self, sample_every=1 ):
+    from profiler import BlockProfiler
+    return BlockProfiler( self, sample_every )
+
+  #---------------------------------------------------------------------
+  # profile_nets
+  #---------------------------------------------------------------------
+  # Starts counting the writes and value changes of every net, and the
+  # blocks each value change wakes up. Returns a NetProfiler, whose
+  # report lists the hottest nets and their fan-out amplification (the
+  # average number of blocks woken up per value change):
+  #
+  #   profiler = sim.profile_nets()
+  #   sim.run( 10000 )
+  #   profiler.report( top=10, detailed=True )
+  #
+  def profile_nets( self ):
+    from profiler import NetProfiler
+    return NetProfiler( self )
+
   #---------------------------------------------------------------------
   # cycle
   #---------------------------------------------------------------------
@@ -116,7 +472,8 @@ class SimulationTool( object ):
   # well as any @combinational blocks that have been added to the event
   # queue.
   #
-  # Note: see _debug_cycle and _perf_cycle for actual implementations.
+  # Note: see _debug_cycle and _perf_cycle for reference implementations,
+  # the actual implementation is generated by _create_cycle.
   def cycle( self ):
     pass
 
@@ -144,6 +501,7 @@ class SimulationTool( object ):
     # Then flop the shadow state on all registers
     while self._register_queue:
       reg = self._register_queue.pop()
+      reg._flop_pending = False
       reg.flop()
 
     # Call all events generated by synchronous logic
@@ -155,6 +513,10 @@ class SimulationTool( object ):
     # Tell the metrics module to prepare for the next cycle
     self.metrics.incr_metrics_cycle()
 
+    # Call the end of cycle hooks
+    for func in self._cycle_hooks:
+      func()
+
   #---------------------------------------------------------------------
   # _perf_cycle
   #---------------------------------------------------------------------
@@ -171,6 +533,7 @@ class SimulationTool( object ):
     # Then flop the shadow state on all registers
     while self._register_queue:
       reg = self._register_queue.pop()
+      reg._flop_pending = False
       reg.flop()
 
     # Call all events generated by synchronous logic
@@ -179,6 +542,46 @@ class SimulationTool( object ):
     # Increment the simulator cycle count
     self.ncycles += 1
 
+    # Call the end of cycle hooks
+    for func in self._cycle_hooks:
+      func()
+
+  #---------------------------------------------------------------------
+  # add_cycle_hook
+  #---------------------------------------------------------------------
+  # Registers a function called at the end of each cycle, once all
+  # sequential and combinational blocks were evaluated and the cycle
+  # count was incremented. Used by waveform writers to sample the nets
+  # once per cycle.
+  def add_cycle_hook( self, func ):
+    self._cycle_hooks.append( func )
+    self._create_cycle()
+
+  #---------------------------------------------------------------------
+  # remove_cycle_hook
+  #---------------------------------------------------------------------
+  def remove_cycle_hook( self, func ):
+    self._cycle_hooks.remove( func )
+    self._create_cycle()
+
+  #---------------------------------------------------------------------
+  # _create_cycle
+  #---------------------------------------------------------------------
+  # Replace cycle() with a function generated for this design. Called
+  # again whenever the blocks or the end of cycle hooks change, the
+  # statically flopped nets are only found once at construction.
+  def _create_cycle( self ):
+    self.cycle, self._cycle_src = sim.create_cycle( self,
+        self._sequential_blocks, self._static_flops, self._static_schedule,
+        dev = not flags.optimize )
+
+  #---------------------------------------------------------------------
+  # dump_generated_cycle
+  #---------------------------------------------------------------------
+  # Print the source of the cycle() function generated for the design.
+  def dump_generated_cycle( self, outfile=None ):
+    print( self._cycle_src, file=outfile )
+
   #---------------------------------------------------------------------
   # eval_combinational
   #---------------------------------------------------------------------
@@ -209,6 +612,75 @@ class SimulationTool( object ):
       func()
       self._current_func = None
 
+  #---------------------------------------------------------------------
+  # _dev_static_eval
+  #---------------------------------------------------------------------
+  # Implementation of eval_combinational() using the static schedule for
+  # use during develop-test-debug loops.
+  def _dev_static_eval( self ):
+    for func in self._static_schedule:
+      self.metrics.incr_comb_evals( func )
+      func()
+
+  #---------------------------------------------------------------------
+  # _perf_static_eval
+  #---------------------------------------------------------------------
+  # Implementation of eval_combinational() using the static schedule for
+  # use when benchmarking models.
+  def _perf_static_eval( self ):
+    for func in self._static_schedule:
+      func()
+
+  #---------------------------------------------------------------------
+  # _create_static_schedule
+  #---------------------------------------------------------------------
+  # Replace the event-driven eval_combinational() with one evaluating
+  # all combinational blocks in a single pass. Combinational loops are
+  # turned into a single entry of the schedule which uses the event
+  # queue to evaluate the blocks of the loop until they settle.
+  def _create_static_schedule( self, comb_writes, slice_connections ):
+
+    sccs = sim.create_static_schedule( self.model, comb_writes,
+                                       slice_connections )
+
+    if sccs is None:
+      warnings.warn( "Cannot determine the signals written by all "
+                     "@combinational blocks, static scheduling disabled!",
+                     Warning )
+      return
+
+    # The event queue was primed with all blocks and slice callbacks
+    # during construction. Blocks are evaluated by the first pass of the
+    # schedule anyway, but slice callbacks must fire once to propagate
+    # the initial values of their source nets.
+
+    while self._event_queue.len():
+      func = self._event_queue.deq()
+      if func not in comb_writes:
+        func()
+
+    def create_loop_eval( blocks, event_eval ):
+      event_queue = self._event_queue
+      def eval_loop():
+        for func in blocks:
+          event_queue.enq( func.cb, func.id )
+        event_eval()
+      return eval_loop
+
+    event_eval = self.eval_combinational
+
+    self._static_schedule = []
+    for scc in sccs:
+      if len( scc ) == 1:
+        self._static_schedule.append( scc[0] )
+      else:
+        self._static_schedule.append( create_loop_eval( scc, event_eval ) )
+
+    if flags.optimize:
+      self.eval_combinational = self._perf_static_eval
+    else:
+      self.eval_combinational = self._dev_static_eval
+
   #---------------------------------------------------------------------
   # add_event
   #---------------------------------------------------------------------
@@ -230,9 +702,34 @@ class SimulationTool( object ):
 
     for func in signal_value._callbacks:
       self.metrics.incr_add_callbk()
-      if func != self._current_func:
+      if func.cb != self._current_func:
         self._event_queue.enq( func.cb, func.id )
 
+  #---------------------------------------------------------------------
+  # add_masked_event
+  #---------------------------------------------------------------------
+  # Like add_event(), for nets with blocks which are only sensitive to a
+  # range of the bits of the net. Diff has a bit set for each bit of the
+  # net which changed, and only blocks sensitive to one of these bits are
+  # added to the event queue.
+  def add_masked_event( self, signal_value, diff ):
+
+    self.metrics.incr_add_events()
+
+    masks = signal_value._callback_masks
+    for func in signal_value._callbacks:
+      self.metrics.incr_add_callbk()
+      mask = masks.get( func )
+      if ( mask is None or diff & mask ) and func.cb != self._current_func:
+        self._event_queue.enq( func.cb, func.id )
+
+#-----------------------------------------------------------------------
+# RunStats
+#-----------------------------------------------------------------------
+# Statistics returned by SimulationTool.run().
+RunStats = collections.namedtuple( 'RunStats',
+                                   'cycles seconds cycles_per_sec' )
+
 #-----------------------------------------------------------------------
 # EventQueue
 #-----------------------------------------------------------------------
@@ -0,0 +1,160 @@
+#=======================================================================
+# SimulationTool_sched_test.py
+#=======================================================================
+# Tests for the static schedule mode of the SimulationTool class.
+
+import pytest
+import warnings
+
+#=======================================================================
+# Tests
+#=======================================================================
+
+# This imports all the SimulationTool tests. Below we will hack the
+# setup_sim() function call in each module to use a statically scheduled
+# version of the simulator.
+
+from SimulationTool_seq_test    import *
+from SimulationTool_comb_test   import *
+from SimulationTool_mix_test    import *
+from SimulationTool_struct_test import *
+from SimulationTool_wire_test   import *
+
+#=======================================================================
+# Test Config
+#=======================================================================
+
+#-----------------------------------------------------------------------
+# local_setup_sim
+#-----------------------------------------------------------------------
+# - elaborate the module
+# - create a simulator with the SimulationTool using a static schedule
+#
+def local_setup_sim( model ):
+  model.elaborate()
+  sim = SimulationTool( model, static_schedule=True )
+  return model, sim
+
+#-----------------------------------------------------------------------
+# SliceWriteCheck
+#-----------------------------------------------------------------------
+# Overrides the test in SimulationTool_mix_test. Every block is evaluated
+# each cycle in the static schedule, so slice writes without a .next are
+# visible after the next cycle.
+def test_SliceWriteCheck( setup_sim ):
+
+  model = SliceWriteCheck( 16 )
+  model, sim = setup_sim( model )
+  assert model.out == 0
+
+  # Test regular write
+  model.in_.n = 8
+  sim.cycle()
+  assert model.out == 0b1000
+
+  # Slice then .n, should pass
+  model.in_[0].n = 1
+  sim.cycle()
+  assert model.out == 0b1001
+  model.in_[4:8].n = 0b1001
+  sim.cycle()
+  assert model.out == 0b10011001
+
+  # Test regular write
+  model.in_.n = 8
+  sim.cycle()
+  assert model.out == 0b1000
+
+  # Only slice, should pass
+  model.in_[0] = 1
+  sim.cycle()
+  assert model.out == 0b1001
+  model.in_[4:8] = 0b1001
+  sim.cycle()
+  assert model.out == 0b10011001
+
+  # Test regular write
+  model.in_.n = 8
+  sim.cycle()
+  assert model.out == 0b1000
+
+  # .n then slice, should fail
+  model.in_.n[0] = 1
+  sim.cycle()
+  with pytest.raises( AssertionError ):
+    assert model.out == 0b1001
+
+#-----------------------------------------------------------------------
+# ChainedBlocks
+#-----------------------------------------------------------------------
+# Blocks are defined in reverse dependency order, the static schedule
+# should still evaluate them in a single pass.
+class ChainedBlocks( Model ):
+  def __init__( s ):
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.tmp  = Wire[3]( 8 )
+
+    @s.combinational
+    def stage3():
+      s.out.value = s.tmp[2] + 1
+
+    @s.combinational
+    def stage2():
+      s.tmp[2].value = s.tmp[1] + 1
+
+    @s.combinational
+    def stage1():
+      s.tmp[1].value = s.tmp[0] + 1
+
+    @s.combinational
+    def stage0():
+      s.tmp[0].value = s.in_ + 1
+
+    s.stage_names = [ 'stage0', 'stage1', 'stage2', 'stage3' ]
+
+def test_ChainedBlocks():
+  model, sim = local_setup_sim( ChainedBlocks() )
+  names = [ func.func_name for func in sim._static_schedule ]
+  assert names == model.stage_names
+  for i in range( 10 ):
+    model.in_.value = i
+    sim.eval_combinational()
+    assert model.out == i + 4
+
+#-----------------------------------------------------------------------
+# CombLoop
+#-----------------------------------------------------------------------
+# Blocks forming a combinational loop (through a submodule) are grouped
+# into a single entry of the schedule evaluated with the event queue.
+def test_CombLoop():
+  model, sim = local_setup_sim( WriteThenReadCombSubmod( 16 ) )
+  assert len( sim._static_schedule ) == 1
+  for i in range( 10 ):
+    model.in_.v = i
+    sim.cycle()
+    assert model.out == i
+
+#-----------------------------------------------------------------------
+# UnknownWrites
+#-----------------------------------------------------------------------
+# Writes through aliases cannot be resolved, the simulator should fall
+# back to the event queue.
+class UnknownWrites( Model ):
+  def __init__( s ):
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+
+    @s.combinational
+    def logic():
+      out = s.out
+      out.value = s.in_
+
+def test_UnknownWrites():
+  with warnings.catch_warnings():
+    warnings.simplefilter( 'ignore' )
+    model, sim = local_setup_sim( UnknownWrites() )
+  assert sim._static_schedule is None
+  model.in_.value = 7
+  sim.eval_combinational()
+  assert model.out == 7
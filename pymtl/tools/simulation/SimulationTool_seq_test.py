@@ -475,3 +475,245 @@ def test_GetMSB( setup_sim ):
   model.in_.value = 0b10000; sim.cycle(); assert model.out == 1
   model.in_.value = 0b00001; sim.cycle(); assert model.out == 0
 
+
+#-----------------------------------------------------------------------
+# GeneratedCycle
+#-----------------------------------------------------------------------
+# Registers internal to the design are flopped by the generated cycle()
+# function, registers driving top-level ports use the register queue.
+def test_GeneratedCycle():
+  import StringIO
+  model = RegisterWrappedChain( 16 )
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  src = StringIO.StringIO()
+  sim.dump_generated_cycle( src )
+  src = src.getvalue()
+  for i in range( 3 ):
+    assert 'tick_{}()'.format( i ) in src
+  assert 'flop_1' in src
+  assert 'flop_2' not in src
+
+  sim.reset()
+  for i in range( 10 ):
+    model.in_.value = i
+    sim.cycle()
+    assert model.out == max( i - 2, 0 )
+
+#-----------------------------------------------------------------------
+# BlockInfoCache
+#-----------------------------------------------------------------------
+# The source of a block shared by several instances is only parsed once.
+def test_BlockInfoCache( monkeypatch ):
+  from pymtl.tools.simulation import sim_utils
+
+  parsed = []
+  def get_method_ast( func ):
+    parsed.append( func.func_code )
+    return orig_get_method_ast( func )
+
+  orig_get_method_ast = sim_utils.get_method_ast
+  monkeypatch.setattr( sim_utils, 'get_method_ast', get_method_ast )
+  monkeypatch.setattr( sim_utils, '_block_cache',   {} )
+
+  model = RegisterWrappedChain( 16 )
+  model.elaborate()
+  sim   = SimulationTool( model )
+  assert len( parsed ) == 1
+
+  sim.reset()
+  for i in range( 10 ):
+    model.in_.value = i
+    sim.cycle()
+    assert model.out == max( i - 2, 0 )
+
+#-----------------------------------------------------------------------
+# Run
+#-----------------------------------------------------------------------
+class Counter( Model ):
+
+  checkpoint_stateless = True
+
+  def __init__( s, nbits ):
+    s.out = OutPort( nbits )
+
+    @s.posedge_clk
+    def logic():
+      if s.reset: s.out.next = 0
+      else:       s.out.next = s.out + 1
+
+def test_Run( setup_sim ):
+  model      = Counter( 16 )
+  model, sim = setup_sim( model )
+  sim.reset()
+
+  # Run for a fixed number of cycles
+
+  stats = sim.run( 10 )
+  assert stats.cycles == 10
+  assert model.out    == 10
+
+  # Run until a predicate is true, checked every cycle
+
+  stats = sim.run( until=lambda: model.out == 15 )
+  assert stats.cycles == 5
+  assert model.out    == 15
+
+  # Checking every 4 cycles rewinds the batch where the predicate became
+  # true and stops at the exact cycle
+
+  stats = sim.run( until=lambda: model.out >= 17, check_every=4 )
+  assert stats.cycles == 2
+  assert model.out    == 17
+
+  # The cycle limit has priority over checking the predicate
+
+  stats = sim.run( 3, until=lambda: model.out == 100, check_every=4 )
+  assert stats.cycles == 3
+  assert model.out    == 20
+
+  # The predicate is checked after the last batch, cut by the limit
+
+  stats = sim.run( 6, until=lambda: model.out >= 22, check_every=4 )
+  assert stats.cycles == 2
+  assert model.out    == 22
+
+  stats = sim.run( 3, until=lambda: model.out >= 24, check_every=4 )
+  assert stats.cycles == 2
+  assert model.out    == 24
+
+  with pytest.raises( ValueError ):
+    sim.run()
+
+#-----------------------------------------------------------------------
+# RunPythonState
+#-----------------------------------------------------------------------
+# Models keeping state in Python attributes are only rewound by run()
+# if they save it with checkpoint_state(), the predicate is checked
+# every cycle otherwise.
+class PythonCounter( Model ):
+  def __init__( s ):
+    s.out   = OutPort( 16 )
+    s.count = 0
+
+    @s.tick
+    def logic():
+      s.count   += 1
+      s.out.next = s.count
+
+class SavedPythonCounter( PythonCounter ):
+
+  def checkpoint_state( s ):
+    return s.count
+
+  def restore_state( s, state ):
+    s.count = state
+
+@pytest.mark.parametrize( 'model_type', [ PythonCounter, SavedPythonCounter ] )
+def test_RunPythonState( setup_sim, model_type ):
+  model, sim = setup_sim( model_type() )
+  sim.reset()
+
+  stats = sim.run( until=lambda: model.out >= 5, check_every=8 )
+  assert stats.cycles == 3
+  assert model.out    == 5 and model.count == 5
+
+#-----------------------------------------------------------------------
+# RunSkipIdle
+#-----------------------------------------------------------------------
+# Increments its output every period cycles. The countdown is kept in a
+# Python attribute, and a generator-based @tick_fl block does the same
+# by sleeping (it is called again the cycle after it returns).
+class PeriodicCounter( Model ):
+  def __init__( s, period ):
+    s.out    = OutPort( 16 )
+    s.fl_out = OutPort( 16 )
+    s.count  = period
+    s.nticks = 0
+
+    @s.tick
+    def logic():
+      s.nticks += 1
+      s.count  -= 1
+      if s.count == 0:
+        s.count     = period
+        s.out.next  = s.out + 1
+      elif s.count > 1:
+        s.idle( s.count - 1 )
+
+    @s.tick_fl
+    def fl_logic():
+      yield period - 1
+      s.fl_out.next = s.fl_out + 1
+
+  def skip_cycles( s, ncycles ):
+    s.count -= ncycles
+
+def test_RunSkipIdle():
+  model = PeriodicCounter( 10 )
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  stats = sim.run( 95, skip_idle=True )
+  assert stats.cycles == 95 and sim.ncycles == 95
+  assert model.out == 9 and model.fl_out == 9
+  assert model.nticks < 40
+
+  # The design is not idle when it stops at the cycle limit
+
+  stats = sim.run( 10, skip_idle=True )
+  assert model.out == 10 and model.fl_out == 10
+
+  # Cycles are not skipped while collecting metrics
+
+  model = PeriodicCounter( 10 )
+  model.elaborate()
+  sim   = SimulationTool( model, collect_metrics=True )
+  sim.run( 95, skip_idle=True )
+  assert model.out == 9 and model.nticks == 95
+
+#-----------------------------------------------------------------------
+# FlopDedup
+#-----------------------------------------------------------------------
+# Nets are only queued once per cycle no matter how many times .next is
+# written, and unchanged nets do not wake up combinational blocks.
+class FlopDedup( Model ):
+  def __init__( s ):
+    s.in_    = InPort ( 8 )
+    s.out    = OutPort( 8 )
+    s.reg    = Wire   ( 8 )
+    s.nevals = 0
+
+    @s.posedge_clk
+    def seq():
+      s.reg.next = 0
+      s.reg.next = s.in_
+
+    @s.combinational
+    def comb():
+      s.out.value = s.reg
+      s.nevals   += 1
+
+def test_FlopDedup():
+  model = FlopDedup()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  model.in_.next = 1
+  model.in_.next = 2
+  assert len( sim._register_queue ) == 1
+
+  sim.cycle()
+  assert model.in_ == 2
+  assert model.out == 0
+  sim.cycle()
+  assert model.out == 2
+  assert not sim._register_queue
+  assert not model.in_._flop_pending
+
+  nevals = model.nevals
+  for i in range( 5 ):
+    sim.cycle()
+  assert model.out    == 2
+  assert model.nevals == nevals
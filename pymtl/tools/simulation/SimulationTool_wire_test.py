@@ -381,3 +381,52 @@ def test_WireToWire2( setup_sim ):
   model, sim = setup_sim( model )
   for i in range( 10 ):
     model.in_.value = i; sim.cycle(); assert model.out == i
+
+#-----------------------------------------------------------------------
+# SliceFanout
+#-----------------------------------------------------------------------
+# Slices of a single net are gathered and scattered by one compiled
+# callback, which only runs when the source net changes.
+class SliceFanout( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 16 )
+    s.lo  = OutPort( 8 )
+    s.hi  = OutPort( 8 )
+    s.mid = OutPort( 4 )
+    s.out = OutPort( 16 )
+
+    s.connect( s.in_[ 0: 8], s.lo       )
+    s.connect( s.in_[ 8:16], s.hi       )
+    s.connect( s.in_[ 6:10], s.mid      )
+    s.connect( s.lo,         s.out[8:16] )
+    s.connect( s.hi,         s.out[0: 8] )
+
+def test_SliceFanout( setup_sim ):
+  model, sim = setup_sim( SliceFanout() )
+  sim.reset()
+
+  # Count the calls of the compiled slice callbacks of in_, lo and hi
+
+  ncalls = [ 0 ]
+  def counted( func ):
+    def slice_cb():
+      ncalls[0] += 1
+      func()
+    return slice_cb
+
+  for net in [ model.in_, model.lo, model.hi ]:
+    net._slices = [ counted( f ) if f.__name__ == 'slice_cb' else f
+                    for f in net._slices ]
+
+  # One callback for in_ plus one for each of lo and hi when they change
+
+  for value, expected in [ ( 0x1234, 3 ), ( 0xabcd, 3 ), ( 0xab00, 2 ),
+                           ( 0xab00, 0 ) ]:
+    ncalls[0] = 0
+    model.in_.value = value
+    sim.cycle()
+    assert model.lo  == value & 0xff
+    assert model.hi  == value >> 8
+    assert model.mid == ( value >> 6 ) & 0xf
+    assert model.out == ( value & 0xff ) << 8 | value >> 8
+    assert ncalls[0] == expected
@@ -185,12 +185,22 @@ class DetectDecorators( ast.NodeVisitor ):
 # block.  Load detection is useful for generating the sensitivity list
 # for @combinational blocks in the Simulator.  Store detection is useful
 # for determining 'reg' type variables during Verilog translation.
+#
+# If const_index is True, constant integer indexes are kept in the names
+# (e.g., s.a[2]) instead of being replaced with [?]. This is useful when
+# a precise list of loads and stores is needed (e.g., static scheduling).
+#
+# For each load, load_ranges holds the ( start, stop ) bit range read
+# if the load is an index or slice with constant bounds (e.g., s.a[3]
+# or s.a[0:8], both named s.a[?]), and None otherwise.
 class DetectLoadsAndStores( ast.NodeVisitor ):
 
-  def __init__( self ):
-    self.assign = False
-    self.load   = [ ]
-    self.store  = [ ]
+  def __init__( self, const_index = False ):
+    self.assign      = False
+    self.load        = [ ]
+    self.load_ranges = [ ]
+    self.store       = [ ]
+    self.const_index = const_index
 
   def enter( self, node ):
     self.visit( node )
@@ -221,7 +231,7 @@ class DetectLoadsAndStores( ast.NodeVisitor ):
   def visit_Attribute( self, node ):
     if not self.assign: return
     if   isinstance( node.ctx, _ast.Load ):
-      self.load  += [ GetVariableName( self ).visit( node ) ]
+      self._add_load( GetVariableName( self ).visit( node ) )
     elif isinstance( node.ctx, _ast.Store ):
       self.store += [ GetVariableName( self ).visit( node ) ]
     else:
@@ -231,7 +241,7 @@ class DetectLoadsAndStores( ast.NodeVisitor ):
   def visit_Name( self, node ):
     if not self.assign: return
     if   isinstance( node.ctx, _ast.Load ):
-      self.load  += [ GetVariableName( self ).visit( node ) ]
+      self._add_load( GetVariableName( self ).visit( node ) )
     elif isinstance( node.ctx, _ast.Store ):
       self.store += [ GetVariableName( self ).visit( node ) ]
     else:
@@ -241,13 +251,18 @@ class DetectLoadsAndStores( ast.NodeVisitor ):
   def visit_Subscript( self, node ):
     if not self.assign: return
     if   isinstance( node.ctx, _ast.Load ):
-      self.load  += [ GetVariableName( self ).visit( node ) ]
+      name = GetVariableName( self ).visit( node )
+      self._add_load( name, _const_range( node.slice ) )
     elif isinstance( node.ctx, _ast.Store ):
       self.store += [ GetVariableName( self ).visit( node ) ]
     else:
       print( type( node.ctx ) )
       raise Exception( "Unsupported concurrent block code!" )
 
+  def _add_load( self, name, load_range = None ):
+    self.load        += [ name ]
+    self.load_ranges += [ load_range ]
+
   # TODO: need this to detect writes to bit slices?
   #def visit_Subscript( self, node ):
   #  if not self.assign: return
@@ -260,6 +275,32 @@ class DetectLoadsAndStores( ast.NodeVisitor ):
   #    raise Exception( "Unsupported concurrent block code!" )
 
 
+#------------------------------------------------------------------------
+# _const_range
+#------------------------------------------------------------------------
+# Returns the ( start, stop ) range of an index or slice with constant
+# bounds, where start or stop is None if the slice is open on that side.
+# Returns None for any other index.
+def _const_range( node ):
+
+  def const( node ):
+    if node is None:                                  return None, True
+    if isinstance( node, ast.Num ) and node.n >= 0:   return node.n, True
+    return None, False
+
+  if isinstance( node, ast.Index ):
+    index, ok = const( node.value )
+    if ok and index is not None:
+      return index, index + 1
+
+  elif isinstance( node, ast.Slice ) and node.step is None:
+    ( start, start_ok ), ( stop, stop_ok ) = const( node.lower ), \
+                                             const( node.upper )
+    if start_ok and stop_ok:
+      return start, stop
+
+  return None
+
 #------------------------------------------------------------------------
 # GetVariableName
 #------------------------------------------------------------------------
@@ -277,6 +318,10 @@ class GetVariableName( ast.NodeVisitor ):
 
   def visit_Subscript( self, node ):
     self.parent.visit( node.slice )
+    if ( getattr( self.parent, 'const_index', False ) and
+         isinstance( node.slice, ast.Index ) and
+         isinstance( node.slice.value, ast.Num ) ):
+      return self.visit( node.value ) + '[{}]'.format( node.slice.value.n )
     # insert eval here to test for type...
     return self.visit( node.value ) + '[?]'
 
@@ -81,6 +81,17 @@ def test_rd_bit_idx_slice_var():
   def rd_bit_idx_slice_var( s ):
     s.out.v = s.a.v[ s.s0:s.s1 ]
 
+def test_rd_bit_idx_ranges():
+  def rd_bit_idx_ranges( s ):
+    s.out.v = s.a[ 3 ] + s.b[ 4:8 ] + s.c[ :2 ] + s.d[ s.e ] + s.f.g
+  tree, src = get_method_ast( rd_bit_idx_ranges )
+  visitor   = DetectLoadsAndStores()
+  load, store = visitor.enter( tree )
+  assert zip( load, visitor.load_ranges ) == \
+         [ ( 's.a[?]', ( 3, 4 ) ), ( 's.b[?]', ( 4, 8 ) ),
+           ( 's.c[?]', ( None, 2 ) ), ( 's.e', None ), ( 's.d[?]', None ),
+           ( 's.f.g', None ) ]
+
 def test_wr_bit_idx_const():
   @check_ast( ['s.in0', 's.in1'], ['s.out.v[?]'] )
   def wr_bit_idx_const( s ):
@@ -0,0 +1,273 @@
+#=======================================================================
+# checkpoint.py
+#=======================================================================
+# Checkpoint/restore support for SimulationTool.
+#
+# A checkpoint file has the following layout:
+#
+#   header   magic, format version, number of nets, number of 64-bit
+#            words in each of the value sections, length of the metadata
+#            (32 bytes)
+#   values   current value of every Bits net, as little-endian 64-bit
+#            words (ceil(nbits/64) words per net)
+#   next     shadow (.next) value of every Bits net, same layout
+#   pending  one byte per net, set if the net is queued for flopping
+#   metadata pickle with the net names and widths (used to check the
+#            checkpoint matches the model), the cycle counts of the
+#            simulator and of its FL scheduler, nets which are not Bits,
+#            and the Python-side state of every model
+#
+# Nets are stored in the order of their hierarchical names, so the offset
+# of every net in the file only depends on the design. The file is
+# mmap'ed when it is restored, the value and next sections are decoded
+# in place without reading the file into memory first.
+#
+# The same contents can be kept in memory with dumps_checkpoint() and
+# loads_checkpoint(), which SimulationTool.run() uses to rewind the
+# simulation to the start of a batch of cycles.
+#
+# Python-side state is saved by calling the checkpoint_state() method of
+# every model in the hierarchy, and restored by calling restore_state()
+# with the returned value. Bits (and BitStruct) values in the saved state
+# are pickled by value.
+
+import mmap
+import os
+import struct
+
+from pymtl.datatypes.Bits import Bits
+from pymtl.model.Model    import Model
+from sim_utils            import ( get_named_models, get_named_nets,
+                                  pickle_dumps, pickle_loads )
+
+MAGIC   = 'PYMTLCKP'
+VERSION = 2
+
+_header = struct.Struct( '<8sIIQQ' )
+
+#-----------------------------------------------------------------------
+# CheckpointError
+#-----------------------------------------------------------------------
+class CheckpointError( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# save_checkpoint
+#-----------------------------------------------------------------------
+def save_checkpoint( sim, path ):
+
+  data = dumps_checkpoint( sim )
+
+  # Write to a temporary file first so a failed checkpoint never
+  # clobbers an existing one
+
+  tmp_path = path + '.tmp'
+  with open( tmp_path, 'wb' ) as f:
+    f.write( data )
+  os.rename( tmp_path, path )
+
+#-----------------------------------------------------------------------
+# dumps_checkpoint
+#-----------------------------------------------------------------------
+# Returns the contents of a checkpoint file as a string, which can also
+# be kept in memory and restored with loads_checkpoint().
+def dumps_checkpoint( sim ):
+
+  _check_fl_blocks( sim.model )
+
+  nets   = get_named_nets( sim )
+  models = get_named_models( sim.model )
+
+  bits   = [ ( name, svalue ) for name, svalue in nets
+                              if isinstance( svalue, Bits ) ]
+  other  = dict( ( name, svalue ) for name, svalue in nets
+                                  if not isinstance( svalue, Bits ) )
+
+  values, next_values, pending = [], [], []
+  for name, svalue in bits:
+    nwords = _nwords( svalue.nbits )
+    values     .extend( _to_words( svalue._uint,       nwords ) )
+    next_values.extend( _to_words( svalue._next._uint, nwords ) )
+    pending.append( '\x01' if svalue._flop_pending else '\x00' )
+
+  state = {}
+  for name, model in models:
+    model_state = model.checkpoint_state()
+    if model_state is not None:
+      state[ name ] = model_state
+
+  meta = pickle_dumps( {
+    'model'      : type( sim.model ).__name__,
+    'nets'       : [ ( name, svalue.nbits ) for name, svalue in bits ],
+    'ncycles'    : sim.ncycles,
+    'fl_ncycles' : sim._fl_scheduler.ncycles,
+    'other'      : dict( ( name, ( x._data, x._next._data ) )
+                         for name, x in other.items() ),
+    'pending'    : [ name for name, x in other.items()
+                     if x._flop_pending ],
+    'state'      : state,
+  } )
+
+  return ''.join( [
+    _header.pack( MAGIC, VERSION, len( bits ), len( values ), len( meta ) ),
+    struct.pack( '<{}Q'.format( len( values ) ), *values ),
+    struct.pack( '<{}Q'.format( len( values ) ), *next_values ),
+    ''.join( pending ),
+    meta,
+  ] )
+
+#-----------------------------------------------------------------------
+# load_checkpoint
+#-----------------------------------------------------------------------
+def load_checkpoint( sim, path ):
+
+  with open( path, 'rb' ) as f:
+    if os.fstat( f.fileno() ).st_size < _header.size:
+      raise CheckpointError( "{} is not a PyMTL checkpoint".format( path ) )
+    data = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+
+  try:
+    loads_checkpoint( sim, data, path )
+  finally:
+    data.close()
+
+#-----------------------------------------------------------------------
+# loads_checkpoint
+#-----------------------------------------------------------------------
+# Restores the state of sim from the contents of a checkpoint file, in a
+# string or a memory map. The name is only used in error messages.
+def loads_checkpoint( sim, data, name='<memory>' ):
+
+  magic, version, nnets, nwords, meta_len = \
+    _header.unpack_from( data, 0 )
+
+  if magic != MAGIC:
+    raise CheckpointError( "{} is not a PyMTL checkpoint".format( name ) )
+  if version != VERSION:
+    raise CheckpointError( "{} has unsupported checkpoint version {}"
+                           .format( name, version ) )
+
+  offset      = _header.size
+  values      = struct.unpack_from( '<{}Q'.format( nwords ), data, offset )
+  offset     += 8 * nwords
+  next_values = struct.unpack_from( '<{}Q'.format( nwords ), data, offset )
+  offset     += 8 * nwords
+  pending     = data[ offset:offset+nnets ]
+  offset     += nnets
+
+  nets   = get_named_nets( sim )
+  bits   = [ ( name, svalue ) for name, svalue in nets
+                              if isinstance( svalue, Bits ) ]
+  other  = dict( ( name, svalue ) for name, svalue in nets
+                                  if not isinstance( svalue, Bits ) )
+
+  # BitStruct values in the metadata are recreated with the classes of
+  # the nets of the model
+
+  classes = dict( ( type( x ).__name__, type( x ) ) for name, x in bits
+                  if type( x ) is not Bits )
+  meta    = pickle_loads( data[ offset:offset+meta_len ], classes )
+
+  # Check the checkpoint was created for the same design. The class_name
+  # of a model is not used since it hashes arguments such as message
+  # lists and submodel instances, instead differences in parameters are
+  # caught by comparing the nets.
+
+  model_name = type( sim.model ).__name__
+
+  if meta[ 'model' ] != model_name:
+    raise CheckpointError( "checkpoint was created for model {}, not {}"
+                           .format( meta[ 'model' ], model_name ) )
+  if meta[ 'nets' ] != [ ( name, x.nbits ) for name, x in bits ] or \
+     sorted( meta[ 'other' ] ) != sorted( other ):
+    raise CheckpointError( "checkpoint does not match the nets of model {}"
+                           .format( model_name ) )
+
+  # Restore net state
+
+  del sim._register_queue[:]
+
+  i = 0
+  for ( name, svalue ), flag in zip( bits, pending ):
+    n = _nwords( svalue.nbits )
+    svalue._uint       = _from_words( values     [ i:i+n ] )
+    svalue._next._uint = _from_words( next_values[ i:i+n ] )
+    svalue._flop_pending = flag != '\x00'
+    if svalue._flop_pending:
+      sim._register_queue.append( svalue )
+    if svalue._callback_masks:
+      svalue._sense_prev = svalue._uint
+    i += n
+
+  for name, ( value, next_value ) in meta[ 'other' ].items():
+    svalue = other[ name ]
+    svalue.write_value( value )
+    svalue.write_next ( next_value )
+    svalue._flop_pending = name in meta[ 'pending' ]
+    if svalue._flop_pending:
+      sim._register_queue.append( svalue )
+
+  sim.ncycles = meta[ 'ncycles' ]
+  sim._fl_scheduler.ncycles = meta[ 'fl_ncycles' ]
+
+  # Restore Python-side state
+
+  state = meta[ 'state' ]
+  for name, model in get_named_models( sim.model ):
+    if name in state:
+      model.restore_state( state[ name ] )
+
+#-----------------------------------------------------------------------
+# saves_all_state
+#-----------------------------------------------------------------------
+# Returns True if a checkpoint saves the whole state of the design: every
+# model implements checkpoint_state() and restore_state(), is declared
+# checkpoint_stateless, or has no blocks at all (e.g., a structural
+# wrapper). The Python attributes of other models are not saved.
+def saves_all_state( model ):
+
+  for name, m in get_named_models( model ):
+    cls       = type( m )
+    saved     = cls.checkpoint_state.im_func is not \
+                  Model.checkpoint_state.im_func and \
+                cls.restore_state.im_func is not Model.restore_state.im_func
+    has_state = m.get_tick_blocks() or m.get_posedge_clk_blocks() or \
+                m.get_combinational_blocks()
+    if has_state and not saved and not cls.checkpoint_stateless:
+      return False
+
+  return True
+
+#-----------------------------------------------------------------------
+# _check_fl_blocks
+#-----------------------------------------------------------------------
+# A @tick_fl block paused in the middle of a tick (e.g., waiting on a
+# queue) keeps its state in a greenlet or in generators, which cannot be
+# saved.
+def _check_fl_blocks( model ):
+  for name, m in get_named_models( model ):
+    for func in m.get_tick_blocks():
+      gr   = getattr( func, '_pausable_tick', None )
+      task = getattr( func, '_fl_task',       None )
+      if gr is not None and gr.gr_frame is not None and \
+         gr.gr_frame.f_code.co_name != 'inner_wrapper' or \
+         task is not None and task.stack:
+        raise CheckpointError( "cannot checkpoint {} while @tick_fl block "
+                               "{} is paused".format( name, func.__name__ ) )
+
+#-----------------------------------------------------------------------
+# Value encoding
+#-----------------------------------------------------------------------
+
+def _nwords( nbits ):
+  return ( nbits + 63 ) // 64
+
+def _to_words( value, nwords ):
+  return [ ( value >> ( 64 * i ) ) & 0xffffffffffffffff
+           for i in range( nwords ) ]
+
+def _from_words( words ):
+  value = 0
+  for i, word in enumerate( words ):
+    value |= word << ( 64 * i )
+  return value
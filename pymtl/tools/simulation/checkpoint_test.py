@@ -0,0 +1,162 @@
+#=======================================================================
+# checkpoint_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl import *
+
+from checkpoint                 import CheckpointError
+from pclib.rtl.queues           import NormalQueue
+from pclib.test                 import TestRandomDelay
+from pclib.test.TestSrcSinkSim  import TestSrcSinkHarness
+from pclib.test.TestMemory_test import TestHarness, stream_msgs
+
+#-----------------------------------------------------------------------
+# run_traces
+#-----------------------------------------------------------------------
+# Runs the simulator until the model is done, returning the line trace of
+# every cycle.
+def run_traces( sim, model ):
+  traces = []
+  while not model.done() and sim.ncycles < 1000:
+    traces.append( ( sim.ncycles, model.line_trace() ) )
+    sim.cycle()
+  assert model.done()
+  return traces
+
+#-----------------------------------------------------------------------
+# restore_tester
+#-----------------------------------------------------------------------
+# Checkpoints the simulation after ncycles, and checks that simulating a
+# restored copy of the design behaves exactly like continuing the
+# original simulation.
+def restore_tester( tmpdir, create_model, ncycles ):
+
+  path  = str( tmpdir.join( 'sim.ckpt' ) )
+
+  model = create_model()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+  sim.run( ncycles )
+  sim.checkpoint( path )
+
+  expected = run_traces( sim, model )
+
+  model = create_model()
+  model.elaborate()
+  sim   = SimulationTool.restore( model, path )
+
+  assert sim.ncycles == ncycles + 2
+  assert run_traces( sim, model ) == expected
+
+#-----------------------------------------------------------------------
+# test_SrcSink
+#-----------------------------------------------------------------------
+# Source and sink with random delays around another random delay.
+def test_SrcSink( tmpdir ):
+
+  msgs = [ Bits( 8, i ) for i in range( 20 ) ]
+
+  def create_model():
+    return TestSrcSinkHarness( TestRandomDelay( 8, 4 ), msgs, msgs, 3, 5 )
+
+  restore_tester( tmpdir, create_model, 17 )
+
+#-----------------------------------------------------------------------
+# test_TestMemory
+#-----------------------------------------------------------------------
+# Memory requests and responses (BitStructs) buffered in the adapters of
+# the test memory, and the memory contents.
+def test_TestMemory( tmpdir ):
+
+  msgs = stream_msgs( 0x1000 )
+
+  def create_model():
+    return TestHarness( 1, [ msgs[::2] ], [ msgs[1::2] ], 0.5, 3, 2, 2 )
+
+  restore_tester( tmpdir, create_model, 43 )
+
+#-----------------------------------------------------------------------
+# test_RunRewind
+#-----------------------------------------------------------------------
+# SimulationTool.run() with check_every > 1 rewinds to the start of the
+# batch where the design became done, using in-memory checkpoints, and
+# stops at the same cycle as when checking every cycle.
+@pytest.mark.parametrize( 'check_every', [ 4, 16, 1000 ] )
+def test_RunRewind( check_every ):
+
+  msgs = stream_msgs( 0x1000 )
+
+  def run( check_every ):
+    model = TestHarness( 1, [ msgs[::2] ], [ msgs[1::2] ], 0.5, 3, 2, 2 )
+    model.elaborate()
+    sim   = SimulationTool( model )
+    sim.reset()
+    stats = sim.run( until=model.done, check_every=check_every )
+    return stats.cycles, sim.ncycles, model.line_trace()
+
+  assert run( check_every ) == run( 1 )
+
+#-----------------------------------------------------------------------
+# test_Mismatch
+#-----------------------------------------------------------------------
+def test_Mismatch( tmpdir ):
+
+  path  = str( tmpdir.join( 'sim.ckpt' ) )
+
+  model = NormalQueue( 2, 8 )
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+  sim.checkpoint( path )
+
+  model = NormalQueue( 2, 16 )
+  model.elaborate()
+  with pytest.raises( CheckpointError ):
+    SimulationTool.restore( model, path )
+
+  model = NormalQueue( 4, 8 )
+  model.elaborate()
+  with pytest.raises( CheckpointError ):
+    SimulationTool.restore( model, path )
+
+  with open( path, 'wb' ) as f:
+    f.write( 'not a checkpoint' + '\0' * 32 )
+  with pytest.raises( CheckpointError ):
+    SimulationTool.restore( model, path )
+
+#-----------------------------------------------------------------------
+# test_FLScheduler
+#-----------------------------------------------------------------------
+# The cycle count of the FL scheduler, which wakes up sleeping blocks,
+# is restored along with the cycle count of the simulator.
+class Register( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 8 )
+    s.out = OutPort( 8 )
+
+    @s.tick_fl
+    def logic():
+      s.out.next = s.in_
+      if s.in_ == 0xff:
+        yield 2
+
+def test_FLScheduler( tmpdir ):
+
+  path  = str( tmpdir.join( 'sim.ckpt' ) )
+
+  model = Register()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  model.in_.value = 3
+  sim.run( 5 )
+  sim.checkpoint( path )
+
+  model = Register()
+  model.elaborate()
+  sim   = SimulationTool.restore( model, path )
+
+  assert ( sim.ncycles, sim._fl_scheduler.ncycles ) == ( 5, 5 )
+  assert model.out == 3
@@ -0,0 +1,292 @@
+#=======================================================================
+# fl_scheduler.py
+#=======================================================================
+# Generator-based execution of @tick_fl blocks.
+#
+# A @tick_fl block containing a yield statement is run as a coroutine by
+# an FLScheduler instead of inside a greenlet. The block is called once
+# to create a generator, which is resumed by the scheduler every cycle
+# until it finishes. The block is then called again at the next cycle,
+# so that, just like a greenlet-based block, it runs at most once per
+# cycle. The value yielded by the generator tells the scheduler when to
+# resume it:
+#
+#   yield             resume at the next cycle
+#   yield n           resume in n cycles
+#   yield pred        resume at the first cycle where pred() is true
+#   yield gen         run the coroutine gen, resume with its result
+#   yield wait_until( signal, pred )
+#                     resume at the first cycle where pred( signal ) is
+#                     true, see wait_until()
+#
+# Python 2 generators cannot return a value, so coroutines return one
+# to their caller with raise Return( value ).
+#
+#   @s.tick_fl
+#   def logic():
+#     msg = yield s.in_q.co_popleft()
+#     yield s.out_q.co_append( msg )
+#
+# Coroutines which are sleeping or waiting on a predicate are not
+# resumed until they are ready, and the scheduler itself is a single
+# sequential block, so blocked coroutines do not cost a switch per
+# cycle. Coroutines waiting with wait_until() cost nothing at all until
+# the net they wait on changes.
+
+import heapq
+import operator
+import sys
+import types
+
+from ...datatypes.Bits import BitSlice
+
+_get_index = operator.attrgetter( 'index' )
+
+#-----------------------------------------------------------------------
+# Return
+#-----------------------------------------------------------------------
+class Return( Exception ):
+  def __init__( self, value=None ):
+    self.value = value
+
+#-----------------------------------------------------------------------
+# wait_until
+#-----------------------------------------------------------------------
+# Returns a condition for a coroutine to yield, which resumes it at the
+# first cycle where pred( signal ) is true, or where the signal is true
+# if no predicate is given:
+#
+#   yield wait_until( s.in_.val )
+#   yield wait_until( s.count, lambda x: x >= 4 )
+#
+# Instead of evaluating the predicate every cycle, the coroutine is
+# parked on the net of the signal and the predicate is only evaluated
+# again after the net changed, so the predicate must only depend on the
+# value of the signal. The signal can also be a slice or a field of a
+# net.
+def wait_until( signal, pred=None ):
+  return WaitUntil( signal, pred )
+
+#-----------------------------------------------------------------------
+# WaitUntil
+#-----------------------------------------------------------------------
+class WaitUntil( object ):
+
+  def __init__( self, signal, pred=None ):
+
+    # Find the net of slices (including BitStruct fields) of a net.
+    # Slices keep a copy of the bits of the net, so they are recreated
+    # to evaluate the predicate.
+
+    net    = signal
+    offset = 0
+    while isinstance( net, BitSlice ):
+      offset += net._offset
+      net     = net._target_bits
+
+    if not hasattr( net, '_slices' ):
+      raise TypeError( "cannot wait until {!r} changes, it is not a signal"
+                       .format( signal ) )
+
+    self.net  = net
+    self.pred = pred or bool
+    if net is signal:
+      self.get = lambda: net
+    else:
+      bits     = slice( offset, offset + signal.nbits )
+      self.get = lambda: net[ bits ]
+
+  def is_true( self ):
+    return self.pred( self.get() )
+
+#-----------------------------------------------------------------------
+# FLTask
+#-----------------------------------------------------------------------
+# The state of a generator-based @tick_fl block: the block and the stack
+# of coroutines it is running. The stack is empty between two calls of
+# the block.
+class FLTask( object ):
+
+  def __init__( self, func, index ):
+    self.func  = func
+    self.index = index
+    self.stack = []
+
+  def __repr__( self ):
+    return 'FLTask({})'.format( self.func.__name__ )
+
+#-----------------------------------------------------------------------
+# FLScheduler
+#-----------------------------------------------------------------------
+class FLScheduler( object ):
+
+  def __init__( self ):
+    self.tasks    = []
+    self.ncycles  = 0
+    self._ready   = []
+    self._waiting = []  # ( pred, task ) tuples
+    self._timers  = []  # heap of ( wake cycle, index, task ) tuples
+    self._parked  = {}  # id( net ) -> _ParkedTasks
+    self._changed = []  # _ParkedTasks of the nets which changed
+
+  #---------------------------------------------------------------------
+  # add
+  #---------------------------------------------------------------------
+  # Registers a generator function as a @tick_fl block, which is first
+  # called at the next cycle.
+  def add( self, func ):
+    task = FLTask( func, len( self.tasks ) )
+    self.tasks.append( task )
+    self._ready.append( task )
+    return task
+
+  #---------------------------------------------------------------------
+  # tick_coroutines
+  #---------------------------------------------------------------------
+  # Sequential block resuming all coroutines ready at this cycle, in the
+  # order the blocks were registered.
+  def tick_coroutines( self ):
+
+    self.ncycles += 1
+
+    ready = self._ready
+    woken = False
+
+    timers = self._timers
+    while timers and timers[0][0] <= self.ncycles:
+      ready.append( heapq.heappop( timers )[2] )
+      woken = True
+
+    waiting = self._waiting
+    if waiting:
+      flags = [ pred() for pred, task in waiting ]
+      if any( flags ):
+        ready.extend( x[1] for x, flag in zip( waiting, flags ) if flag )
+        self._waiting = [ x for x, flag in zip( waiting, flags ) if not flag ]
+        woken = True
+
+    if self._changed:
+      changed, self._changed = self._changed, []
+      for parked in changed:
+        parked.changed = False
+        tasks = []
+        for cond, task in parked.tasks:
+          if cond.is_true(): ready.append( task )
+          else:              tasks.append( ( cond, task ) )
+        if len( tasks ) != len( parked.tasks ):
+          woken = True
+          parked.tasks = tasks
+          if not tasks:
+            parked.remove()
+            del self._parked[ id( parked.net ) ]
+
+    if not ready:
+      return
+
+    # Tasks which did not wait are already in order
+
+    if woken:
+      ready.sort( key=_get_index )
+
+    self._ready = []
+    for task in ready:
+      self._resume( task )
+
+  #---------------------------------------------------------------------
+  # _resume
+  #---------------------------------------------------------------------
+  # Runs a task until its coroutines yield, or until the block returns.
+  # Exceptions raised by a coroutine are thrown into its caller.
+  def _resume( self, task ):
+
+    stack = task.stack
+    if not stack:
+      stack.append( task.func() )
+
+    gen   = stack[-1]
+    value = None
+    exc   = None
+    while True:
+
+      try:
+        if exc is None: cmd = gen.send( value )
+        else:           cmd = gen.throw( *exc )
+      except Return as e:
+        value, exc = e.value, None
+      except StopIteration:
+        value, exc = None, None
+      except Exception:
+        if len( stack ) == 1:
+          raise
+        value, exc = None, sys.exc_info()
+      else:
+
+        # The coroutine yielded
+
+        if cmd is None:
+          self._ready.append( task )
+        elif type( cmd ) is types.GeneratorType:
+          stack.append( cmd )
+          gen, value, exc = cmd, None, None
+          continue
+        elif type( cmd ) is WaitUntil:
+          self._park( task, cmd )
+        elif isinstance( cmd, ( int, long ) ) and cmd > 0:
+          heapq.heappush( self._timers,
+                          ( self.ncycles + cmd, task.index, task ) )
+        elif callable( cmd ):
+          self._waiting.append( ( cmd, task ) )
+        else:
+          raise TypeError( "@tick_fl block {} yielded {!r}, expected None, "
+                           "a number of cycles, a predicate or a generator"
+                           .format( task.func.__name__, cmd ) )
+        return
+
+      # The coroutine returned or raised, resume its caller. If the block
+      # itself returned, call it again at the next cycle.
+
+      stack.pop()
+      if not stack:
+        self._ready.append( task )
+        return
+      gen = stack[-1]
+
+  #---------------------------------------------------------------------
+  # _park
+  #---------------------------------------------------------------------
+  # Parks a task on the net of a wait_until() condition. The condition is
+  # evaluated at the next cycle if it is already true.
+  def _park( self, task, cond ):
+
+    parked = self._parked.get( id( cond.net ) )
+    if parked is None:
+      parked = self._parked[ id( cond.net ) ] = _ParkedTasks( self, cond.net )
+
+    parked.tasks.append( ( cond, task ) )
+    if cond.is_true():
+      parked.notify()
+
+#-----------------------------------------------------------------------
+# _ParkedTasks
+#-----------------------------------------------------------------------
+# Tasks parked on a net. While there are any, a callback is registered
+# with the callbacks the net calls each time its value changes (the same
+# list as the callbacks of slice connections), which flags the tasks to
+# be checked by the scheduler at the next cycle.
+class _ParkedTasks( object ):
+
+  def __init__( self, scheduler, net ):
+    self.net     = net
+    self.tasks   = []
+    self.changed = False
+
+    def notify():
+      if not self.changed:
+        self.changed = True
+        scheduler._changed.append( self )
+
+    self.notify = notify
+    net.register_slice( notify )
+
+  def remove( self ):
+    self.net._slices.remove( self.notify )
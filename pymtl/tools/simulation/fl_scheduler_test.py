@@ -0,0 +1,217 @@
+#=======================================================================
+# fl_scheduler_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl import *
+
+from fl_scheduler import FLScheduler, Return, wait_until
+
+#-----------------------------------------------------------------------
+# run
+#-----------------------------------------------------------------------
+# Ticks the scheduler for the given number of cycles.
+def run( scheduler, ncycles ):
+  for i in range( ncycles ):
+    scheduler.tick_coroutines()
+
+#-----------------------------------------------------------------------
+# test_yield
+#-----------------------------------------------------------------------
+# A block runs at most once per cycle, and yield pauses it until the
+# next cycle.
+def test_yield():
+
+  log = []
+  def block():
+    log.append( ( 'a', scheduler.ncycles ) )
+    yield
+    log.append( ( 'b', scheduler.ncycles ) )
+
+  scheduler = FLScheduler()
+  scheduler.add( block )
+  run( scheduler, 4 )
+  assert log == [ ( 'a', 1 ), ( 'b', 2 ), ( 'a', 3 ), ( 'b', 4 ) ]
+
+#-----------------------------------------------------------------------
+# test_sleep
+#-----------------------------------------------------------------------
+def test_sleep():
+
+  log = []
+  def block():
+    log.append( scheduler.ncycles )
+    yield 3
+
+  scheduler = FLScheduler()
+  scheduler.add( block )
+  run( scheduler, 10 )
+  assert log == [ 1, 5, 9 ]
+
+#-----------------------------------------------------------------------
+# test_predicate
+#-----------------------------------------------------------------------
+# Blocks waiting on a predicate are resumed at the first cycle where it
+# is true, in the order the blocks were registered.
+def test_predicate():
+
+  log   = []
+  flags = [ False ]
+
+  def waiter( name ):
+    def block():
+      yield lambda: flags[0]
+      log.append( ( name, scheduler.ncycles ) )
+      yield lambda: False
+    return block
+
+  scheduler = FLScheduler()
+  scheduler.add( waiter( 'x' ) )
+  scheduler.add( waiter( 'y' ) )
+  run( scheduler, 3 )
+  assert log == []
+
+  flags[0] = True
+  run( scheduler, 3 )
+  assert log == [ ( 'x', 4 ), ( 'y', 4 ) ]
+
+#-----------------------------------------------------------------------
+# test_wait_until
+#-----------------------------------------------------------------------
+# Blocks waiting on a signal are only checked again when it changes, and
+# are resumed at the first cycle where the condition is true.
+def test_wait_until():
+
+  log = []
+  sig = Bits( 8 )
+
+  checks = [ 0 ]
+  def is_three( x ):
+    checks[0] += 1
+    return x == 3
+
+  def block():
+    yield wait_until( sig, is_three )
+    log.append( ( 'a', scheduler.ncycles ) )
+    yield wait_until( sig[4:8] )
+    log.append( ( 'b', scheduler.ncycles ) )
+
+  scheduler = FLScheduler()
+  scheduler.add( block )
+  run( scheduler, 5 )
+  assert checks[0] == 1 and len( sig._slices ) == 1
+
+  # The signal changes back before the next cycle
+
+  sig.value = 3
+  sig.value = 2
+  run( scheduler, 1 )
+  assert log == [] and checks[0] == 2
+
+  sig.value = 3
+  run( scheduler, 2 )
+  assert log == [ ( 'a', 7 ) ]
+
+  # Waiting on a slice of the signal
+
+  sig.value = 0x13
+  run( scheduler, 1 )
+  assert log == [ ( 'a', 7 ), ( 'b', 9 ) ]
+  assert sig._slices == []
+
+#-----------------------------------------------------------------------
+# test_subcoroutines
+#-----------------------------------------------------------------------
+# Coroutines can call other coroutines, and get their return value.
+def test_subcoroutines():
+
+  def add( a, b ):
+    yield
+    raise Return( a + b )
+
+  def add3( a, b, c ):
+    x = yield add( a, b )
+    y = yield add( x, c )
+    raise Return( y )
+
+  log = []
+  def block():
+    result = yield add3( 1, 2, 3 )
+    log.append( ( result, scheduler.ncycles ) )
+    yield lambda: False
+
+  scheduler = FLScheduler()
+  scheduler.add( block )
+  run( scheduler, 5 )
+  assert log == [ ( 6, 3 ) ]
+
+#-----------------------------------------------------------------------
+# test_exceptions
+#-----------------------------------------------------------------------
+# Exceptions are thrown into the calling coroutine, and raised from the
+# scheduler if they are not caught.
+def test_exceptions():
+
+  def fail():
+    yield
+    raise ValueError( "fail" )
+
+  log = []
+  def block():
+    try:
+      yield fail()
+    except ValueError as e:
+      log.append( str( e ) )
+    yield fail()
+
+  scheduler = FLScheduler()
+  scheduler.add( block )
+  run( scheduler, 2 )
+  assert log == [ "fail" ]
+  with pytest.raises( ValueError ):
+    run( scheduler, 1 )
+
+  def bad():
+    yield "1"
+
+  scheduler = FLScheduler()
+  scheduler.add( bad )
+  with pytest.raises( TypeError ):
+    run( scheduler, 1 )
+
+#-----------------------------------------------------------------------
+# test_SimulationTool
+#-----------------------------------------------------------------------
+# @tick_fl blocks which are generators are run by the scheduler of the
+# simulator, and other sequential blocks are still called every cycle.
+def test_SimulationTool():
+
+  class Model1( Model ):
+    def __init__( s ):
+      s.in_  = InPort ( 8 )
+      s.out  = OutPort( 8 )
+      s.seen = []
+
+      @s.tick_fl
+      def fl_logic():
+        yield wait_until( s.in_, lambda x: x == 3 )
+        s.seen.append( s.in_.uint() )
+        s.out.next = s.in_ + 1
+        yield 2
+
+      @s.tick
+      def cl_logic():
+        s.seen.append( None )
+
+  model = Model1()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  for i in range( 8 ):
+    model.in_.value = i
+    sim.cycle()
+
+  assert model.seen.count( None ) == 8
+  assert [ x for x in model.seen if x is not None ] == [ 3 ]
+  assert model.out == 4
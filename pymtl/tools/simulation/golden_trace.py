@@ -0,0 +1,238 @@
+#=======================================================================
+# golden_trace.py
+#=======================================================================
+# Golden traces of the ports of a design.
+#
+# To check that two implementations of a model (e.g., FL and RTL, or
+# simulated and translated) behave the same cycle by cycle, a
+# GoldenTraceRecorder captures the value of selected ports at the end of
+# each cycle into NumPy arrays, which can be saved to an npz file. The
+# arrays of two runs are compared with compare_traces(), which finds the
+# first cycle where a port differs without formatting anything:
+#
+#   recorder = GoldenTraceRecorder( sim )
+#   sim.run( until=model.done )
+#   recorder.check( 'model.golden.npz' )
+#
+# check() saves the trace the first time, and compares with the saved
+# trace the next times.
+#
+# Ports are named by their dotted hierarchical path, such as
+# top.dut.out.msg. Ports up to 64 bits wide are stored in arrays of
+# unsigned integers of the smallest sufficient width, wider ports in two
+# dimensional arrays with one row of 64-bit words per cycle, the least
+# significant word first. The cycle count at the end of each recorded
+# cycle is stored under the name cycles.
+
+import collections
+import fnmatch
+import os
+
+import numpy as np
+
+#-----------------------------------------------------------------------
+# TraceMismatch
+#-----------------------------------------------------------------------
+# The first difference between two traces: the cycle, the name of the
+# port (None if one trace ends before the other, in which case expected
+# and actual are the numbers of cycles of the traces) and the values.
+TraceMismatch = collections.namedtuple( 'TraceMismatch',
+                                        'cycle signal expected actual' )
+
+#-----------------------------------------------------------------------
+# GoldenTraceRecorder
+#-----------------------------------------------------------------------
+# Records the value of ports at the end of each cycle, from the cycle
+# following its creation until it is closed. Ports can be given as a
+# list of ports (or the signals which replaced them in the model once
+# the simulator was created) or of fnmatch patterns matched against the paths of all
+# the ports of the design. By default, the output ports of the top model
+# and of its direct submodels are recorded, which covers the outputs of
+# the model under test of a test harness.
+class GoldenTraceRecorder( object ):
+
+  def __init__( self, sim, ports=None ):
+
+    self.sim = sim
+
+    all_ports = collections.OrderedDict()
+    models    = [ ( sim.model, sim.model.name ) ]
+    for m, path in models:
+      for port in m.get_ports():
+        all_ports[ path + '.' + port.name ] = port
+      models.extend( ( x, path + '.' + x.name ) for x in m.get_submodules() )
+
+    if ports is None:
+      top   = sim.model
+      ports = top.get_outports() + [ x for m in top.get_submodules()
+                                     for x in m.get_outports() ]
+
+    selected = collections.OrderedDict()
+    for x in ports:
+      if isinstance( x, str ):
+        for path, port in all_ports.items():
+          if fnmatch.fnmatchcase( path, x ):
+            selected[ path ] = port
+      else:
+        path = [ p for p, port in all_ports.items()
+                 if x is port or x is port._signalvalue ]
+        if not path:
+          raise ValueError( "{!r} is not a port of the design".format( x ) )
+        selected[ path[0] ] = all_ports[ path[0] ]
+
+    self.names   = selected.keys()
+    self._nbits  = [ port.nbits for port in selected.values() ]
+    self._nets   = [ port._signalvalue for port in selected.values() ]
+    self._cycles = []
+    self._values = [ [] for port in self._nets ]
+    self._closed = False
+
+    sim.add_cycle_hook( self.sample )
+
+  #---------------------------------------------------------------------
+  # sample
+  #---------------------------------------------------------------------
+  # Records the values of the ports at the end of the current cycle.
+  def sample( self ):
+    self._cycles.append( self.sim.ncycles )
+    for net, values in zip( self._nets, self._values ):
+      values.append( net._uint )
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Stops recording.
+  def close( self ):
+    if not self._closed:
+      self._closed = True
+      self.sim.remove_cycle_hook( self.sample )
+
+  #---------------------------------------------------------------------
+  # arrays
+  #---------------------------------------------------------------------
+  # Returns the trace recorded so far, as an ordered dict of arrays.
+  def arrays( self ):
+    trace = collections.OrderedDict()
+    trace['cycles'] = np.array( self._cycles, dtype=np.int64 )
+    for name, nbits, values in zip( self.names, self._nbits, self._values ):
+      trace[ name ] = _to_array( values, nbits )
+    return trace
+
+  #---------------------------------------------------------------------
+  # save
+  #---------------------------------------------------------------------
+  def save( self, path ):
+    save_trace( path, self.arrays() )
+
+  #---------------------------------------------------------------------
+  # check
+  #---------------------------------------------------------------------
+  # Stops recording, then saves the trace to path if there is no such
+  # file, or compares it with the trace saved there and raises an
+  # AssertionError describing the first difference.
+  def check( self, path ):
+
+    self.close()
+    if not os.path.exists( path ):
+      self.save( path )
+      return
+
+    mismatch = compare_traces( load_trace( path ), self.arrays() )
+    if mismatch is None:
+      return
+
+    if mismatch.signal is None:
+      raise AssertionError( "trace differs from golden trace {}: {} cycles "
+                            "recorded, expected {}".format( path,
+                            mismatch.actual, mismatch.expected ) )
+
+    raise AssertionError( "trace differs from golden trace {} at cycle {}: "
+                          "{} is {:#x}, expected {:#x}".format( path,
+                          mismatch.cycle, mismatch.signal, mismatch.actual,
+                          mismatch.expected ) )
+
+#-----------------------------------------------------------------------
+# save_trace, load_trace
+#-----------------------------------------------------------------------
+# Traces are saved as compressed npz files, with one array per port. The
+# order of the ports is not saved, they are loaded in alphabetical order
+# after the cycles.
+def save_trace( path, trace ):
+  with open( path, 'wb' ) as f:
+    np.savez_compressed( f, **trace )
+
+def load_trace( path ):
+  with np.load( path ) as data:
+    names = sorted( data.files, key=lambda x: ( x != 'cycles', x ) )
+    return collections.OrderedDict( ( x, data[ x ] ) for x in names )
+
+#-----------------------------------------------------------------------
+# compare_traces
+#-----------------------------------------------------------------------
+# Returns a TraceMismatch describing the first difference between the
+# expected and the actual trace, or None if they are identical. Cycles
+# are compared in order and, within a cycle, ports in the order of the
+# expected trace. Both traces must hold the same ports.
+def compare_traces( expected, actual ):
+
+  names = [ x for x in expected if x != 'cycles' ]
+  if set( names ) != set( x for x in actual if x != 'cycles' ):
+    raise ValueError( "traces do not hold the same ports: {} and {}".format(
+                      sorted( names ),
+                      sorted( x for x in actual if x != 'cycles' ) ) )
+
+  ncycles = min( len( expected['cycles'] ), len( actual['cycles'] ) )
+
+  # First differing cycle of each port, found without a Python loop over
+  # cycles
+
+  first = None
+  cols  = [ 'cycles' ] + names
+  for name in cols:
+    a    = expected[ name ][ :ncycles ]
+    b    = actual  [ name ][ :ncycles ]
+    diff = a != b
+    if diff.ndim > 1:
+      diff = diff.any( axis=1 )
+    index = np.flatnonzero( diff )
+    if len( index ) and ( first is None or index[0] < first[0] ):
+      first = ( index[0], name )
+
+  if first is not None:
+    i, name = first
+    return TraceMismatch( int( expected['cycles'][i] ), name,
+                          _to_int( expected[ name ][i] ),
+                          _to_int( actual  [ name ][i] ) )
+
+  if len( expected['cycles'] ) != len( actual['cycles'] ):
+    return TraceMismatch( ncycles, None, len( expected['cycles'] ),
+                          len( actual['cycles'] ) )
+
+  return None
+
+#-----------------------------------------------------------------------
+# _to_array
+#-----------------------------------------------------------------------
+# Returns the array holding the values of a port of nbits bits.
+def _to_array( values, nbits ):
+
+  for n, dtype in [ ( 8, np.uint8 ), ( 16, np.uint16 ), ( 32, np.uint32 ),
+                    ( 64, np.uint64 ) ]:
+    if nbits <= n:
+      return np.array( values, dtype=dtype )
+
+  nwords = ( nbits + 63 ) // 64
+  mask   = ( 1 << 64 ) - 1
+  array  = np.zeros( ( len( values ), nwords ), dtype=np.uint64 )
+  for i in range( nwords ):
+    array[ :, i ] = [ ( x >> ( 64*i ) ) & mask for x in values ]
+  return array
+
+#-----------------------------------------------------------------------
+# _to_int
+#-----------------------------------------------------------------------
+# Returns the value of a port at a cycle as an int.
+def _to_int( value ):
+  if np.ndim( value ):
+    return sum( int( x ) << ( 64*i ) for i, x in enumerate( value ) )
+  return int( value )
@@ -0,0 +1,107 @@
+#=======================================================================
+# golden_trace_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl import *
+
+from golden_trace import GoldenTraceRecorder, TraceMismatch, \
+                         compare_traces, load_trace
+
+#-----------------------------------------------------------------------
+# Accumulator
+#-----------------------------------------------------------------------
+# Adds its input to an accumulator each cycle, or subtracts it once the
+# accumulator passed bug_at if bug_at is given.
+class Accumulator( Model ):
+  def __init__( s, bug_at=None ):
+    s.in_  = InPort ( 8 )
+    s.out  = OutPort( 8 )
+    s.wide = OutPort( 130 )
+
+    @s.tick
+    def seq_logic():
+      if bug_at is not None and s.out >= bug_at:
+        s.out.next = s.out - s.in_
+      else:
+        s.out.next = s.out + s.in_
+
+    @s.combinational
+    def comb_logic():
+      s.wide.value = concat( s.out, Bits( 122, 1 ) )
+
+class Top( Model ):
+  def __init__( s, bug_at=None ):
+    s.in_ = InPort ( 8 )
+    s.acc = Accumulator( bug_at )
+    s.connect( s.in_, s.acc.in_ )
+
+#-----------------------------------------------------------------------
+# record
+#-----------------------------------------------------------------------
+def record( ncycles, bug_at=None, ports=None ):
+
+  model = Top( bug_at )
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  recorder = GoldenTraceRecorder( sim, ports )
+  for i in range( ncycles ):
+    model.in_.value = 3
+    sim.cycle()
+  recorder.close()
+  sim.cycle()
+
+  return recorder
+
+#-----------------------------------------------------------------------
+# test_record
+#-----------------------------------------------------------------------
+def test_record():
+
+  trace = record( 10 ).arrays()
+  assert trace.keys() == [ 'cycles', 'top.acc.out', 'top.acc.wide' ]
+  assert list( trace['cycles'] ) == range( 1, 11 )
+  assert list( trace['top.acc.out'] ) == [ 3*i for i in range( 1, 11 ) ]
+  assert trace['top.acc.out'].dtype == 'uint8'
+  assert trace['top.acc.wide'].shape == ( 10, 3 )
+  assert list( trace['top.acc.wide'][-1] ) == [ 1, ( 30 << 58 ) % 2**64, 30 >> 6 ]
+
+  trace = record( 2, ports=[ 'top.*.in_' ] ).arrays()
+  assert trace.keys() == [ 'cycles', 'top.acc.in_' ]
+
+#-----------------------------------------------------------------------
+# test_compare
+#-----------------------------------------------------------------------
+def test_compare():
+
+  golden = record( 20 ).arrays()
+  assert compare_traces( golden, record( 20 ).arrays() ) is None
+
+  # The accumulator first subtracts at cycle 6, once it reached 15
+
+  assert compare_traces( golden, record( 20, bug_at=15 ).arrays() ) == \
+         TraceMismatch( 6, 'top.acc.out', 18, 12 )
+
+  assert compare_traces( golden, record( 15 ).arrays() ) == \
+         TraceMismatch( 15, None, 20, 15 )
+
+  with pytest.raises( ValueError ):
+    compare_traces( golden, record( 20, ports=[ 'top.acc.out' ] ).arrays() )
+
+#-----------------------------------------------------------------------
+# test_check
+#-----------------------------------------------------------------------
+def test_check( tmpdir ):
+
+  path = str( tmpdir.join( 'top.npz' ) )
+  record( 20 ).check( path )
+  assert load_trace( path ).keys() == [ 'cycles', 'top.acc.out',
+                                        'top.acc.wide' ]
+
+  record( 20 ).check( path )
+  with pytest.raises( AssertionError ) as e:
+    record( 20, bug_at=15 ).check( path )
+  assert str( e.value ).endswith(
+         "at cycle 6: top.acc.out is 0xc, expected 0x12" )
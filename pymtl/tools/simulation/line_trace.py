@@ -0,0 +1,337 @@
+#=======================================================================
+# line_trace.py
+#=======================================================================
+# Deferred line tracing.
+#
+# Printing the line trace of a model every cycle formats the values of
+# every port through valrdy_to_str() and BitStruct.__str__(), even when
+# the output goes to a capture buffer which is only shown if a test
+# fails. A LineTraceRecorder instead captures the raw integer values of
+# the nets shown by the line trace in a ring buffer holding the last
+# depth cycles, and only renders the line traces of these cycles when
+# they are needed: the recorded values are written back to the nets,
+# model.line_trace() is called, and the current values are restored.
+#
+#   recorder = sim.record_line_trace( depth=1000 )
+#   with recorder.dump_on_error():
+#     sim.run( until=model.done, trace=recorder.capture )
+#
+# The nets and attributes shown are found by parsing the line_trace()
+# methods of the model, following calls to the line_trace() (or other
+# methods) of submodels. A reference to a port bundle or a list selects
+# all of its nets, so that values only read on some cycles (e.g., the
+# message of a valid/ready bundle) are still captured. Python attributes
+# holding immutable values (e.g., the index of the next message of a
+# test source) are captured along with the nets, as are the attributes
+# listed in line_trace_attrs. If the line trace shows any other Python
+# state (e.g., the entries of a cycle-level queue) or cannot be parsed,
+# the recorder falls back to formatting the line trace on every capture.
+
+from __future__ import print_function
+
+import ast
+import collections
+import contextlib
+import inspect
+import operator
+import sys
+import textwrap
+import types
+
+from ...datatypes.Bits  import Bits
+from ...model.Model      import Model
+from ...model.PortBundle import PortBundle
+
+_get_uint  = operator.attrgetter( '_uint' )
+_immutable = ( int, long, float, bool, basestring, type( None ) )
+
+#-----------------------------------------------------------------------
+# LineTraceRecorder
+#-----------------------------------------------------------------------
+class LineTraceRecorder( object ):
+
+  def __init__( self, sim, depth=1000 ):
+
+    self.sim   = sim
+    self.depth = depth
+    self.eager = False
+
+    # Nets of the design, each net is found through any of its signals
+
+    self._net_ids = set()
+    for group in sim._nets:
+      for signal in group:
+        if isinstance( signal._signalvalue, Bits ):
+          self._net_ids.add( id( signal._signalvalue ) )
+        break
+
+    # Nets and Python attributes shown by the line trace
+
+    self._nets    = collections.OrderedDict()
+    self._attrs   = collections.OrderedDict()
+    self._visited = set()
+
+    models = [ sim.model ]
+    for m in models:
+      models.extend( m.get_submodules() )
+      for name in m.line_trace_attrs:
+        self._attrs[ id( m ), name ] = m, name
+
+    try:
+      self._add_path( sim.model, ( 'line_trace', ) )
+    except _UndeclaredState:
+      self.eager = True
+      self._nets.clear()
+      self._attrs.clear()
+
+    self._nets  = self._nets.values()
+    self._attrs = self._attrs.values()
+
+    self._records = collections.deque( maxlen=depth )
+
+  #---------------------------------------------------------------------
+  # _add_method
+  #---------------------------------------------------------------------
+  # Adds the state read by a method of a model.
+  def _add_method( self, model, func ):
+
+    if ( id( model ), func ) in self._visited:
+      return
+    self._visited.add( ( id( model ), func ) )
+
+    paths = _get_paths( func )
+    if paths is None:
+      raise _UndeclaredState( func )
+    for path in paths:
+      if path is None:
+        raise _UndeclaredState( func )
+      try:
+        self._add_path( model, path )
+      except ( AttributeError, LookupError, TypeError ):
+        raise _UndeclaredState( path )
+
+  #---------------------------------------------------------------------
+  # _add_path
+  #---------------------------------------------------------------------
+  # Adds the state found at the end of a path (attribute names, constant
+  # indexes and None for any other index) starting from obj, stopping at
+  # the first net or variable index.
+  def _add_path( self, obj, path ):
+
+    owner = name = None
+    for step in path:
+      if id( obj ) in self._net_ids or step is None:
+        break
+      if isinstance( obj, Model ) and isinstance( step, str ):
+        attr = getattr( type( obj ), step, None )
+        if isinstance( attr, types.MethodType ):
+          return self._add_method( obj, attr.im_func )
+        if isinstance( attr, property ):
+          raise _UndeclaredState( step )
+        if step in obj.line_trace_attrs:
+          return
+      if isinstance( step, str ):
+        owner, name, obj = obj, step, getattr( obj, step )
+      else:
+        owner, name, obj = None, None, obj[ step ]
+
+    self._add_value( obj, owner, name )
+
+  #---------------------------------------------------------------------
+  # _add_value
+  #---------------------------------------------------------------------
+  # Adds a net, all the nets of a port bundle or list, or an immutable
+  # attribute of owner.
+  def _add_value( self, obj, owner, name ):
+
+    if id( obj ) in self._net_ids:
+      self._nets[ id( obj ) ] = obj
+    elif isinstance( obj, PortBundle ):
+      for port in obj.get_ports():
+        self._add_value( port._signalvalue, None, None )
+    elif isinstance( obj, list ):
+      for x in obj:
+        self._add_value( x, None, None )
+    elif isinstance( obj, _immutable ) and owner is not None:
+      self._attrs[ id( owner ), name ] = owner, name
+    else:
+      raise _UndeclaredState( obj )
+
+  #---------------------------------------------------------------------
+  # capture
+  #---------------------------------------------------------------------
+  # Records the state shown by the line trace of the current cycle. Can
+  # be passed as the trace argument of SimulationTool.run().
+  def capture( self ):
+    if self.eager:
+      self._records.append( ( self.sim.ncycles,
+                              self.sim.model.line_trace() ) )
+      return
+    self._records.append( (
+      self.sim.ncycles,
+      tuple( map( _get_uint, self._nets ) ),
+      tuple( getattr( m, name ) for m, name in self._attrs ),
+    ) )
+
+  #---------------------------------------------------------------------
+  # cycles
+  #---------------------------------------------------------------------
+  # Returns the cycles still held by the ring buffer.
+  def cycles( self ):
+    return [ record[0] for record in self._records ]
+
+  #---------------------------------------------------------------------
+  # render
+  #---------------------------------------------------------------------
+  # Returns the lines of the line trace of the recorded cycles from
+  # start (included) to stop (excluded), formatted like
+  # SimulationTool.print_line_trace().
+  def render( self, start=None, stop=None ):
+
+    records = [ x for x in self._records
+                if ( start is None or x[0] >= start ) and
+                   ( stop  is None or x[0] <  stop  ) ]
+    if not records:
+      return []
+
+    if self.eager:
+      return [ "{:>3}: {}".format( ncycles, line )
+               for ncycles, line in records ]
+
+    nets    = self._nets
+    attrs   = self._attrs
+    current = ( map( _get_uint, nets ),
+                [ getattr( m, name ) for m, name in attrs ] )
+
+    # Values are written without notifying the simulator, nothing is
+    # evaluated while rendering
+
+    lines = []
+    try:
+      for ncycles, values, attr_values in records:
+        for net, value in zip( nets, values ):
+          net._uint = value
+        for ( m, name ), value in zip( attrs, attr_values ):
+          setattr( m, name, value )
+        lines.append( "{:>3}: {}".format( ncycles,
+                                          self.sim.model.line_trace() ) )
+
+    finally:
+      for net, value in zip( nets, current[0] ):
+        net._uint = value
+      for ( m, name ), value in zip( attrs, current[1] ):
+        setattr( m, name, value )
+
+    return lines
+
+  #---------------------------------------------------------------------
+  # print_trace
+  #---------------------------------------------------------------------
+  # Prints the line trace of the recorded cycles from start to stop.
+  def print_trace( self, start=None, stop=None, file=None ):
+    for line in self.render( start, stop ):
+      print( line, file=file )
+
+  #---------------------------------------------------------------------
+  # dump_on_error
+  #---------------------------------------------------------------------
+  # Context manager printing the line trace of the last ncycles recorded
+  # cycles (by default, all of them) if an exception is raised, such as
+  # a failed assertion of a test.
+  @contextlib.contextmanager
+  def dump_on_error( self, ncycles=None, file=None ):
+    try:
+      yield self
+    except Exception:
+      exc_info = sys.exc_info()
+      cycles   = self.cycles()
+      if cycles:
+        start = cycles[-ncycles] if ncycles and ncycles < len( cycles ) \
+                else None
+        print( file=file )
+        self.print_trace( start, file=file )
+      raise exc_info[0], exc_info[1], exc_info[2]
+
+#-----------------------------------------------------------------------
+# _UndeclaredState
+#-----------------------------------------------------------------------
+# Raised while finding the state shown by a line trace if it cannot be
+# captured, the line trace is then formatted on every capture.
+class _UndeclaredState( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# _get_paths
+#-----------------------------------------------------------------------
+# Returns the paths from self read by a method, parsed from its source,
+# with None for each bare reference to self (e.g., self passed to a
+# function), or None if the source is not available. Paths are cached
+# per function.
+_func_paths = {}
+
+def _get_paths( func ):
+  try:
+    return _func_paths[ func ]
+  except KeyError:
+    pass
+
+  try:
+    tree = ast.parse( textwrap.dedent( inspect.getsource( func ) ) )
+  except ( IOError, TypeError, SyntaxError ):
+    paths = None
+  else:
+    args = tree.body[0].args.args
+    if not args:
+      paths = None
+    else:
+      visitor = _SelfPaths( args[0].id )
+      for stmt in tree.body[0].body:
+        visitor.visit( stmt )
+      paths = visitor.paths
+
+  _func_paths[ func ] = paths
+  return paths
+
+#-----------------------------------------------------------------------
+# _SelfPaths
+#-----------------------------------------------------------------------
+# AST visitor collecting the attribute and subscript chains starting
+# from self.
+class _SelfPaths( ast.NodeVisitor ):
+
+  def __init__( self, self_name ):
+    self.self_name = self_name
+    self.paths     = []
+
+  def visit_Name( self, node ):
+    if node.id == self.self_name:
+      self.paths.append( None )
+
+  def visit_Attribute( self, node ):
+    self._visit_chain( node )
+
+  def visit_Subscript( self, node ):
+    self._visit_chain( node )
+
+  def _visit_chain( self, node ):
+
+    path    = []
+    indexes = []
+    x       = node
+    while isinstance( x, ( ast.Attribute, ast.Subscript ) ):
+      if isinstance( x, ast.Attribute ):
+        path.append( x.attr )
+      elif isinstance( x.slice, ast.Index ) and \
+           isinstance( x.slice.value, ast.Num ):
+        path.append( x.slice.value.n )
+      else:
+        path.append( None )
+        indexes.append( x.slice )
+      x = x.value
+
+    if isinstance( x, ast.Name ) and x.id == self.self_name:
+      self.paths.append( tuple( reversed( path ) ) )
+      for index in indexes:
+        self.visit( index )
+    else:
+      self.generic_visit( node )
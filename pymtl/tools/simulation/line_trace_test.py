@@ -0,0 +1,177 @@
+#=======================================================================
+# line_trace_test.py
+#=======================================================================
+
+from __future__ import print_function
+
+import collections
+import pytest
+
+from StringIO import StringIO
+
+from pymtl      import *
+from pclib.ifcs import OutValRdyBundle
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+# The line trace shows ports, a BitStruct field and a Python attribute.
+class Msg( BitStructDefinition ):
+  def __init__( s ):
+    s.hi = BitField( 4 )
+    s.lo = BitField( 4 )
+
+class Counter( Model ):
+
+  line_trace_attrs = ( 'nticks', )
+
+  def __init__( s ):
+    s.out    = OutPort( Msg() )
+    s.nticks = 0
+
+    @s.tick
+    def logic():
+      s.out.next = s.out + 3
+      s.nticks  += 1
+
+  def line_trace( s ):
+    return "{} {} ({})".format( s.out, s.out.lo, s.nticks )
+
+def setup_sim():
+  model = Counter()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  return model, sim
+
+#-----------------------------------------------------------------------
+# test_render
+#-----------------------------------------------------------------------
+# Rendering recorded cycles gives the line traces printed every cycle,
+# and leaves the state of the simulation unchanged.
+def test_render():
+
+  model, sim = setup_sim()
+  expected   = []
+  for i in range( 10 ):
+    expected.append( "{:>3}: {}".format( sim.ncycles, model.line_trace() ) )
+    sim.cycle()
+
+  model, sim = setup_sim()
+  recorder   = sim.record_line_trace( depth=4 )
+  sim.run( 10, trace=recorder.capture )
+
+  assert recorder.cycles() == [ 6, 7, 8, 9 ]
+  assert recorder.render() == expected[6:]
+  assert recorder.render( 7, 9 ) == expected[7:9]
+  assert model.out == 30 and model.nticks == 10
+
+  output = StringIO()
+  recorder.print_trace( 8, file=output )
+  assert output.getvalue().splitlines() == expected[8:]
+
+#-----------------------------------------------------------------------
+# test_dump_on_error
+#-----------------------------------------------------------------------
+def test_dump_on_error():
+
+  model, sim = setup_sim()
+  recorder   = sim.record_line_trace()
+  output     = StringIO()
+
+  with recorder.dump_on_error( file=output ):
+    sim.run( 10, trace=recorder.capture )
+  assert output.getvalue() == ''
+
+  with pytest.raises( AssertionError ):
+    with recorder.dump_on_error( ncycles=3, file=output ):
+      sim.run( 10, trace=recorder.capture )
+      assert model.nticks == 0
+
+  assert output.getvalue().splitlines() == [ '' ] + recorder.render( 17 )
+
+#-----------------------------------------------------------------------
+# test_nets
+#-----------------------------------------------------------------------
+# Only the nets shown by the line trace are captured, including all the
+# nets of a bundle even if its message is only shown when it is valid.
+class Sender( Model ):
+
+  def __init__( s ):
+    s.out   = OutValRdyBundle( 8 )
+    s.count = OutPort( 8 )
+
+    @s.tick
+    def logic():
+      s.out.val.next = s.count[0]
+      s.out.msg.next = s.count
+      s.count.next   = s.count + 1
+
+  def line_trace( s ):
+    return "{}".format( s.out )
+
+class SenderTop( Model ):
+
+  def __init__( s ):
+    s.sender = Sender()
+    s.unused = Wire( 8 )
+
+    @s.combinational
+    def logic():
+      s.unused.value = s.sender.count + 1
+
+  def line_trace( s ):
+    return s.sender.line_trace()
+
+def test_nets():
+
+  model = SenderTop()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  expected = []
+  recorder = sim.record_line_trace()
+  for i in range( 6 ):
+    expected.append( "{:>3}: {}".format( sim.ncycles, model.line_trace() ) )
+    recorder.capture()
+    sim.cycle()
+
+  assert not recorder.eager
+  assert sorted( map( id, recorder._nets ) ) == \
+         sorted( map( id, [ model.sender.out.val, model.sender.out.rdy,
+                            model.sender.out.msg ] ) )
+  assert recorder.render() == expected
+
+#-----------------------------------------------------------------------
+# test_eager
+#-----------------------------------------------------------------------
+# Line traces showing undeclared Python state, such as the entries of
+# a queue, are formatted on every capture.
+class Buffer( Model ):
+
+  def __init__( s ):
+    s.in_ = InPort( 8 )
+    s.buf = collections.deque( maxlen=2 )
+
+    @s.tick
+    def logic():
+      s.buf.append( int( s.in_ ) )
+
+  def line_trace( s ):
+    return "{} {}".format( s.in_, list( s.buf ) )
+
+def test_eager():
+
+  model = Buffer()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  expected = []
+  recorder = sim.record_line_trace()
+  for i in range( 4 ):
+    model.in_.value = i
+    expected.append( "{:>3}: {}".format( sim.ncycles, model.line_trace() ) )
+    recorder.capture()
+    sim.cycle()
+
+  assert recorder.eager
+  assert recorder.render() == expected
@@ -0,0 +1,162 @@
+#=======================================================================
+# parallel.py
+#=======================================================================
+# Fork-based parallel exploration from a warmed simulation state.
+#
+# fork_map() runs one child process per variant with os.fork(). Every
+# child starts from the exact in-memory state of the parent simulator
+# (shared copy-on-write), so variants do not need to re-elaborate or
+# re-warm the design. Each child calls fn( sim, variant ), sends the
+# pickled result back over a pipe and exits, leaving the state of the
+# parent simulator untouched.
+
+import errno
+import multiprocessing
+import os
+import select
+import signal
+import sys
+import traceback
+
+from pymtl.datatypes.Bits import Bits
+from sim_utils            import pickle_dumps, pickle_loads
+
+#-----------------------------------------------------------------------
+# ForkMapError
+#-----------------------------------------------------------------------
+# Raised in the parent when fn raised an exception in a child, or when a
+# child died without returning a result.
+class ForkMapError( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# fork_map
+#-----------------------------------------------------------------------
+def fork_map( sim, fn, variants, workers=None ):
+
+  if not hasattr( os, 'fork' ):
+    raise ForkMapError( "fork_map() needs os.fork(), which is not "
+                        "available on this platform" )
+
+  if workers is None:
+    workers = multiprocessing.cpu_count()
+  if workers < 1:
+    raise ValueError( "workers must be a positive number of processes!" )
+
+  # BitStruct values in the results are recreated with the classes of
+  # the nets of the model
+
+  classes = dict( ( type( x._signalvalue ).__name__,
+                    type( x._signalvalue ) )
+                  for group in sim._nets for x in group
+                  if isinstance( x._signalvalue, Bits ) )
+
+  variants = list( variants )
+  results  = [ None ] * len( variants )
+  pending  = iter( enumerate( variants ) )
+  running  = {}   # read fd -> ( variant index, pid, received chunks )
+
+  # Flush buffered output so it is not written again by every child
+
+  sys.stdout.flush()
+  sys.stderr.flush()
+
+  try:
+    while True:
+
+      # Keep up to workers children running
+
+      while len( running ) < workers:
+        try:
+          i, variant = next( pending )
+        except StopIteration:
+          break
+        fd, pid = _fork_child( sim, fn, variant )
+        running[ fd ] = ( i, pid, [] )
+
+      if not running:
+        break
+
+      # Read results as they arrive, so children never block on a full
+      # pipe
+
+      try:
+        ready, _, _ = select.select( list( running ), [], [] )
+      except select.error as e:
+        if e.args[0] == errno.EINTR:
+          continue
+        raise
+
+      for fd in ready:
+        i, pid, chunks = running[ fd ]
+        chunk = os.read( fd, 65536 )
+        if chunk:
+          chunks.append( chunk )
+          continue
+
+        del running[ fd ]
+        os.close( fd )
+        _, status = os.waitpid( pid, 0 )
+        results[ i ] = _get_result( ''.join( chunks ), status, i, classes )
+
+  finally:
+
+    # Clean up the remaining children if something went wrong
+
+    for fd, ( i, pid, chunks ) in running.items():
+      os.close( fd )
+      try:
+        os.kill( pid, signal.SIGKILL )
+        os.waitpid( pid, 0 )
+      except OSError:
+        pass
+
+  return results
+
+#-----------------------------------------------------------------------
+# _fork_child
+#-----------------------------------------------------------------------
+# Forks a child which runs fn on variant and writes the pickled outcome
+# to a pipe. Returns the read end of the pipe and the pid of the child.
+def _fork_child( sim, fn, variant ):
+
+  rfd, wfd = os.pipe()
+  pid = os.fork()
+
+  if pid:
+    os.close( wfd )
+    return rfd, pid
+
+  # Child: never return into the caller, whatever happens
+
+  status = 1
+  try:
+    os.close( rfd )
+    try:
+      data = pickle_dumps( ( True, fn( sim, variant ) ) )
+    except Exception:
+      data = pickle_dumps( ( False, traceback.format_exc() ) )
+    with os.fdopen( wfd, 'wb' ) as f:
+      f.write( data )
+    status = 0
+  finally:
+    try:
+      sys.stdout.flush()
+      sys.stderr.flush()
+    finally:
+      os._exit( status )
+
+#-----------------------------------------------------------------------
+# _get_result
+#-----------------------------------------------------------------------
+def _get_result( data, status, i, classes ):
+
+  if not data:
+    raise ForkMapError( "child for variant {} exited with status {} "
+                        "without a result".format( i, status ) )
+
+  ok, result = pickle_loads( data, classes )
+  if not ok:
+    raise ForkMapError( "fn raised an exception for variant {}:\n{}"
+                        .format( i, result ) )
+  return result
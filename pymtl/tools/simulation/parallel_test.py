@@ -0,0 +1,106 @@
+#=======================================================================
+# parallel_test.py
+#=======================================================================
+
+import os
+import pytest
+
+from pymtl import *
+
+from parallel         import ForkMapError
+from pclib.rtl.queues import NormalQueue
+from pclib.ifcs       import MemMsg4B
+
+pytestmark = pytest.mark.skipif( not hasattr( os, 'fork' ),
+                                 reason="needs os.fork()" )
+
+#-----------------------------------------------------------------------
+# Accumulator
+#-----------------------------------------------------------------------
+class Accumulator( Model ):
+  def __init__( s ):
+    s.in_ = InPort ( 16 )
+    s.out = OutPort( 16 )
+
+    @s.posedge_clk
+    def seq():
+      if s.reset: s.out.next = 0
+      else:       s.out.next = s.out + s.in_
+
+#-----------------------------------------------------------------------
+# test_fork_map
+#-----------------------------------------------------------------------
+def test_fork_map():
+
+  model = Accumulator()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  # Warm up
+
+  model.in_.value = 1
+  sim.run( 10 )
+  assert model.out == 10
+
+  def run_variant( sim, variant ):
+    model.in_.value = variant
+    sim.run( 5 )
+    return sim.ncycles, model.out
+
+  variants = range( 8 )
+  results  = sim.fork_map( run_variant, variants, workers=3 )
+
+  assert results == [ ( 17, 10 + 5*i ) for i in variants ]
+
+  # The parent simulator is not modified
+
+  assert sim.ncycles == 12
+  assert model.out   == 10
+
+#-----------------------------------------------------------------------
+# test_fork_map_BitStruct
+#-----------------------------------------------------------------------
+# Returns a BitStruct dequeued from a queue of memory requests.
+def test_fork_map_BitStruct():
+
+  dtype = MemMsg4B().req
+  model = NormalQueue( 4, dtype )
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  def run_variant( sim, addr ):
+    msg = dtype.mk_wr( 0, addr, 0, 0 )
+    model.enq.msg.value = msg
+    model.enq.val.value = 1
+    model.deq.rdy.value = 1
+    sim.cycle()
+    sim.eval_combinational()
+    return model.deq.msg
+
+  results = sim.fork_map( run_variant, [ 0x100, 0x200 ] )
+
+  assert [ type( x ) for x in results ] == [ type( dtype ) ] * 2
+  assert [ x.addr for x in results ] == [ 0x100, 0x200 ]
+
+#-----------------------------------------------------------------------
+# test_fork_map_error
+#-----------------------------------------------------------------------
+def test_fork_map_error():
+
+  model = Accumulator()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  def run_variant( sim, variant ):
+    if variant == 2:
+      raise ValueError( "bad variant" )
+    return variant
+
+  with pytest.raises( ForkMapError ) as excinfo:
+    sim.fork_map( run_variant, range( 4 ), workers=2 )
+
+  assert "variant 2" in str( excinfo.value )
+  assert "bad variant" in str( excinfo.value )
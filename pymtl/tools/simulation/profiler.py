@@ -0,0 +1,394 @@
+#=======================================================================
+# profiler.py
+#=======================================================================
+# Execution-time and net activity profilers for a simulated design.
+#
+# BlockProfiler wraps every sequential (@tick, @posedge_clk) and
+# @combinational block of the design with a function recording its
+# invocation count and cumulative wall time. Blocks are attributed to the
+# model which defined them, so the time can be rolled up through the
+# model hierarchy. Slice connections are not profiled separately, their
+# callbacks run (and are timed) inside the block writing the source net.
+#
+# With sample_every=N only one in N invocations of each block is timed,
+# which bounds the overhead of the timer calls. The time of each block
+# is then estimated from its sampled invocations.
+#
+# NetProfiler counts the writes and value changes of every net and the
+# blocks they wake up, to find the nets causing the most events.
+
+from __future__ import print_function
+
+import collections
+import sys
+import timeit
+
+from sim_utils import ( get_named_models, get_named_nets,
+                        get_seq_block_names )
+
+#-----------------------------------------------------------------------
+# BlockStats
+#-----------------------------------------------------------------------
+# Profile of a single block. The kind of a block is either 'seq' or
+# 'comb'.
+class BlockStats( object ):
+
+  def __init__( self, model_name, block_name, kind ):
+    self.model_name = model_name
+    self.block_name = block_name
+    self.kind       = kind
+    self.calls      = 0
+    self.sampled    = 0
+    self.seconds    = 0.0
+
+  @property
+  def name( self ):
+    return '{}.{}'.format( self.model_name, self.block_name )
+
+  # Estimated total time, extrapolated from the sampled invocations.
+  @property
+  def total_seconds( self ):
+    if not self.sampled:
+      return 0.0
+    return self.seconds * self.calls / self.sampled
+
+#-----------------------------------------------------------------------
+# BlockProfiler
+#-----------------------------------------------------------------------
+class BlockProfiler( object ):
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  # Starts profiling the blocks of the design simulated by sim.
+  def __init__( self, sim, sample_every=1 ):
+
+    if sample_every < 1:
+      raise ValueError( "sample_every must be a positive number of calls!" )
+
+    self.sim          = sim
+    self.sample_every = sample_every
+    self.stats        = []
+
+    # Hierarchical names of the models, in the order blocks were
+    # registered by the simulator
+
+    models = [ ( sim.model.name, sim.model ) ]
+    for name, m in models:
+      models.extend( ( name + '.' + x.name, x ) for x in m.get_submodules() )
+
+    # Sequential blocks
+
+    self._orig_seq = sim._sequential_blocks
+    sim._sequential_blocks = [
+      self._wrap( model_name, block_name, 'seq', tick )
+      for ( model_name, block_name ), tick in
+        zip( get_seq_block_names( sim.model, self._orig_seq ), self._orig_seq )
+    ]
+
+    # Combinational blocks are called through their cb attribute, both by
+    # the event queue and by the static schedule
+
+    self._orig_cb  = []
+    self._wrappers = {}
+    for name, m in models:
+      for func in m.get_combinational_blocks():
+        if not hasattr( func, 'cb' ):
+          continue
+        wrapper    = self._wrap( name, func.__name__, 'comb', func.cb )
+        wrapper.id = func.id
+        self._orig_cb.append( ( func, func.cb ) )
+        self._wrappers[ id( func.cb ) ] = wrapper
+        func.cb = wrapper
+
+    self._orig_schedule = sim._static_schedule
+    if sim._static_schedule is not None:
+      sim._static_schedule = self._replace( sim._static_schedule )
+
+    # Blocks already waiting in the event queue are profiled as well
+
+    queue = sim._event_queue
+    queue.fifo = collections.deque( self._replace( queue.fifo ) )
+
+    # The generated cycle() binds the blocks when it is created
+
+    sim._create_cycle()
+
+  #---------------------------------------------------------------------
+  # stop
+  #---------------------------------------------------------------------
+  # Stops profiling and restores the original blocks. The collected
+  # statistics remain available.
+  def stop( self ):
+    sim = self.sim
+    sim._sequential_blocks = self._orig_seq
+    sim._static_schedule   = self._orig_schedule
+
+    originals = {}
+    for func, cb in self._orig_cb:
+      originals[ id( func.cb ) ] = cb
+      func.cb = cb
+
+    queue      = sim._event_queue
+    queue.fifo = collections.deque(
+      originals.get( id( func ), func ) for func in queue.fifo )
+
+    sim._create_cycle()
+
+  #---------------------------------------------------------------------
+  # _replace
+  #---------------------------------------------------------------------
+  # Returns a list of the given block callbacks, with the callbacks of
+  # profiled blocks replaced by their wrappers.
+  def _replace( self, funcs ):
+    return [ self._wrappers.get( id( func ), func ) for func in funcs ]
+
+  #---------------------------------------------------------------------
+  # _wrap
+  #---------------------------------------------------------------------
+  def _wrap( self, model_name, block_name, kind, func ):
+
+    stats = BlockStats( model_name, block_name, kind )
+    self.stats.append( stats )
+
+    sample_every = self.sample_every
+    timer        = timeit.default_timer
+
+    def profiled_block():
+      calls = stats.calls
+      stats.calls = calls + 1
+      if calls % sample_every:
+        func()
+        return
+      start = timer()
+      func()
+      stats.seconds += timer() - start
+      stats.sampled += 1
+
+    profiled_block.__name__ = block_name
+    return profiled_block
+
+  #---------------------------------------------------------------------
+  # model_seconds
+  #---------------------------------------------------------------------
+  # Returns a dict mapping the hierarchical name of each model to the
+  # estimated time spent in the blocks of the model and its submodels.
+  def model_seconds( self ):
+    seconds = {}
+    for stats in self.stats:
+      parts = stats.model_name.split( '.' )
+      for i in range( len( parts ) ):
+        name = '.'.join( parts[:i+1] )
+        seconds[ name ] = seconds.get( name, 0.0 ) + stats.total_seconds
+    return seconds
+
+  #---------------------------------------------------------------------
+  # report
+  #---------------------------------------------------------------------
+  # Prints the blocks sorted by decreasing time, followed by the time of
+  # each model including its submodels. Only the first limit entries of
+  # each table are printed if limit is given.
+  def report( self, outfile=None, limit=None ):
+
+    outfile = outfile or sys.stdout
+    total   = sum( x.total_seconds for x in self.stats ) or 1.0
+
+    def p( *args ):
+      print( *args, file=outfile )
+
+    p( "-"*72 )
+    p( "Block Profile" + ( " (sampling 1 in {} calls)".format(
+       self.sample_every ) if self.sample_every > 1 else "" ) )
+    p( "-"*72 )
+    p()
+    p( "   seconds       %       calls   us/call  block" )
+    p( "----------  ------  ----------  --------  -----" )
+
+    blocks = sorted( self.stats, key=lambda x: -x.total_seconds )
+    for x in blocks[:limit]:
+      p( "{:10.4f}  {:6.2f}  {:10}  {:8.2f}  {}".format(
+         x.total_seconds, 100 * x.total_seconds / total, x.calls,
+         1e6 * x.total_seconds / x.calls if x.calls else 0.0, x.name ) )
+
+    p()
+    p( "   seconds       %  model (including submodels)" )
+    p( "----------  ------  ---------------------------" )
+
+    models = sorted( self.model_seconds().items(), key=lambda x: -x[1] )
+    for name, seconds in models[:limit]:
+      p( "{:10.4f}  {:6.2f}  {}".format( seconds, 100 * seconds / total,
+                                         name ) )
+    p( "-"*72 )
+
+  #---------------------------------------------------------------------
+  # write_collapsed
+  #---------------------------------------------------------------------
+  # Writes the profile in the collapsed-stack format used by flame graph
+  # tools (e.g., flamegraph.pl or speedscope): one line per block with
+  # the model hierarchy and block name as the stack, and the time in
+  # microseconds as the count.
+  def write_collapsed( self, filename ):
+    with open( filename, 'w' ) as f:
+      for x in self.stats:
+        usecs = int( round( 1e6 * x.total_seconds ) )
+        if usecs:
+          f.write( '{};{} {}\n'.format( x.model_name.replace( '.', ';' ),
+                                        x.block_name, usecs ) )
+
+#-----------------------------------------------------------------------
+# NetStats
+#-----------------------------------------------------------------------
+# Activity of a single net:
+#
+#  - writes:  writes to the shadow value (.next)
+#  - changes: changes of the value, either written directly, flopped or
+#             propagated through a slice connection
+#  - wakeups: blocks placed on the event queue because the value changed
+#  - fanout:  number of blocks sensitive to the net
+#  - woken:   number of wakeups of each block, by block name
+#
+# The amplification of a net is the average number of blocks woken up
+# by each change of its value.
+class NetStats( object ):
+
+  def __init__( self, name, fanout ):
+    self.name    = name
+    self.fanout  = fanout
+    self.writes  = 0
+    self.changes = 0
+    self.wakeups = 0
+    self.woken   = collections.Counter()
+
+  @property
+  def amplification( self ):
+    return float( self.wakeups ) / self.changes if self.changes else 0.0
+
+#-----------------------------------------------------------------------
+# NetProfiler
+#-----------------------------------------------------------------------
+# Attributes simulator events to the nets causing them. Like the
+# add_events and add_callbk counts of SimulationMetrics, but counted per
+# net, together with the blocks each net woke up.
+class NetProfiler( object ):
+
+  #---------------------------------------------------------------------
+  # __init__
+  #---------------------------------------------------------------------
+  # Starts profiling the nets of the design simulated by sim.
+  def __init__( self, sim ):
+
+    self.sim   = sim
+    self.stats = []
+
+    # Names of the blocks which can be woken up
+
+    block_names = {}
+    for name, m in get_named_models( sim.model ):
+      for func in m.get_combinational_blocks():
+        block_names[ id( func ) ] = name + '.' + func.__name__
+
+    # Replace the simulator notification callbacks of each net with
+    # counting versions
+
+    self._orig = []
+    for name, svalue in get_named_nets( sim ):
+      callbacks = svalue._callbacks
+      stats     = NetStats( name, len( callbacks ) )
+      names     = [ block_names.get( id( func ), '<slice>' )
+                    for func in callbacks ]
+      self.stats.append( stats )
+      self._orig.append( ( svalue,
+        svalue.__dict__.get( 'notify_sim_comb_update' ),
+        svalue.__dict__.get( 'notify_sim_seq_update'  ) ) )
+
+      svalue.notify_sim_comb_update = self._create_comb_cb(
+        stats, svalue, names, svalue.notify_sim_comb_update )
+      svalue.notify_sim_seq_update  = self._create_seq_cb(
+        stats, svalue.notify_sim_seq_update )
+
+  #---------------------------------------------------------------------
+  # stop
+  #---------------------------------------------------------------------
+  # Stops profiling and restores the original callbacks. The collected
+  # statistics remain available.
+  def stop( self ):
+    for svalue, comb_cb, seq_cb in self._orig:
+      for attr, cb in [ ( 'notify_sim_comb_update', comb_cb ),
+                        ( 'notify_sim_seq_update',  seq_cb  ) ]:
+        if cb is None: delattr( svalue, attr )
+        else:          setattr( svalue, attr, cb )
+
+  #---------------------------------------------------------------------
+  # _create_comb_cb
+  #---------------------------------------------------------------------
+  # Blocks already on the event queue, and the block currently being
+  # evaluated, are not counted as woken up since add_event() does not
+  # queue them again. Neither are blocks only sensitive to bits of the
+  # net which did not change (see add_masked_event()).
+  def _create_comb_cb( self, stats, svalue, names, notify ):
+
+    sim     = self.sim
+    func_bv = sim._event_queue.func_bv
+    woken   = stats.woken
+    masks   = svalue._callback_masks or {}
+    blocks  = [ ( func, name, masks.get( func ) )
+                for func, name in zip( svalue._callbacks, names ) ]
+
+    def notify_sim_comb_update():
+      stats.changes += 1
+      diff = svalue._uint ^ svalue._sense_prev if masks else -1
+      for func, name, mask in blocks:
+        if ( mask is None or diff & mask ) and \
+           func.cb != sim._current_func and not func_bv[ func.id ]:
+          stats.wakeups += 1
+          woken[ name ] += 1
+      notify()
+
+    return notify_sim_comb_update
+
+  #---------------------------------------------------------------------
+  # _create_seq_cb
+  #---------------------------------------------------------------------
+  def _create_seq_cb( self, stats, notify ):
+
+    def notify_sim_seq_update():
+      stats.writes += 1
+      notify()
+
+    return notify_sim_seq_update
+
+  #---------------------------------------------------------------------
+  # report
+  #---------------------------------------------------------------------
+  # Prints the top nets sorted by the given statistic ('wakeups',
+  # 'changes', 'writes' or 'amplification'). If detailed is True, the
+  # blocks woken up by each of these nets are listed as well.
+  def report( self, outfile=None, top=20, sort='wakeups', detailed=False ):
+
+    outfile = outfile or sys.stdout
+
+    def p( *args ):
+      print( *args, file=outfile )
+
+    nets = sorted( self.stats, key=lambda x: -getattr( x, sort ) )[:top]
+
+    p( "-"*72 )
+    p( "Net Activity (top {} nets by {})".format( len( nets ), sort ) )
+    p( "-"*72 )
+    p()
+    p( "    writes     changes     wakeups  fanout    ampl  net" )
+    p( "----------  ----------  ----------  ------  ------  ---" )
+    for x in nets:
+      p( "{:10}  {:10}  {:10}  {:6}  {:6.2f}  {}".format(
+         x.writes, x.changes, x.wakeups, x.fanout, x.amplification,
+         x.name ) )
+
+    if detailed:
+      for x in nets:
+        if x.woken:
+          p()
+          p( x.name )
+          for name, count in x.woken.most_common():
+            p( "  {:10}  {}".format( count, name ) )
+
+    p( "-"*72 )
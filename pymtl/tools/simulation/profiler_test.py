@@ -0,0 +1,236 @@
+#=======================================================================
+# profiler_test.py
+#=======================================================================
+
+import pytest
+import random
+import sys
+
+from cStringIO import StringIO
+
+from pymtl import *
+
+from pclib.rtl.queues import NormalQueue
+
+from SimulationTool_comb_test import BitRangeSensitivity
+
+#-----------------------------------------------------------------------
+# run_queue
+#-----------------------------------------------------------------------
+# Simulates a queue with random stimulus, returning the outputs of every
+# cycle.
+def run_queue( sim, model, ncycles, seed=0 ):
+  rgen    = random.Random( seed )
+  outputs = []
+  for i in range( ncycles ):
+    model.enq.val.value = rgen.randint( 0, 1 )
+    model.enq.msg.value = rgen.randint( 0, 255 )
+    model.deq.rdy.value = rgen.randint( 0, 1 )
+    sim.eval_combinational()
+    outputs.append( ( model.enq.rdy.uint(), model.deq.val.uint(),
+                      model.deq.msg.uint() ) )
+    sim.cycle()
+  return outputs
+
+def create_sim( **kwargs ):
+  model = NormalQueue( 4, 8 )
+  model.elaborate()
+  sim   = SimulationTool( model, **kwargs )
+  sim.reset()
+  return sim, model
+
+#-----------------------------------------------------------------------
+# test_BlockProfiler
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'static_schedule', [ False, True ] )
+def test_BlockProfiler( tmpdir, static_schedule ):
+
+  sim, model = create_sim( static_schedule=static_schedule )
+  expected   = run_queue( sim, model, 40 )
+
+  sim, model = create_sim( static_schedule=static_schedule,
+                           collect_metrics=True )
+  start      = sim.ncycles
+  profiler   = sim.profile()
+
+  assert run_queue( sim, model, 40 ) == expected
+
+  # Sequential blocks run once per cycle, and combinational blocks run
+  # as many times as the simulator evaluated them, which is only counted
+  # by the metrics in dev mode
+
+  seq  = [ x for x in profiler.stats if x.kind == 'seq'  ]
+  comb = [ x for x in profiler.stats if x.kind == 'comb' ]
+  assert seq and all( x.calls == 40 for x in seq )
+  assert sum( x.calls for x in comb ) > 0
+  if not sys.flags.optimize:
+    assert sum( x.calls for x in comb ) == \
+           sum( sim.metrics.comb_evals_per_cycle[ start:sim.ncycles ] )
+  assert all( x.sampled == x.calls for x in profiler.stats )
+
+  # Time is attributed to the model hierarchy
+
+  seconds = profiler.model_seconds()
+  assert seconds[ 'top' ] == \
+         pytest.approx( sum( x.total_seconds for x in profiler.stats ) )
+  assert seconds[ 'top' ] >= seconds[ 'top.dpath' ] > 0
+
+  out = StringIO()
+  profiler.report( out )
+  assert 'top.ctrl.' in out.getvalue()
+
+  filename = str( tmpdir.join( 'sim.folded' ) )
+  profiler.write_collapsed( filename )
+  for line in open( filename ):
+    stack, usecs = line.split()
+    assert stack.startswith( 'top;' ) and int( usecs ) > 0
+
+  # Once stopped, blocks are not profiled anymore
+
+  profiler.stop()
+  calls = [ x.calls for x in profiler.stats ]
+  run_queue( sim, model, 10 )
+  assert [ x.calls for x in profiler.stats ] == calls
+
+#-----------------------------------------------------------------------
+# test_BlockProfiler_sampling
+#-----------------------------------------------------------------------
+def test_BlockProfiler_sampling():
+
+  sim, model = create_sim()
+  profiler   = sim.profile( sample_every=4 )
+  run_queue( sim, model, 10 )
+
+  for x in profiler.stats:
+    assert x.sampled == ( x.calls + 3 ) // 4
+    if x.sampled:
+      estimate = x.seconds * x.calls / x.sampled
+      assert x.total_seconds == pytest.approx( estimate )
+
+#-----------------------------------------------------------------------
+# Fanout
+#-----------------------------------------------------------------------
+class Fanout( Model ):
+  def __init__( s ):
+    s.in_   = InPort ( 8 )
+    s.out   = OutPort[3]( 8 )
+    s.count = OutPort( 8 )
+
+    @s.combinational
+    def comb0():
+      s.out[0].value = s.in_
+
+    @s.combinational
+    def comb1():
+      s.out[1].value = s.in_ + 1
+
+    @s.combinational
+    def comb2():
+      s.out[2].value = s.in_ + s.count
+
+    @s.posedge_clk
+    def seq():
+      s.count.next = s.count + 1
+
+#-----------------------------------------------------------------------
+# test_NetProfiler
+#-----------------------------------------------------------------------
+def test_NetProfiler():
+
+  model = Fanout()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  profiler = sim.profile_nets()
+  for i in range( 10 ):
+    model.in_.value = i + 1
+    sim.cycle()
+
+  stats = dict( ( x.name, x ) for x in profiler.stats )
+
+  # Every change of the input wakes up all three blocks
+
+  in_ = stats[ 'top.in_' ]
+  assert ( in_.changes, in_.wakeups, in_.fanout ) == ( 10, 30, 3 )
+  assert in_.amplification == 3.0
+  assert in_.woken == { 'top.comb0' : 10, 'top.comb1' : 10,
+                        'top.comb2' : 10 }
+
+  # The counter is written and changes every cycle, waking up one block
+
+  count = stats[ 'top.count' ]
+  assert ( count.writes, count.changes, count.wakeups ) == ( 10, 10, 10 )
+
+  out = StringIO()
+  profiler.report( out, top=2, detailed=True )
+  lines = out.getvalue().splitlines()
+  assert lines[6].endswith( 'top.in_' )
+  assert lines[7].endswith( 'top.count' )
+
+  # Once stopped, nets are not profiled anymore
+
+  profiler.stop()
+  model.in_.value = 0
+  sim.cycle()
+  assert ( in_.changes, count.writes ) == ( 10, 10 )
+  assert model.out[2] == model.count
+
+#-----------------------------------------------------------------------
+# test_NetProfiler_cycle_hook
+#-----------------------------------------------------------------------
+# Regenerating cycle() for a new end of cycle hook keeps the callbacks
+# installed by the profiler.
+def test_NetProfiler_cycle_hook():
+
+  model = Fanout()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  profiler = sim.profile_nets()
+  hooks    = []
+  sim.add_cycle_hook( lambda: hooks.append( sim.ncycles ) )
+  sim.cycle()
+  sim.cycle()
+  profiler.stop()
+
+  stats = dict( ( x.name, x ) for x in profiler.stats )
+  assert stats[ 'top.count' ].writes == 2
+  assert len( hooks ) == 2
+
+#-----------------------------------------------------------------------
+# test_BitRangeSensitivity
+#-----------------------------------------------------------------------
+# Blocks reading a field of a BitStruct or a constant slice of a signal
+# are only woken up when these bits change.
+def test_BitRangeSensitivity():
+
+  model = BitRangeSensitivity()
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  profiler = sim.profile()
+  nets     = sim.profile_nets()
+  calls    = lambda: dict( ( x.block_name, x.calls ) for x in profiler.stats )
+
+  model.in_.src.value = 0x12
+  model.data.value    = 0x0034
+  sim.eval_combinational()
+  assert calls() == { 'src_logic' : 1, 'dest_logic' : 0, 'lo_logic'  : 1,
+                      'hi_logic'  : 0, 'bit_logic'  : 0, 'sum_logic' : 1 }
+
+  model.in_.dest.value = 0x56
+  model.data.value     = 0x8034
+  sim.eval_combinational()
+  assert calls() == { 'src_logic' : 1, 'dest_logic' : 1, 'lo_logic'  : 1,
+                      'hi_logic'  : 1, 'bit_logic'  : 1, 'sum_logic' : 2 }
+
+  # The block reading the whole input was already queued by the changes
+  # of in_
+
+  stats = dict( ( x.name, x ) for x in nets.stats )
+  assert stats[ 'top.data' ].woken == { 'top.lo_logic'  : 1,
+                                        'top.hi_logic'  : 1,
+                                        'top.bit_logic' : 1 }
@@ -2,13 +2,20 @@
 # sim_utils.py
 #=======================================================================
 
+import re
+import cPickle
+import cStringIO
+import inspect
 import warnings
+import collections
 import greenlet
 
 from ..ast_helpers            import get_method_ast
 from ...datatypes.SignalValue import SignalValue
+from ...datatypes.Bits        import Bits, BitSlice
 
-from ast_visitor import (
+from fl_scheduler import FLScheduler
+from ast_visitor  import (
   DetectLoadsAndStores,
   DetectDecorators,
   DetectIncorrectValueNext,
@@ -38,50 +45,42 @@ def signals_to_nets( signals ):
   nets           = []
   slice_connects = set()
 
-  #---------------------------------------------------------------------
-  # valid_connection
-  #---------------------------------------------------------------------
-  # Utility function to filter only supported connections (ports/wires),
-  # ignore slices and constants.
-  def valid_connection( c ):
-    if c.src_slice != None or c.dest_slice != None:
-      # TODO: collect slice connections somewhere else
-      slice_connects.add( c )
-      return False
-    else:
-      return True
-
-  #---------------------------------------------------------------------
-  # iter_dfs
-  #---------------------------------------------------------------------
-  # Iterative Depth-First-Search algorithm, borrowed from Listing 5-5
-  # in 'Python Algorithms': http://www.apress.com/9781430232377/
-  def iter_dfs( s ):
-    S, Q = set(), []
-    Q.append( s )
-    while Q:
-      u = Q.pop()
-      if u in S: continue
-      S.add( u )
-      connected_signals = [ x.other( u ) for x in u.connections
-                            if valid_connection( x ) ]
-      Q.extend( connected_signals )
-      #yield u
-    return S
-
   # Initially signals contains all the Signal type objects in the model.
   # We perform a depth-first search on the connections of each Signal
   # object, and remove connected objects from the signals set.  The
   # result is a collection of nets describing structural connections in
   # the design. Each independent net will later be transformed into a
   # single SignalValue object.
+  #
+  # Slice connections are not followed, they are collected in the same
+  # sweep and handled separately by the simulator. Each net doubles as
+  # the visited set of its search, so every connection is only looked at
+  # once from each of its endpoints.
+  #
+  # Note: a union-find pass over the connections was also evaluated, but
+  # it is slower in CPython since each connection needs two dictionary
+  # lookups (plus root traversals) instead of a single set membership
+  # test. See scripts/bench_signals_to_nets.py.
 
   while signals:
-    s = signals.pop()
-    net = iter_dfs( s )
-    for i in net:
-      #if i is not s: signals.remove( i )
-      signals.discard( i )
+    s     = signals.pop()
+    net   = set([ s ])
+    stack = [ s ]
+    while stack:
+      u = stack.pop()
+      for c in u.connections:
+
+        # TODO: collect slice connections somewhere else
+        if c.src_slice is not None or c.dest_slice is not None:
+          slice_connects.add( c )
+          continue
+
+        v = c.dest_node if c.src_node is u else c.src_node
+        if v not in net:
+          net.add( v )
+          stack.append( v )
+
+    signals.difference_update( net )
     nets.append( net )
 
   return nets, slice_connects
@@ -104,12 +103,26 @@ def insert_signal_values( sim, nets ):
       sim.add_event( svalue )
     return notify_sim_comb_update
 
+  #-------------------------------------------------------------------
+  # create_masked_comb_update_cb
+  #-------------------------------------------------------------------
+  # Used instead if some blocks are only sensitive to a range of bits
+  # of the net, see register_comb_blocks.
+  def create_masked_comb_update_cb( sim, svalue ):
+    def notify_sim_comb_update():
+      value = svalue._uint
+      sim.add_masked_event( svalue, value ^ svalue._sense_prev )
+      svalue._sense_prev = value
+    return notify_sim_comb_update
+
   #-------------------------------------------------------------------
   # create_seq_update_cb
   #-------------------------------------------------------------------
   def create_seq_update_cb( sim, svalue ):
     def notify_sim_seq_update():
-      sim._register_queue.append( svalue )
+      if not svalue._flop_pending:
+        svalue._flop_pending = True
+        sim._register_queue.append( svalue )
     return notify_sim_seq_update
 
   # Each grouping represents a single SignalValue object. Perform a swap
@@ -140,6 +153,8 @@ def insert_signal_values( sim, nets ):
     # We just store the callback for now, only add it later if we detect
     # that a combinational block is sensitive to us.
     svalue._ucb                   = create_comb_update_cb( sim, svalue )
+    if isinstance( svalue, Bits ):
+      svalue._mucb = create_masked_comb_update_cb( sim, svalue )
 
     # Modify model attributes currently referencing Signal objects to
     # reference SignalValue objects instead.
@@ -151,20 +166,63 @@ def insert_signal_values( sim, nets ):
         svalue.constant = True
       # Otherwise swap the value
       else:
-        # We need 'in locals()' because of the nested function above,
-        # see: http://stackoverflow.com/a/4484946
-        exec( "x.parent.{} = svalue".format( x.name ) ) in locals()
+        _set_path( x.parent, x._path, svalue )
 
       # Also give signals a pointer to the SignalValue object.
       # (Needed for VCD tracing and slice logic generator).
       x._signalvalue = svalue
 
+#-----------------------------------------------------------------------
+# _get_path
+#-----------------------------------------------------------------------
+# Utility function to split a name (e.g., s.in_[2].msg) into its root
+# ('s') and a path: a tuple of attribute names and list indexes, like
+# the paths recorded for each signal during elaboration. Returns None if
+# the name cannot be expressed as a path. Paths are cached per name.
+_name_paths = {}
+_path_name  = re.compile( r'(\w+)((?:\.\w+|\[\d+\])*)$' )
+_path_step  = re.compile( r'\.(\w+)|\[(\d+)\]' )
+
+def _get_path( name ):
+  try:
+    return _name_paths[ name ]
+  except KeyError:
+    match = _path_name.match( name )
+    if match:
+      root, steps = match.groups()
+      path = tuple( attr or int( index ) for attr, index
+                    in _path_step.findall( steps ) )
+      _name_paths[ name ] = root, path
+    else:
+      _name_paths[ name ] = None
+    return _name_paths[ name ]
+
+#-----------------------------------------------------------------------
+# _get_by_path / _set_path
+#-----------------------------------------------------------------------
+# Utility functions to read and write the object at the end of a path
+# starting from obj.
+def _get_by_path( obj, path ):
+  for step in path:
+    if isinstance( step, str ): obj = getattr( obj, step )
+    else:                       obj = obj[ step ]
+  return obj
+
+def _set_path( obj, path, value ):
+  obj, step = _get_by_path( obj, path[:-1] ), path[-1]
+  if isinstance( step, str ): setattr( obj, step, value )
+  else:                       obj[ step ] = value
+
 #---------------------------------------------------------------------
 # register_seq_blocks
 #---------------------------------------------------------------------
 # Register all decorated @tick and  @posedge_clk functions.
 # Sequential logic blocks get executed any time cycle() is called.
-def register_seq_blocks( model ):
+#
+# @tick_fl blocks which are generator functions are added to the given
+# FLScheduler (see fl_scheduler.py), which runs them all from a single
+# sequential block placed where the first of them would have been.
+def register_seq_blocks( model, scheduler = None ):
 
   all_models = []
   def create_model_list( current ):
@@ -178,46 +236,213 @@ def register_seq_blocks( model ):
   for i in all_models:
     for func in i.get_tick_blocks() + i.get_posedge_clk_blocks():
 
-      # Grab the AST and src code of each function
-      tree, src = get_method_ast( func )
+      # Grab the (cached) AST analysis of each function
+      block = _get_block_info( func )
 
       # Check there were no mistakes in use of .value/.next
-      DetectIncorrectValueNext( func, 'value' ).visit( tree )
-      DetectMissingValueNext  ( func, 'next'  ).visit( tree )
-
-      # If function is decorated with tick_fl, wrap it with a greenlet
-      if 'tick_fl' in DetectDecorators().enter( tree ):
+      if not block.linted:
+        DetectIncorrectValueNext( func, 'value' ).visit( block.tree )
+        DetectMissingValueNext  ( func, 'next'  ).visit( block.tree )
+        block.linted = True
+
+      # If function is decorated with tick_fl, run it as a coroutine if
+      # it is a generator function and wrap it with a greenlet otherwise
+      if 'tick_fl' in block.decorators:
+        if inspect.isgeneratorfunction( func ):
+          if scheduler is None:
+            scheduler = FLScheduler()
+          if not scheduler.tasks:
+            sequential_blocks.append( scheduler.tick_coroutines )
+          func._fl_task = scheduler.add( func )
+          continue
         func = _pausable_tick( func )
 
       sequential_blocks.append( func )
 
     for func in i.get_combinational_blocks():
 
-      tree, _ = get_method_ast( func )
-      DetectIncorrectValueNext( func, 'next'  ).visit( tree )
-      DetectMissingValueNext  ( func, 'value' ).visit( tree )
+      block = _get_block_info( func )
+      if not block.linted:
+        DetectIncorrectValueNext( func, 'next'  ).visit( block.tree )
+        DetectMissingValueNext  ( func, 'value' ).visit( block.tree )
+        block.linted = True
 
   return sequential_blocks
 
+#-----------------------------------------------------------------------
+# get_seq_block_names
+#-----------------------------------------------------------------------
+# Returns a ( model name, block name ) tuple for each of the sequential
+# blocks returned by register_seq_blocks(), where the model name is the
+# hierarchical instance name. The FL scheduler running generator-based
+# @tick_fl blocks is named after the top model.
+def get_seq_block_names( model, sequential_blocks ):
+
+  names  = {}
+  models = [ ( model.name, model ) ]
+  for name, m in models:
+    models.extend( ( name + '.' + x.name, x ) for x in m.get_submodules() )
+    for func in m.get_tick_blocks() + m.get_posedge_clk_blocks():
+      names[ id( func ) ] = ( name, func.__name__ )
+
+  block_names = []
+  for tick in sequential_blocks:
+    func = getattr( tick, '_block', tick )
+    block_names.append( names.get( id( func ), ( model.name, func.__name__ ) ) )
+  return block_names
+
+#-----------------------------------------------------------------------
+# get_named_models
+#-----------------------------------------------------------------------
+# Returns ( name, model ) tuples for all models in the hierarchy, where
+# name is the hierarchical instance name.
+def get_named_models( model, prefix='' ):
+  name   = prefix + model.name
+  models = [ ( name, model ) ]
+  for m in model.get_submodules():
+    models.extend( get_named_models( m, name + '.' ) )
+  return models
+
+#-----------------------------------------------------------------------
+# get_named_nets
+#-----------------------------------------------------------------------
+# Returns ( name, SignalValue ) tuples for all nets, sorted by name. The
+# name of a net is the smallest hierarchical name of its signals.
+def get_named_nets( sim ):
+
+  model_names = dict( ( id( m ), name ) for name, m in
+                      get_named_models( sim.model ) )
+
+  nets = []
+  for group in sim._nets:
+    names  = []
+    svalue = None
+    for x in group:
+      if isinstance( x._signalvalue, int ):
+        continue
+      svalue = x._signalvalue
+      path   = x._path if x._path else ( x.name, )
+      names.append( model_names[ id( x.parent ) ] +
+                    ''.join( '[{}]'.format( p ) if isinstance( p, int )
+                             else '.' + p for p in path ) )
+    if svalue is not None:
+      nets.append( ( min( names ), svalue ) )
+
+  nets.sort()
+  return nets
+
+#-----------------------------------------------------------------------
+# pickle_dumps / pickle_loads
+#-----------------------------------------------------------------------
+# Pickling of values holding Bits, such as the Python-side state of
+# models or results returned by child processes. BitStruct classes are
+# created at runtime and cannot be pickled, so Bits are pickled as their
+# class name, width and value. When loading, Bits are recreated with the
+# class of the same name in classes (a dict of BitStruct classes by
+# name) if there is one, and as plain Bits otherwise.
+
+def _persistent_id( obj ):
+  if isinstance( obj, Bits ):
+    return '{}:{}:{:x}'.format( type( obj ).__name__, obj.nbits, obj._uint )
+  return None
+
+def pickle_dumps( obj ):
+  f = cStringIO.StringIO()
+  pickler = cPickle.Pickler( f, cPickle.HIGHEST_PROTOCOL )
+  pickler.persistent_id = _persistent_id
+  pickler.dump( obj )
+  return f.getvalue()
+
+def pickle_loads( data, classes ):
+
+  def persistent_load( pid ):
+    name, nbits, value = pid.split( ':' )
+    bits = classes.get( name, Bits )( int( nbits ) )
+    bits._uint = int( value, 16 )
+    return bits
+
+  unpickler = cPickle.Unpickler( cStringIO.StringIO( data ) )
+  unpickler.persistent_load = persistent_load
+  return unpickler.load()
+
+#-----------------------------------------------------------------------
+# _get_block_info
+#-----------------------------------------------------------------------
+# Parsing the source of a block and detecting its loads and stores only
+# depends on the code of the block, not on the model instance it belongs
+# to. The results are cached per code object so that all instances of a
+# model share them, and only resolving names to signals is done for each
+# instance.
+_block_cache = {}
+
+class _BlockInfo( object ):
+
+  def __init__( self, func ):
+
+    self.tree, _ = get_method_ast( func )
+    self.linted  = False
+
+    # Note: loads and stores must be detected before linting, because
+    # DetectMissingValueNext modifies the AST.
+
+    self.decorators = DetectDecorators().enter( self.tree )
+
+    visitor = DetectLoadsAndStores()
+    self.loads, self.stores = visitor.enter( self.tree )
+    self.load_ranges = visitor.load_ranges
+    self.const_loads, self.const_stores = \
+      DetectLoadsAndStores( const_index=True ).enter( self.tree )
+
+def _get_block_info( func ):
+  try:
+    return _block_cache[ func.func_code ]
+  except KeyError:
+    block = _block_cache[ func.func_code ] = _BlockInfo( func )
+    return block
+
 #---------------------------------------------------------------------
 # register_comb_blocks
 #---------------------------------------------------------------------
 # Register all decorated @combinational functions with the simulator.
 # Combinational logic blocks are registered with SignalValue objects
 # and get added to the event queue when values are updated.
-def register_comb_blocks( model, event_queue ):
+#
+# If a comb_writes dictionary is provided, the nets written by each block
+# are also recorded so that a static schedule can be created later. A
+# value of None indicates the nets written by a block could not be
+# determined.
+#
+# Blocks which only read some bits of a net, such as a field of a
+# BitStruct (s.in_.msg.opaque) or a slice with constant bounds
+# (s.data[0:8]), are registered with the mask of these bits. Nets with
+# such blocks notify the simulator with add_masked_event(), which only
+# enqueues blocks whose bits changed.
+def register_comb_blocks( model, event_queue, comb_writes = None ):
 
   # Get the sensitivity list of each event driven (combinational) block
   # TODO: do before or after we swap value nodes?
 
+  # Constant indexes are kept when creating a static schedule, otherwise
+  # writes to one element of a list would appear to write all of them.
+
+  const_index = comb_writes is not None
+  sense_masks = {}
+
   for func in model.get_combinational_blocks():
     if not hasattr( func, 'generate_senses' ):
-      tree, _ = get_method_ast( func )
-      loads, stores = DetectLoadsAndStores().enter( tree )
+      block = _get_block_info( func )
+      if const_index: loads, stores = block.const_loads, block.const_stores
+      else:           loads, stores = block.loads,       block.stores
       for name in loads:
         _add_senses( func, model, name )
+      sense_masks[ func ] = _get_sense_masks( model, block.loads,
+                                              block.load_ranges )
+      if comb_writes is not None:
+        comb_writes[ func ] = _get_writes( model, stores )
     else:
       model._newsenses[ func ] = func.generate_senses()
+      if comb_writes is not None:
+        comb_writes[ func ] = None
 
   # Iterate through all @combinational decorated function names we
   # detected, retrieve their associated function pointer, then add
@@ -231,10 +456,21 @@ def register_comb_blocks( model, event_queue ):
     func_ptr.id = event_queue.get_id()
     func_ptr.cb = func_ptr
     #self.metrics.reg_eval( func_ptr.cb )
+    masks = sense_masks.get( func_ptr, {} )
     for signal_value in sensitivity_list:
 
-      # Only add "notify_sim" funcs if @comb blocks are sensitive to us
-      signal_value.notify_sim_comb_update = signal_value._ucb
+      # Only add "notify_sim" funcs if @comb blocks are sensitive to us.
+      # Nets with blocks sensitive to a range of bits keep the value of
+      # the last notification to find out which bits changed.
+      mask = masks.get( id( signal_value ) )
+      if mask is not None:
+        if not signal_value._callback_masks:
+          signal_value._callback_masks = {}
+          signal_value._sense_prev     = signal_value._uint
+        signal_value._callback_masks[ func_ptr ] = mask
+        signal_value.notify_sim_comb_update = signal_value._mucb
+      elif not signal_value._callback_masks:
+        signal_value.notify_sim_comb_update = signal_value._ucb
 
       # Prime the simulation by putting all events on the event_queue
       # This will make sure all nodes come out of reset in a consistent
@@ -246,48 +482,159 @@ def register_comb_blocks( model, event_queue ):
 
   # Recursively perform for submodules
   for m in model.get_submodules():
-    register_comb_blocks( m, event_queue )
+    register_comb_blocks( m, event_queue, comb_writes )
 
 #-----------------------------------------------------------------------
 # _add_senses
 #-----------------------------------------------------------------------
-# Utility function to recursively add signals/lists of signals to
-# the sensitivity list.
+# Utility function to add signals/lists of signals to the sensitivity
+# list.
 def _add_senses( func, model, name ):
-  obj = _attr_name_to_object( model, name )
+  nets = _name_to_nets( model, name )
+  if nets:
+    model._newsenses[ func ].extend( nets )
+
+#-----------------------------------------------------------------------
+# _get_sense_masks
+#-----------------------------------------------------------------------
+# Utility function to find the nets of which a block only reads a range
+# of bits. Returns a dict mapping the id of these nets to the mask of the
+# bits read. Nets read as a whole are not included.
+def _get_sense_masks( model, loads, load_ranges ):
+  masks = {}
+  for name, load_range in zip( loads, load_ranges ):
+    for net, mask in _name_to_masks( model, name, load_range ):
+      if mask is None or masks.get( id( net ), 0 ) is None:
+        masks[ id( net ) ] = None
+      else:
+        masks[ id( net ) ] = masks.get( id( net ), 0 ) | mask
+  return dict( ( k, mask ) for k, mask in masks.items() if mask is not None )
+
+#-----------------------------------------------------------------------
+# _name_to_masks
+#-----------------------------------------------------------------------
+# Utility function to turn a name read by a block, and the constant bit
+# range it indexes if any, into a list of ( net, mask ) tuples. The mask
+# is None if the whole net is read.
+def _name_to_masks( model, name, load_range ):
+
+  try:
+
+    # Constant index or slice of a signal (e.g., s.data[0:8]). Nested
+    # subscripts (e.g., s.data[8:16][2]) are read from the whole net,
+    # since only the range of the last one is known.
+
+    if load_range is not None and name.endswith( '[?]' ) and \
+       name.count( '[?]' ) == 1:
+      obj = _attr_name_to_object( model, name[:-3] )
+      if isinstance( obj, Bits ):
+        net, offset = _get_net_offset( obj )
+        start, stop = load_range
+        if start is None: start = 0
+        if stop  is None: stop  = obj.nbits
+        if net is not None and 0 <= start < stop <= obj.nbits:
+          mask = ( 1 << ( stop - start ) ) - 1
+          return [ ( net, mask << ( offset + start ) ) ]
+
+    # Field of a BitStruct (e.g., s.in_.msg.opaque)
+
+    elif '[?]' not in name:
+      obj = _attr_name_to_object( model, name )
+      if isinstance( obj, BitSlice ):
+        net, offset = _get_net_offset( obj )
+        if net is not None:
+          return [ ( net, obj._mask << offset ) ]
+
+  except ( IndexError, TypeError ):
+    pass
+
+  return [ ( net, None ) for net in _name_to_nets( model, name ) ]
+
+#-----------------------------------------------------------------------
+# _get_net_offset
+#-----------------------------------------------------------------------
+# Utility function to find the net a (possibly nested) BitSlice belongs
+# to, and the position of the slice in the net. Returns ( None, 0 ) if
+# the object is not part of a net.
+def _get_net_offset( obj ):
+  offset = 0
+  while isinstance( obj, BitSlice ):
+    offset += obj._offset
+    obj     = obj._target_bits
+  if not hasattr( obj, '_ucb' ):
+    return None, 0
+  return obj, offset
+
+#-----------------------------------------------------------------------
+# _get_writes
+#-----------------------------------------------------------------------
+# Utility function to turn the names stored to by a combinational block
+# into the list of nets it writes. Returns None if the block writes a
+# signal through a name we cannot resolve (e.g., an alias of a port
+# stored in a temporary), since we cannot know which net is written.
+_root_name   = re.compile( r'[^.\[]*' )
+_value_write = re.compile( r'\.(v|value)(\[[^\]]*\])*$' )
+_const_index = re.compile( r'\[\d+\]$' )
+
+def _get_writes( model, stores ):
+  writes = []
+  for name in stores:
+    root = _root_name.match( name ).group()
+    if root in ( 's', 'self' ):
+      writes.extend( _name_to_nets( model, name ) )
+    elif _value_write.search( name ):
+      return None
+  return writes
+
+#-----------------------------------------------------------------------
+# _name_to_nets
+#-----------------------------------------------------------------------
+# Utility function to recursively turn a name acquired from the ast into
+# a list of nets (SignalValue objects created by insert_signal_values).
+def _name_to_nets( model, name ):
+  # Constant indexes may be out of range (e.g., in unreachable code)
+  try:
+    obj = _attr_name_to_object( model, name )
+  except ( IndexError, TypeError ):
+    return []
   # If name_to_object returned a tuple, this is a list inside of a
   # for loop.  Iteratively go through each object in the list and
-  # recursively call add_senses on it.
+  # recursively call name_to_nets on it.
   if   isinstance( obj, tuple ):
     obj_list, list_name, attr = obj
+    nets = []
     for i, o in enumerate( obj_list ):
       obj_name = "{}[{}]{}".format( list_name, i, attr )
-      _add_senses( func, model, obj_name )
+      nets.extend( _name_to_nets( model, obj_name ) )
+    return nets
 
-  # If this is a signal value, add it to the sensitivity list
+  # If this is a signal value, return the net it belongs to
   elif isinstance( obj, SignalValue ):
 
     # Distinguish between attributes storing signals (InPort/OutPort/Wire)
     # and SignalValues (e.g., Bits), by checking the _ucb attribute.
     target_bits = obj._target_bits
     if hasattr( target_bits, '_ucb' ):
-      model._newsenses[ func ].append( target_bits )
+      return [ target_bits ]
+    # A constant index into a signal (e.g., s.a[2]) yields a temporary
+    # Bits object, so fall back to the net of the indexed signal.
+    elif _const_index.search( name ):
+      return _name_to_nets( model, _const_index.sub( '', name ) )
     elif model._debug:
       warnings.warn( "Cannot add SignalValue '{}' to sensitivity list."
                      "".format( name ), Warning )
 
+  return []
+
 #-----------------------------------------------------------------------
 # _attr_name_to_object
 #-----------------------------------------------------------------------
 # Utility function to turn attributes/names acquired from the ast
 # into Python objects
-# TODO: should never use eval... but this is easy
 # TODO: how to handle when self is neither 's' nor 'self'?
 # TODO: how to handle temps!
 def _attr_name_to_object( model, name ):
-  # Temporarily creates the names 'self' and 's' in the current
-  # scope.  SUPER HACKY
-  self = s = model
+  extra = ''
   # If slice or list, get name components previous to indexing
   if '[?]' in name:
     name, extra = name.split('[?]', 1)
@@ -301,7 +648,10 @@ def _attr_name_to_object( model, name ):
   # list. Return a tuple containing the list object, the list name
   # and the attribute string the appears after the list indexing.
   try:
-    x = eval( name )
+    path = _get_path( name )
+    if path is None or path[0] not in ( 's', 'self' ):
+      raise NameError
+    x = _get_by_path( model, path[1] )
     if   isinstance( x, SignalValue ): return x
     elif isinstance( x, list        ): return ( x, name, extra )
     else:                              raise NameError
@@ -318,7 +668,14 @@ def _attr_name_to_object( model, name ):
 # All ConnectionEdges that contain bit slicing need to be turned into
 # combinational blocks.  This significantly simplifies the connection
 # graph update logic.
-def create_slice_callbacks( slice_connects, event_queue ):
+#
+# Slice connections are grouped by source net and each group is compiled
+# into a single generated function which updates the payload of all the
+# destination nets with shift/mask operations. If metrics are provided,
+# each call of these functions is counted with incr_slice_callbk().
+def create_slice_callbacks( slice_connects, event_queue, metrics = None ):
+
+  groups = collections.OrderedDict()
 
   for c in slice_connects:
     src = c.src_node._signalvalue
@@ -328,17 +685,105 @@ def create_slice_callbacks( slice_connects, event_queue ):
       dest      = c.dest_node._signalvalue
       dest_addr = c.dest_slice if c.dest_slice != None else slice( None )
       dest[ dest_addr ].v = src
-    # If slice is connected to another Signal, create a callback
-    # and put it on the combinational event queue.
+    # Group connections from the same source net
     else:
-      func_ptr     = _create_slice_cb_closure( c )
-      signal_value = c.src_node._signalvalue
-      signal_value.register_slice( func_ptr )
-      func_ptr.id = event_queue.get_id()
-      func_ptr.cb = func_ptr
-      event_queue.enq( func_ptr.cb, func_ptr.id )
-      #self.metrics.reg_eval( func_ptr.cb, is_slice = True )
-      #self._DEBUG_signal_cbs[ signal_value ].append( func_ptr )
+      groups.setdefault( id( src ), ( src, [] ) )[1].append( c )
+
+  # If slice is connected to another Signal, create a callback
+  # and put it on the combinational event queue.
+
+  func_ptrs = _create_slice_cb_funcs( groups.values(), metrics )
+
+  for ( signal_value, _ ), func_ptr in zip( groups.values(), func_ptrs ):
+    signal_value.register_slice( func_ptr )
+    func_ptr.id = event_queue.get_id()
+    func_ptr.cb = func_ptr
+    event_queue.enq( func_ptr.cb, func_ptr.id )
+    if metrics:
+      metrics.reg_eval( func_ptr.cb, is_slice = True )
+
+#-----------------------------------------------------------------------
+# _create_slice_cb_funcs
+#-----------------------------------------------------------------------
+# Utility function to generate the slice callback of each source net.
+# The source of all callbacks is compiled at once. Connections between
+# nets which are not Bits use a generic closure instead.
+def _create_slice_cb_funcs( groups, metrics ):
+
+  src = []
+
+  for i, ( signal_value, conns ) in enumerate( groups ):
+
+    src += [ 'def create_slice_cb_{}( src, conns ):'.format( i ) ]
+    body = []
+
+    for j, c in enumerate( conns ):
+      dest = c.dest_node._signalvalue
+
+      if not ( isinstance( signal_value, Bits ) and
+               isinstance( dest, Bits ) ):
+        src  += [ '  dest_{0} = create_slice_cb( conns[{0}] )'.format( j ) ]
+        body += [ '  dest_{}()'.format( j ) ]
+        continue
+
+      src += [ '  dest_{0} = conns[{0}].dest_node._signalvalue'.format( j ) ]
+
+      src_start,  _ = _slice_range( c.src_slice,  signal_value.nbits )
+      dest_start, _ = _slice_range( c.dest_slice, dest.nbits )
+      mask = ( 1 << c.nbits ) - 1
+
+      # Extract the bits from the source net
+
+      value = 'value'
+      if src_start:              value = '( value >> {} )'.format( src_start )
+      if c.nbits != signal_value.nbits - src_start:
+        value = '( {} & {:#x} )'.format( value, mask )
+
+      # Merge them with the other bits of the destination net
+
+      if dest_start:             value = '( {} << {} )'.format( value, dest_start )
+      if c.nbits != dest.nbits:
+        keep  = dest._mask & ~( mask << dest_start )
+        value = '( dest_{}._uint & {:#x} ) | {}'.format( j, keep, value )
+
+      body += [ '  # {} -> {}'.format( c.src_node.fullname,
+                                       c.dest_node.fullname ),
+                '  new = {}'.format( value ),
+                '  if new != dest_{}._uint:'.format( j ),
+                '    dest_{}._uint = new'.format( j ),
+                '    dest_{}.notify_sim_comb_update()'.format( j ),
+                '    for func in dest_{}._slices: func()'.format( j ) ]
+
+    src += [ '  def slice_cb():' ]
+    if metrics:
+      src += [ '    incr_slice_callbk()' ]
+    src += [ '    value = src._uint' ]
+    src += [ '  ' + x for x in body ]
+    src += [ '  return slice_cb',
+             '' ]
+
+  scope = {
+    'create_slice_cb'   : _create_slice_cb_closure,
+    'incr_slice_callbk' : metrics.incr_slice_callbk if metrics else None,
+  }
+  exec( compile( '\n'.join( src ), '<generated slices>', 'exec' ) ) in scope
+
+  return [ scope[ 'create_slice_cb_{}'.format( i ) ]( signal_value, conns )
+           for i, ( signal_value, conns ) in enumerate( groups ) ]
+
+#-----------------------------------------------------------------------
+# _slice_range
+#-----------------------------------------------------------------------
+# Utility function to turn the address of a slice connection into the
+# [start, stop) range of bits it connects.
+def _slice_range( addr, nbits ):
+  if addr is None:
+    return 0, nbits
+  if isinstance( addr, slice ):
+    start = int( addr.start ) if addr.start is not None else 0
+    stop  = int( addr.stop  ) if addr.stop  is not None else nbits
+    return start, stop
+  return int( addr ), int( addr ) + 1
 
 #-----------------------------------------------------------------------
 # _create_slice_cb_closure
@@ -357,6 +802,313 @@ def _create_slice_cb_closure( c ):
   return slice_cb
 
 
+#-----------------------------------------------------------------------
+# create_static_schedule
+#-----------------------------------------------------------------------
+# Levelize all @combinational blocks in the design so they can be
+# evaluated in a single pass instead of through the event queue. A
+# dependency graph is built from the nets each block reads (its
+# sensitivity list) and writes (comb_writes, see register_comb_blocks),
+# where writes propagate through slice connections since slice callbacks
+# fire immediately when their source net is written.
+#
+# Returns a list of strongly connected components in topological order.
+# Components containing more than one block are combinational loops and
+# must still be evaluated with the event queue until they settle. Only
+# the blocks inside loops are left registered as callbacks on the nets
+# they read, all other nets no longer notify the simulator when written.
+#
+# Returns None if the nets written by some block are unknown.
+def create_static_schedule( model, comb_writes, slice_connects ):
+
+  # Collect all blocks and their sensitivity lists in a deterministic
+  # order (the order blocks were defined in the model hierarchy).
+
+  blocks = []
+  reads  = {}
+  def collect_blocks( m ):
+    for func in m.get_combinational_blocks():
+      blocks.append( func )
+      reads[ func ] = m._newsenses.get( func, [] )
+    for subm in m.get_submodules():
+      collect_blocks( subm )
+
+  collect_blocks( model )
+
+  if any( comb_writes[ func ] is None for func in blocks ):
+    return None
+
+  # Slice callbacks write their destination net as soon as the source
+  # net is written, so a block writing the source of a slice connection
+  # also writes its destination.
+
+  # Note that nets are keyed by id() since SignalValues compare (and
+  # BitStructs hash) by value.
+
+  slice_dests = {}
+  for c in slice_connects:
+    src = c.src_node._signalvalue
+    if not isinstance( src, int ):
+      dests = slice_dests.setdefault( id( src ), [] )
+      dests.append( c.dest_node._signalvalue )
+
+  nets    = {}
+  readers = {}
+  for func in blocks:
+    for net in reads[ func ]:
+      nets[ id( net ) ] = net
+      lst = readers.setdefault( id( net ), [] )
+      if func not in lst:
+        lst.append( func )
+
+  # Build the successor lists of the dependency graph. We ignore blocks
+  # that read nets they write, the event queue never re-triggers the
+  # block currently executing either.
+
+  succs = {}
+  for func in blocks:
+    written = []
+    for net in comb_writes[ func ]:
+      _add_slice_dests( net, slice_dests, written )
+    succs[ func ] = lst = []
+    for net_id in written:
+      for reader in readers.get( net_id, [] ):
+        if reader is not func and reader not in lst:
+          lst.append( reader )
+
+  schedule = _topo_sort_sccs( blocks, succs )
+
+  # Only blocks in combinational loops still need to be notified when
+  # the nets they read change.
+
+  in_loop = set( func for scc in schedule if len( scc ) > 1 for func in scc )
+  for net in nets.values():
+    net._callbacks = [ func for func in net._callbacks if func in in_loop ]
+    if not net._callbacks and 'notify_sim_comb_update' in net.__dict__:
+      del net.notify_sim_comb_update
+
+  return schedule
+
+#-----------------------------------------------------------------------
+# _add_slice_dests
+#-----------------------------------------------------------------------
+# Utility function to add the id of a net and of all nets it drives
+# through slice connections to the list of written nets.
+def _add_slice_dests( net, slice_dests, written ):
+  if id( net ) not in written:
+    written.append( id( net ) )
+    for dest in slice_dests.get( id( net ), [] ):
+      _add_slice_dests( dest, slice_dests, written )
+
+#-----------------------------------------------------------------------
+# _topo_sort_sccs
+#-----------------------------------------------------------------------
+# Iterative implementation of Tarjan's strongly connected components
+# algorithm. Tarjan's algorithm emits each component only after all
+# components reachable from it, so reversing the output gives the
+# components in topological order.
+def _topo_sort_sccs( nodes, succs ):
+
+  index, lowlink = {}, {}
+  stack, on_stack = [], set()
+  sccs = []
+
+  for root in nodes:
+    if root in index: continue
+    work = [ ( root, 0 ) ]
+    while work:
+      node, i = work.pop()
+      if i == 0:
+        index[ node ] = lowlink[ node ] = len( index )
+        stack.append( node )
+        on_stack.add( node )
+      recurse = False
+      for j in range( i, len( succs[ node ] ) ):
+        succ = succs[ node ][ j ]
+        if succ not in index:
+          work.append( ( node, j+1 ) )
+          work.append( ( succ, 0   ) )
+          recurse = True
+          break
+        elif succ in on_stack:
+          lowlink[ node ] = min( lowlink[ node ], index[ succ ] )
+      if recurse:
+        continue
+      if lowlink[ node ] == index[ node ]:
+        scc = []
+        while True:
+          x = stack.pop()
+          on_stack.discard( x )
+          scc.append( x )
+          if x is node: break
+        sccs.append( scc[::-1] )
+      if work:
+        parent = work[-1][0]
+        lowlink[ parent ] = min( lowlink[ parent ], lowlink[ node ] )
+
+  sccs.reverse()
+  return sccs
+
+#-----------------------------------------------------------------------
+# get_static_flops
+#-----------------------------------------------------------------------
+# Returns the list of nets which are only written through .next by the
+# sequential blocks of the design. These nets can be flopped every cycle
+# instead of being added to the register queue each time .next is
+# written. Nets also written through .value in any block and the ports
+# of the top-level model (which may be written by the test harness) are
+# excluded. Returns an empty list if a block writes a signal through a
+# name we cannot resolve, or if the design contains blocks we cannot
+# analyze.
+_next_write = re.compile( r'\.(n|next)(\[[^\]]*\])*$' )
+
+def get_static_flops( model ):
+
+  next_nets  = collections.OrderedDict()
+  value_nets = set()
+
+  models = [ model ]
+  for m in models:
+
+    if hasattr( m, '_cffi_update' ):
+      return []
+
+    for func in ( m.get_tick_blocks() + m.get_posedge_clk_blocks() +
+                  m.get_combinational_blocks() ):
+
+      if hasattr( func, 'generate_senses' ):
+        return []
+
+      for name in _get_block_info( func ).stores:
+        root = _root_name.match( name ).group()
+        if   _next_write.search( name ):
+          if root in ( 's', 'self' ):
+            for net in _name_to_nets( m, _next_write.sub( '', name ) ):
+              next_nets.setdefault( id( net ), net )
+        elif _value_write.search( name ):
+          if root not in ( 's', 'self' ):
+            return []
+          for net in _name_to_nets( m, _value_write.sub( '', name ) ):
+            value_nets.add( id( net ) )
+
+    models.extend( m.get_submodules() )
+
+  for port in model.get_ports():
+    value_nets.add( id( port._signalvalue ) )
+
+  return [ net for key, net in next_nets.items() if key not in value_nets ]
+
+#-----------------------------------------------------------------------
+# create_cycle
+#-----------------------------------------------------------------------
+# Generates the source of a cycle() function specialized for the design
+# and executes it. Sequential blocks, statically flopped nets, (if
+# provided) the static schedule of combinational blocks and the end of
+# cycle hooks of the simulator are bound to local variables of a
+# closure, and each call is emitted as a separate statement so that no
+# lists are iterated each cycle. Returns the generated function and its
+# source.
+def create_cycle( sim, sequential_blocks, static_flops, schedule, dev ):
+
+  # Names of the sequential blocks, only used to annotate the source.
+
+  block_names = [ '{}.{}'.format( *x ) for x in
+                  get_seq_block_names( sim.model, sequential_blocks ) ]
+
+  # Generate the statements evaluating combinational logic.
+
+  if schedule is None:
+    comb_stmts = [ 'eval_combinational()' ]
+  else:
+    comb_stmts = []
+    for i, func in enumerate( schedule ):
+      if dev:
+        comb_stmts.append( 'metrics.incr_comb_evals( comb_{} )'.format( i ) )
+      comb_stmts.append( 'comb_{}()'.format( i ) )
+
+  # Generate the closure variables.
+
+  hooks = sim._cycle_hooks
+
+  src = [ 'def create_cycle( sim, eval_combinational, ticks, flops, combs,',
+          '                  hooks ):',
+          '',
+          '  metrics        = sim.metrics',
+          '  register_queue = sim._register_queue',
+          '  clk            = sim.model.clk',
+          '' ]
+
+  src += [ '  tick_{0} = ticks[{0}]'.format( i )
+           for i in range( len( sequential_blocks ) ) ]
+  src += [ '  flop_{0} = flops[{0}]'.format( i )
+           for i in range( len( static_flops ) ) ]
+  src += [ '  comb_{0} = combs[{0}]'.format( i )
+           for i in range( len( schedule or [] ) ) ]
+  src += [ '  hook_{0} = hooks[{0}]'.format( i )
+           for i in range( len( hooks ) ) ]
+
+  # Generate the body of cycle(), see SimulationTool._dev_cycle and
+  # SimulationTool._perf_cycle for the reference implementations.
+
+  src += [ '',
+           '  def cycle():',
+           '',
+           '    # Call all events generated by input changes' ]
+  src += [ '    ' + x for x in comb_stmts ]
+
+  if dev:
+    src += [ '',
+             '    # Clock generation needed by VCD tracing',
+             '    clk.value = 0',
+             '    clk.value = 1',
+             '',
+             '    metrics.start_tick()' ]
+
+  src += [ '',
+           '    # Call all rising edge triggered functions' ]
+  src += [ '    tick_{}() # {}'.format( i, name )
+           for i, name in enumerate( block_names ) ]
+
+  src += [ '',
+           '    # Then flop the shadow state on all registers' ]
+  src += [ '    flop_{}.flop()'.format( i )
+           for i in range( len( static_flops ) ) ]
+  src += [ '    while register_queue:',
+           '      reg = register_queue.pop()',
+           '      reg._flop_pending = False',
+           '      reg.flop()',
+           '',
+           '    # Call all events generated by synchronous logic' ]
+  src += [ '    ' + x for x in comb_stmts ]
+
+  src += [ '',
+           '    # Increment the simulator cycle count',
+           '    sim.ncycles += 1' ]
+
+  if dev:
+    src += [ '',
+             '    metrics.incr_metrics_cycle()' ]
+
+  if hooks:
+    src += [ '',
+             '    # Call the end of cycle hooks' ]
+    src += [ '    hook_{}()'.format( i ) for i in range( len( hooks ) ) ]
+
+  src += [ '',
+           '  return cycle',
+           '' ]
+
+  src = '\n'.join( src )
+
+  scope = {}
+  exec( compile( src, '<generated cycle>', 'exec' ) ) in scope
+
+  cycle = scope['create_cycle']( sim, sim.eval_combinational,
+                                 sequential_blocks, static_flops, schedule,
+                                 hooks )
+
+  return cycle, src
+
 #---------------------------------------------------------------------
 # _pausable_tick
 #---------------------------------------------------------------------
@@ -392,6 +1144,7 @@ def _pausable_tick( func ):
   def outer_wrapper():
     func._pausable_tick.switch()
 
+  outer_wrapper._block = func
   return outer_wrapper
 
 #-----------------------------------------------------------------------
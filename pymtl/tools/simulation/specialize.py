@@ -0,0 +1,344 @@
+#=======================================================================
+# specialize.py
+#=======================================================================
+# Specialization of the blocks of a design for a simulator.
+#
+# Each time a block runs, an expression like s.in_.msg is evaluated by
+# looking up the closure variable s, then the in_ attribute of the model
+# and the msg attribute of the port bundle. Once the simulator replaced
+# the signals of the design with the SignalValue objects of their nets,
+# the result of these lookups never changes. specialize_blocks()
+# recompiles the source of each block with such expressions replaced by
+# local variables of an enclosing closure, bound to the objects they
+# evaluated to:
+#
+#   @s.combinational                 def create( _sv0, _sv1, s ):
+#   def logic():                       def logic():
+#     s.out.value = s.in_.msg + 1  =>    _sv0.value = _sv1 + 1
+#                                      return logic
+#
+# Only lookups following the structure of the design are bound: the
+# attributes and constant list indexes leading from a model to its
+# signals (ports, port bundles and lists of them) and to its submodels.
+# Python attributes of a model, which can be reassigned, are still
+# looked up each time. Integer constants are folded: closure variables
+# holding an int, and model attributes holding an int which are
+# parameters of the model (the constructor argument with the same name
+# has the same value) never assigned by the blocks of the model.
+
+import ast
+import collections
+import copy
+import types
+
+from ..ast_helpers   import get_method_ast, get_closure_dict
+from ...model.Model  import Model
+
+#-----------------------------------------------------------------------
+# specialize_blocks
+#-----------------------------------------------------------------------
+# Replaces the combinational and sequential blocks of the design with
+# specialized versions. Must be called once all blocks are registered
+# with the simulator and the static schedule is created, before the
+# cycle() function is generated. Generator-based and greenlet-based @tick_fl
+# blocks, blocks with a generated sensitivity list and blocks which
+# cannot be specialized are left untouched. Returns the number of
+# blocks specialized.
+def specialize_blocks( sim ):
+
+  edges  = _get_structural_edges( sim.model, sim._nets )
+  params = {}
+
+  models = [ sim.model ]
+  for m in models:
+    models.extend( m.get_submodules() )
+
+  specialized = {}
+
+  for m in models:
+
+    for func in m.get_combinational_blocks():
+      if hasattr( func, 'cb' ) and not hasattr( func, 'generate_senses' ):
+        new_func = _specialize( func, m, edges, params )
+        if new_func is not None:
+          new_func.id = func.id
+          specialized[ id( func.cb ) ] = new_func
+          func.cb = new_func
+
+    for func in m.get_tick_blocks() + m.get_posedge_clk_blocks():
+      if not hasattr( func, '_fl_task' ) and \
+         not hasattr( func, '_pausable_tick' ):
+        new_func = _specialize( func, m, edges, params )
+        if new_func is not None:
+          new_func._block = func
+          specialized[ id( func ) ] = new_func
+
+  # Blocks were queued when they were registered
+
+  sim._sequential_blocks = [ specialized.get( id( func ), func )
+                             for func in sim._sequential_blocks ]
+
+  if sim._static_schedule is not None:
+    sim._static_schedule = [ specialized.get( id( func ), func )
+                             for func in sim._static_schedule ]
+
+  queue      = sim._event_queue
+  queue.fifo = collections.deque( specialized.get( id( func ), func )
+                                  for func in queue.fifo )
+
+  return len( specialized )
+
+#-----------------------------------------------------------------------
+# _get_structural_edges
+#-----------------------------------------------------------------------
+# Returns the set of ( id( obj ), step ) tuples for the attributes and
+# list indexes leading from each model to its signals and submodels.
+def _get_structural_edges( model, nets ):
+
+  edges = set()
+
+  # Paths of signals, recorded during elaboration
+
+  for group in nets:
+    for signal in group:
+      path = getattr( signal, '_path', None )
+      obj  = getattr( signal, 'parent', None )
+      if not path or obj is None:
+        continue
+      for step in path:
+        edges.add( ( id( obj ), step ) )
+        if isinstance( step, str ): obj = obj.__dict__[ step ]
+        else:                       obj = obj[ step ]
+
+  # Submodels, possibly in (nested) lists
+
+  def add_submodels( obj, step, value, submodels ):
+    if isinstance( value, Model ):
+      if id( value ) in submodels:
+        edges.add( ( id( obj ), step ) )
+        return True
+    elif isinstance( value, list ) and value:
+      found = False
+      for i, x in enumerate( value ):
+        found |= add_submodels( value, i, x, submodels )
+      if found:
+        edges.add( ( id( obj ), step ) )
+      return found
+    return False
+
+  models = [ model ]
+  for m in models:
+    submodels = set( id( x ) for x in m.get_submodules() )
+    models.extend( m.get_submodules() )
+    for name, value in m.__dict__.items():
+      if not name.startswith( '_' ):
+        add_submodels( m, name, value, submodels )
+
+  return edges
+
+#-----------------------------------------------------------------------
+# _specialize
+#-----------------------------------------------------------------------
+# Returns a specialized version of the block func of model, or None if
+# nothing could be bound or folded.
+def _specialize( func, model, edges, params ):
+
+  tree = _get_tree( func )
+  if tree is None or not isinstance( tree.body[0], ast.FunctionDef ):
+    return None
+
+  # The closure of a block can refer to a variable which was never
+  # assigned
+
+  try:
+    closure = get_closure_dict( func )
+  except ValueError:
+    return None
+
+  tree = copy.deepcopy( tree )
+
+  transformer = _BindObjects( closure, edges, params )
+  transformer.enter( tree.body[0] )
+  if not transformer.nreplaced:
+    return None
+
+  # Wrap the block in a function creating it with the bound objects and
+  # the original closure variables as arguments. Default arguments are
+  # restored once the block is created.
+
+  block = tree.body[0]
+  block.decorator_list = []
+  block.args.defaults  = []
+
+  names  = transformer.names + list( func.func_code.co_freevars )
+  values = transformer.values + [ closure[ x ] for x in
+                                  func.func_code.co_freevars ]
+
+  create = ast.FunctionDef(
+    name           = '_create_' + block.name,
+    args           = ast.arguments(
+                       args     = [ ast.Name( id=x, ctx=ast.Param() )
+                                    for x in names ],
+                       vararg   = None,
+                       kwarg    = None,
+                       defaults = [] ),
+    body           = [ block, ast.Return( ast.Name( id=block.name,
+                                                    ctx=ast.Load() ) ) ],
+    decorator_list = [],
+  )
+
+  module = ast.Module( body=[ create ] )
+  ast.increment_lineno( module, func.func_code.co_firstlineno - 1 )
+  ast.fix_missing_locations( module )
+
+  code = compile( module, func.func_code.co_filename, 'exec' )
+  code = [ x for x in code.co_consts if isinstance( x, types.CodeType ) ][0]
+
+  new_func = types.FunctionType( code, func.func_globals )( *values )
+  new_func.func_defaults = func.func_defaults
+  new_func._model        = model
+  return new_func
+
+#-----------------------------------------------------------------------
+# _get_tree
+#-----------------------------------------------------------------------
+# Returns the AST of a block, or None if its source is not available.
+# The AST is parsed again rather than taken from the cache of sim_utils,
+# which the linting of blocks modifies, and cached per code object.
+_block_trees = {}
+
+def _get_tree( func ):
+  try:
+    return _block_trees[ func.func_code ]
+  except KeyError:
+    try:
+      tree, _ = get_method_ast( func )
+    except Exception:
+      tree = None
+    _block_trees[ func.func_code ] = tree
+    return tree
+
+#-----------------------------------------------------------------------
+# _BindObjects
+#-----------------------------------------------------------------------
+# Replaces lookups of structural objects with new local variables, and
+# folds integer constants. Nested scopes, which could shadow closure
+# variables, are not transformed.
+class _BindObjects( ast.NodeTransformer ):
+
+  def __init__( self, closure, edges, params ):
+    self.closure   = closure
+    self.edges     = edges
+    self.params    = params
+    self.names     = []
+    self.values    = []
+    self.bound     = {}
+    self.nreplaced = 0
+
+  def enter( self, node ):
+    self.taken = set( x.id for x in ast.walk( node )
+                      if isinstance( x, ast.Name ) )
+    node.body = [ self.visit( x ) for x in node.body ]
+
+  def visit_FunctionDef( self, node ):
+    return node
+
+  visit_ClassDef     = visit_FunctionDef
+  visit_Lambda       = visit_FunctionDef
+  visit_GeneratorExp = visit_FunctionDef
+  visit_SetComp      = visit_FunctionDef
+  visit_DictComp     = visit_FunctionDef
+
+  def visit_Name( self, node ):
+    if isinstance( node.ctx, ast.Load ) and node.id in self.closure:
+      value = self.closure[ node.id ]
+      if type( value ) in ( int, long ):
+        self.nreplaced += 1
+        return ast.copy_location( ast.Num( n=value ), node )
+    return node
+
+  def visit_Attribute( self, node ):
+    return self._bind( node ) or self.generic_visit( node )
+
+  def visit_Subscript( self, node ):
+    return self._bind( node ) or self.generic_visit( node )
+
+  # Returns the node replacing a lookup, or None if it is not a lookup of
+  # a structural object or a parameter
+
+  def _bind( self, node ):
+
+    if not isinstance( node.ctx, ast.Load ):
+      return None
+
+    steps = []
+    root  = node
+    while True:
+      if isinstance( root, ast.Attribute ):
+        steps.append( root.attr )
+        root = root.value
+      elif isinstance( root, ast.Subscript ) and \
+           isinstance( root.slice, ast.Index ) and \
+           isinstance( root.slice.value, ast.Num ):
+        steps.append( root.slice.value.n )
+        root = root.value
+      else:
+        break
+
+    if not isinstance( root, ast.Name ) or root.id not in self.closure:
+      return None
+
+    obj = self.closure[ root.id ]
+    if not isinstance( obj, Model ):
+      return None
+
+    steps.reverse()
+    for i, step in enumerate( steps ):
+      last = i == len( steps ) - 1
+      if ( id( obj ), step ) in self.edges:
+        obj = obj.__dict__[ step ] if isinstance( step, str ) else obj[ step ]
+      elif last and isinstance( step, str ) and self._is_param( obj, step ):
+        self.nreplaced += 1
+        return ast.copy_location( ast.Num( n=obj.__dict__[ step ] ), node )
+      else:
+        return None
+
+    # Objects used in several places share the same variable
+
+    if id( obj ) not in self.bound:
+      name = '_sv{}'.format( len( self.names ) )
+      while name in self.taken:
+        name = '_' + name
+      self.bound[ id( obj ) ] = name
+      self.names .append( name )
+      self.values.append( obj )
+
+    self.nreplaced += 1
+    return ast.copy_location(
+      ast.Name( id=self.bound[ id( obj ) ], ctx=ast.Load() ), node )
+
+  # Parameters are int attributes with the value of the constructor
+  # argument of the same name, never assigned by the blocks of the model
+
+  def _is_param( self, model, name ):
+
+    args  = getattr( model, '_args', {} )
+    value = model.__dict__.get( name )
+    if type( value ) not in ( int, long ) or args.get( name ) != value:
+      return False
+
+    if id( model ) not in self.params:
+      stored = self.params[ id( model ) ] = set()
+      blocks = model.get_combinational_blocks() + \
+               model.get_tick_blocks() + model.get_posedge_clk_blocks()
+      for func in blocks:
+        tree = _get_tree( func )
+        if tree is None:
+          stored.add( None )
+        else:
+          stored.update( x.attr for x in ast.walk( tree )
+                         if isinstance( x, ast.Attribute ) and
+                            isinstance( x.ctx, ast.Store ) )
+
+    stored = self.params[ id( model ) ]
+    return name not in stored and None not in stored
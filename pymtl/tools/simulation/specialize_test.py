@@ -0,0 +1,135 @@
+#=======================================================================
+# specialize_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl      import *
+from pclib.ifcs import InValRdyBundle, OutValRdyBundle
+
+from specialize import specialize_blocks
+
+#-----------------------------------------------------------------------
+# Adder
+#-----------------------------------------------------------------------
+class Adder( Model ):
+  def __init__( s, nbits, incr ):
+    s.in_   = InValRdyBundle ( nbits )
+    s.out   = OutValRdyBundle( nbits )
+    s.incr  = incr
+    s.nbits = nbits
+
+    @s.combinational
+    def logic():
+      s.out.val.value = s.in_.val
+      s.in_.rdy.value = s.out.rdy
+      s.out.msg.value = s.in_.msg + s.incr
+
+#-----------------------------------------------------------------------
+# Top
+#-----------------------------------------------------------------------
+class Top( Model ):
+  def __init__( s, nports, scale ):
+    s.in_   = [ InPort( 8 ) for _ in range( nports ) ]
+    s.sel   = InPort ( 2 )
+    s.out   = OutPort( 8 )
+    s.count = OutPort( 8 )
+    s.scale = scale
+    s.last  = 0
+
+    s.adder = Adder( 8, 3 )
+    s.connect( s.adder.in_.val, 1 )
+    s.connect( s.adder.out.rdy, 1 )
+
+    @s.combinational
+    def comb_logic():
+      s.adder.in_.msg.value = s.in_[0] + s.in_[ s.sel ]
+
+    @s.tick
+    def seq_logic():
+      if s.reset:
+        s.count.next = 0
+      else:
+        s.count.next = s.count + nports
+      s.out.next = s.adder.out.msg * s.scale
+      s.last     = s.adder.out.msg.uint()
+      s.scale    = scale
+
+#-----------------------------------------------------------------------
+# run
+#-----------------------------------------------------------------------
+# Simulates Top with some stimulus and returns the outputs and the
+# simulator.
+def run( static_schedule, specialize ):
+
+  model = Top( 3, 2 )
+  model.elaborate()
+  sim   = SimulationTool( model, static_schedule=static_schedule,
+                          specialize=specialize )
+  sim.reset()
+
+  trace = []
+  for i in range( 10 ):
+    for j, port in enumerate( model.in_ ):
+      port.value = i * j
+    model.sel.value = i % 3
+    sim.cycle()
+    trace.append( ( model.out.uint(), model.count.uint(), model.last ) )
+
+  return trace, sim
+
+#-----------------------------------------------------------------------
+# test_specialize
+#-----------------------------------------------------------------------
+@pytest.mark.parametrize( 'static_schedule', [ False, True ] )
+def test_specialize( static_schedule ):
+
+  expected, _ = run( static_schedule, False )
+  trace, sim  = run( static_schedule, True  )
+  assert trace == expected
+
+  model = sim.model
+
+  # Lookups of signals and submodels are bound to local variables
+
+  comb_logic = model.get_combinational_blocks()[0].cb
+  assert 'adder' not in comb_logic.func_code.co_names
+  assert 'in_'   not in comb_logic.func_code.co_names
+
+  seq_logic = sim._sequential_blocks[0]
+  assert seq_logic._block is model.get_tick_blocks()[0]
+  assert 'count' not in seq_logic.func_code.co_names
+
+  # Python attributes are still looked up, and so are parameters which
+  # are assigned by a block
+
+  assert 'last'  in seq_logic.func_code.co_names
+  assert 'scale' in seq_logic.func_code.co_names
+
+  # Parameters and closure variables are folded
+
+  logic = model.adder.get_combinational_blocks()[0].cb
+  assert 'incr' not in logic.func_code.co_names
+  assert 3 in logic.func_code.co_consts
+  assert 'nports' not in seq_logic.func_code.co_freevars
+
+#-----------------------------------------------------------------------
+# test_unspecialized
+#-----------------------------------------------------------------------
+# Blocks without anything to bind are left untouched.
+def test_unspecialized():
+
+  class Model1( Model ):
+    def __init__( s ):
+      s.data = []
+
+      @s.tick
+      def logic():
+        s.data.append( len( s.data ) )
+
+  model = Model1()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  assert specialize_blocks( sim ) == 0
+  assert sim._sequential_blocks[0] is model.get_tick_blocks()[0]
@@ -7,12 +7,25 @@
 # - http://support.ema-eda.com/search/eslfiles/default/main/sl_legacy_releaseinfo/staging/sl3/release_info/psd142/vlogref/chap20.html#1031979
 # - http://staff.ustc.edu.cn/~songch/download/IEEE.1364-2005.pdf
 #
+# Two writers are available. VCDUtil writes a value change to the file
+# each time the value of a net changes, including the glitches of
+# combinational logic. VCDWriter (see below) only samples the nets which
+# changed once per cycle and writes the file in large chunks, possibly
+# compressed, and can be restricted to a part of the design. The writer
+# is selected by create_vcd_writer() from the attributes of the model.
+#
 # TODO:
 #
 # - distinguish reg signals from wire signals (maybe)
 
 from __future__ import print_function
 
+import atexit
+import collections
+import fnmatch
+import functools
+import gzip
+import multiprocessing
 import time
 import sys
 
@@ -197,3 +210,570 @@ class VCDUtil():
 
     simulator.vcd = outfile
     insert_vcd_callbacks( simulator, nets )
+
+#-----------------------------------------------------------------------
+# create_vcd_writer
+#-----------------------------------------------------------------------
+# Sets up VCD dumping for a simulator from the attributes of its model:
+#
+#   vcd_file       path of the VCD file, written with gzip compression if
+#                  it ends with .gz
+#   vcd_include    patterns of the signals (or models) to trace
+#   vcd_exclude    patterns of the signals (or models) not to trace
+#   vcd_depth      depth of the deepest models traced, the top model is
+#                  at depth 0
+#   vcd_start      cycle at which the capture starts
+#   vcd_trigger    predicate starting the capture at the end of the first
+#                  cycle (at or after vcd_start) where it returns True
+#   vcd_stop       cycle at which the capture stops, or a predicate
+#                  stopping it at the end of the first cycle where it
+#                  returns True
+#   vcd_history    number of cycles before the start of the capture which
+#                  are kept in memory and written when it starts
+#   vcd_buffered   use VCDWriter even without the options above
+#   vcd_process    use VCDProcessWriter, which formats and compresses
+#                  the VCD in a separate process
+#
+# Patterns are matched with fnmatch against dotted hierarchical paths
+# such as top.ctrl.state or top.mem.port(0).req, with lists mangled like
+# in the VCD file. A pattern matching the path of a model matches all of
+# its signals, including those of its submodels.
+#
+# VCDUtil is used unless one of the options requires a buffered writer.
+def create_vcd_writer( sim, outfile ):
+
+  model   = sim.model
+  options = dict( ( name, getattr( model, 'vcd_' + name ) )
+                  for name in [ 'include', 'exclude', 'depth', 'start',
+                                'trigger', 'stop', 'history' ]
+                  if getattr( model, 'vcd_' + name, None ) is not None )
+
+  compress = isinstance( outfile, str ) and outfile.endswith( '.gz' )
+
+  if getattr( model, 'vcd_process', False ):
+    return VCDProcessWriter( sim, outfile, **options )
+
+  if compress or options or getattr( model, 'vcd_buffered', False ):
+    return VCDWriter( sim, outfile, **options )
+
+  return VCDUtil( sim, outfile )
+
+#-----------------------------------------------------------------------
+# VCDWriter
+#-----------------------------------------------------------------------
+# Buffered VCD writer sampling the nets at the end of each cycle.
+#
+# Instead of formatting a record each time a net changes, the callback
+# registered with each traced net only marks it as dirty, which costs a
+# single set insertion. At the end of each cycle, the dirty nets whose
+# value differs from the last one written are formatted into an
+# in-memory buffer, along with the time stamps and the value of a
+# synthesized clock. Changes within a cycle are recorded at its rising
+# edge. The buffer is written to the file in chunks of about
+# flush_cycles cycles, and when the writer is closed.
+#
+# The capture can be limited to a window of the simulation (see
+# create_vcd_writer() for start, trigger, stop and history). Until the
+# capture starts, the changes of the last history cycles are kept in
+# memory along with the values of all nets at the first of these cycles,
+# which are written as the initial state once the capture starts. The
+# capture can also be started and stopped with start_capture() and
+# stop_capture().
+#
+# The file is only complete once close() is called, which also happens
+# when the interpreter exits.
+class VCDWriter( object ):
+
+  FLUSH_CYCLES = 4096
+
+  def __init__( self, sim, outfile=None, include=None, exclude=None,
+                depth=None, start=None, trigger=None, stop=None,
+                history=0, flush_cycles=FLUSH_CYCLES ):
+
+    self.sim          = sim
+    self.flush_cycles = flush_cycles
+
+    # Write out vcd header and signal definitions
+
+    buf = []
+    buf.append( _capture( write_vcd_header, sim.model ) )
+    signals, nets, clk = _write_filtered_defs( buf, sim.model,
+                           include, exclude, depth )
+
+    self.paths    = [ path for path, net in signals ]
+    self._nets    = [ net for net, symbol in nets ]
+    self._symbols = [ symbol for net, symbol in nets ]
+    self._last    = [ net._uint for net in self._nets ]
+    self._clk     = clk
+    self._dirty   = set()
+    self._ncycles = 0
+    self._hook    = None
+
+    self._start_cycle = start or 0
+    self._trigger     = trigger
+    self._stop        = stop
+    self._history     = collections.deque()
+    self._depth       = history
+    self._base        = list( self._last )
+    self._base_cycle  = sim.ncycles
+
+    self._start( outfile, buf )
+
+    # Mark nets as dirty when they change, through the callbacks which
+    # the nets call immediately like the callbacks of slices
+
+    mark = self._dirty.add
+    for i, net in enumerate( self._nets ):
+      net.register_slice( functools.partial( mark, i ) )
+
+    # Enable vcd mode on the simulator, sample at the end of each cycle
+
+    sim.vcd = self
+    _open_writers.add( self )
+
+    if trigger is None and self._start_cycle <= sim.ncycles:
+      self.start_capture()
+    else:
+      self._set_hook( self._wait )
+
+  #---------------------------------------------------------------------
+  # _start
+  #---------------------------------------------------------------------
+  # Opens the output, buf holds the header.
+  def _start( self, outfile, buf ):
+    self.outfile, self._owns_file = _open_vcd_file( outfile )
+    self._buffer = buf
+
+  #---------------------------------------------------------------------
+  # _write
+  #---------------------------------------------------------------------
+  # Writes formatted records after the pending ones.
+  def _write( self, text ):
+    self._buffer.append( text )
+
+  #---------------------------------------------------------------------
+  # _set_hook
+  #---------------------------------------------------------------------
+  # Replaces the function called at the end of each cycle.
+  def _set_hook( self, func ):
+    if self._hook is not None:
+      self.sim.remove_cycle_hook( self._hook )
+    self._hook = func
+    if func is not None:
+      self.sim.add_cycle_hook( func )
+
+  #---------------------------------------------------------------------
+  # start_capture
+  #---------------------------------------------------------------------
+  # Starts writing the value changes, after the initial state and the
+  # cycles kept in the history.
+  def start_capture( self ):
+
+    if self._hook in ( self.sample, self._sample_until_stop ):
+      return
+
+    # Without history, the changes are not tracked before the capture
+
+    if not self._depth:
+      self._last       = [ net._uint for net in self._nets ]
+      self._base       = list( self._last )
+      self._base_cycle = self.sim.ncycles
+    self._dirty.clear()
+
+    out = [ '#%d\n' % ( 100 * self._base_cycle ) ]
+    if self._clk:
+      out.append( 'b0 %s\n' % self._clk )
+    for value, symbol in zip( self._base, self._symbols ):
+      out.append( 'b%s %s\n' % ( format( value, 'b' ), symbol ) )
+
+    records = [ x for cycle in self._history for x in cycle ]
+    out.append( _format_records( records, self._symbols, self._clk ) )
+    self._history.clear()
+
+    self._write( ''.join( out ) )
+    self._set_hook( self.sample if self._stop is None else
+                    self._sample_until_stop )
+
+  #---------------------------------------------------------------------
+  # stop_capture
+  #---------------------------------------------------------------------
+  # Stops writing the value changes and writes the pending ones.
+  def stop_capture( self ):
+    self._set_hook( None )
+    self.flush()
+
+  #---------------------------------------------------------------------
+  # _wait
+  #---------------------------------------------------------------------
+  # Called at the end of each cycle until the capture starts. Keeps the
+  # changes of the last cycles and checks whether to start the capture.
+  def _wait( self ):
+
+    depth = self._depth
+    if depth:
+      history = self._history
+      history.append( self._get_records() )
+      if len( history ) > depth:
+        cycle = history.popleft()
+        base  = self._base
+        for i in xrange( 0, len( cycle ) - 1, 2 ):
+          base[ cycle[i] ] = cycle[i+1]
+        self._base_cycle = -cycle[-1]
+    else:
+      self._dirty.clear()
+
+    if self.sim.ncycles >= self._start_cycle and \
+       ( self._trigger is None or self._trigger() ):
+      self.start_capture()
+
+  #---------------------------------------------------------------------
+  # _get_records
+  #---------------------------------------------------------------------
+  # Returns the index and value of each net which changed during the
+  # cycle which just ended, then the cycle count negated.
+  def _get_records( self ):
+
+    records = []
+    dirty   = self._dirty
+    if dirty:
+      nets = self._nets
+      last = self._last
+      for i in dirty:
+        value = nets[i]._uint
+        if value != last[i]:
+          last[i] = value
+          records.append( i )
+          records.append( value )
+      dirty.clear()
+    records.append( -self.sim.ncycles )
+
+    return records
+
+  #---------------------------------------------------------------------
+  # _sample_until_stop
+  #---------------------------------------------------------------------
+  def _sample_until_stop( self ):
+    self.sample()
+    stop = self._stop
+    if self.sim.ncycles >= stop if isinstance( stop, ( int, long ) ) \
+       else stop():
+      self.stop_capture()
+
+  #---------------------------------------------------------------------
+  # sample
+  #---------------------------------------------------------------------
+  # Writes the records of the cycle which just ended to the buffer.
+  def sample( self ):
+
+    buf    = self._buffer
+    now    = 100 * self.sim.ncycles
+    clk    = self._clk
+
+    buf.append( '#%d\n' % ( now - 50 ) )
+    if clk:
+      buf.append( 'b1 %s\n' % clk )
+
+    dirty = self._dirty
+    if dirty:
+      nets    = self._nets
+      last    = self._last
+      symbols = self._symbols
+      for i in dirty:
+        value = nets[i]._uint
+        if value != last[i]:
+          last[i] = value
+          buf.append( 'b%s %s\n' % ( format( value, 'b' ), symbols[i] ) )
+      dirty.clear()
+
+    if clk:
+      buf.append( '#%d\nb0 %s\n' % ( now, clk ) )
+
+    self._ncycles += 1
+    if self._ncycles >= self.flush_cycles:
+      self.flush()
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Writes the buffered records to the file.
+  def flush( self ):
+    if self._buffer:
+      self.outfile.write( ''.join( self._buffer ) )
+      self._buffer  = []
+      self._ncycles = 0
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Writes the buffered records, stops sampling and closes the file if it
+  # was opened by the writer.
+  def close( self ):
+
+    if self not in _open_writers:
+      return
+    _open_writers.discard( self )
+
+    self._set_hook( None )
+    self.flush()
+    if self._owns_file:
+      self.outfile.close()
+    else:
+      self.outfile.flush()
+
+#-----------------------------------------------------------------------
+# VCDProcessWriter
+#-----------------------------------------------------------------------
+# VCD writer formatting and compressing the records in a separate
+# process, so that long traced simulations can use a second core.
+#
+# The nets are sampled like with VCDWriter, but the simulator only
+# appends integers to a list each cycle: the index and the value of
+# each net which changed, then the cycle count negated, which marks the
+# end of the records of a cycle. Every flush_cycles cycles, the list is
+# sent through a pipe to the writer process, which formats the records
+# and writes them to the file. Sending blocks while the pipe is full, so
+# the simulator cannot run arbitrarily far ahead of the writer.
+#
+# The writer process is forked, so outfile can also be a file object.
+class VCDProcessWriter( VCDWriter ):
+
+  #---------------------------------------------------------------------
+  # _start
+  #---------------------------------------------------------------------
+  # Starts the writer process, which writes the header first.
+  def _start( self, outfile, buf ):
+
+    if hasattr( outfile, 'flush' ):
+      outfile.flush()
+
+    self._records = []
+
+    recv_conn, self._conn = multiprocessing.Pipe( duplex=False )
+    self._process = multiprocessing.Process(
+      target = _write_vcd_process,
+      args   = ( recv_conn, outfile, ''.join( buf ), self._symbols,
+                 self._clk ),
+    )
+    self._process.daemon = True
+    self._process.start()
+    recv_conn.close()
+
+  #---------------------------------------------------------------------
+  # _write
+  #---------------------------------------------------------------------
+  # Sends formatted records after the pending ones.
+  def _write( self, text ):
+    self.flush()
+    self._conn.send( text )
+
+  #---------------------------------------------------------------------
+  # sample
+  #---------------------------------------------------------------------
+  # Appends the records of the cycle which just ended to the list sent
+  # to the writer process.
+  def sample( self ):
+
+    records = self._records
+    dirty   = self._dirty
+    if dirty:
+      nets = self._nets
+      last = self._last
+      for i in dirty:
+        value = nets[i]._uint
+        if value != last[i]:
+          last[i] = value
+          records.append( i )
+          records.append( value )
+      dirty.clear()
+    records.append( -self.sim.ncycles )
+
+    self._ncycles += 1
+    if self._ncycles >= self.flush_cycles:
+      self.flush()
+
+  #---------------------------------------------------------------------
+  # flush
+  #---------------------------------------------------------------------
+  # Sends the pending records to the writer process.
+  def flush( self ):
+    if self._records:
+      self._conn.send( self._records )
+      self._records = []
+      self._ncycles = 0
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Sends the pending records, stops sampling and waits for the writer
+  # process to write them and close the file.
+  def close( self ):
+
+    if self not in _open_writers:
+      return
+    _open_writers.discard( self )
+
+    self._set_hook( None )
+    self.flush()
+    self._conn.send( None )
+    self._conn.close()
+    self._process.join()
+
+    if self._process.exitcode:
+      raise IOError( "VCD writer process exited with code {}"
+                     .format( self._process.exitcode ) )
+
+#-----------------------------------------------------------------------
+# _write_vcd_process
+#-----------------------------------------------------------------------
+# Main function of the writer process of a VCDProcessWriter.
+def _write_vcd_process( conn, outfile, text, symbols, clk ):
+
+  outfile, owns_file = _open_vcd_file( outfile )
+  outfile.write( text )
+
+  while True:
+    records = conn.recv()
+    if records is None:
+      break
+    elif isinstance( records, str ):
+      outfile.write( records )
+    else:
+      outfile.write( _format_records( records, symbols, clk ) )
+
+  if owns_file:
+    outfile.close()
+  else:
+    outfile.flush()
+
+#-----------------------------------------------------------------------
+# _format_records
+#-----------------------------------------------------------------------
+# Formats the records sent by a VCDProcessWriter like VCDWriter.sample()
+# formats the nets which changed during a cycle.
+def _format_records( records, symbols, clk ):
+
+  out   = []
+  start = 0
+  for end, x in enumerate( records ):
+    if x < 0:
+      now = -100 * x
+      out.append( '#%d\n' % ( now - 50 ) )
+      if clk:
+        out.append( 'b1 %s\n' % clk )
+      for i in xrange( start, end, 2 ):
+        out.append( 'b%s %s\n' % ( format( records[i+1], 'b' ),
+                                   symbols[ records[i] ] ) )
+      if clk:
+        out.append( '#%d\nb0 %s\n' % ( now, clk ) )
+      start = end + 1
+
+  return ''.join( out )
+
+# Writers not closed yet are closed at exit, so that no buffered records
+# are lost and compressed files are complete
+
+_open_writers = set()
+
+@atexit.register
+def _close_open_writers():
+  for writer in list( _open_writers ):
+    writer.close()
+
+#-----------------------------------------------------------------------
+# _open_vcd_file
+#-----------------------------------------------------------------------
+# Returns the file to write a VCD to (stdout if outfile is None, a gzip
+# stream if the path ends with .gz) and whether it was opened here.
+def _open_vcd_file( outfile ):
+  if not outfile:
+    return sys.stdout, False
+  elif not isinstance( outfile, str ):
+    return outfile, False
+  elif outfile.endswith( '.gz' ):
+    return gzip.open( outfile, 'wb', compresslevel=6 ), True
+  else:
+    return open( outfile, 'w' ), True
+
+#-----------------------------------------------------------------------
+# _capture
+#-----------------------------------------------------------------------
+# Returns what a function printing to a file prints.
+def _capture( func, *args ):
+
+  class Output( object ):
+    def __init__( self ):
+      self.lines = []
+    def write( self, s ):
+      self.lines.append( s )
+
+  o = Output()
+  func( o, *args )
+  return ''.join( o.lines )
+
+#-----------------------------------------------------------------------
+# _write_filtered_defs
+#-----------------------------------------------------------------------
+# Writes the definitions of the signals selected by the include and
+# exclude patterns and the depth to the buffer, leaving out the scopes
+# of models without any selected signal. The clock is not traced as a
+# net but synthesized by the writer. Returns the list of ( path, net )
+# tuples of the signals traced, the list of ( net, symbol ) tuples of
+# the traced nets and the symbol of the clock (or None if it is not
+# traced).
+def _write_filtered_defs( buf, model, include, exclude, depth ):
+
+  vcd_symbol = _gen_vcd_symbol()
+  symbols    = {}   # id( net ) -> symbol
+  nets       = []
+  signals    = []
+  clk        = [ None ]
+
+  def matches( patterns, paths ):
+    return any( fnmatch.fnmatchcase( path, pattern )
+                for path in paths for pattern in patterns )
+
+  # Returns the definitions of a model, or an empty list if none of its
+  # signals is traced. Scopes holds the path of the model and of all the
+  # models enclosing it.
+
+  def recurse_models( model, level, scopes ):
+
+    lines = []
+
+    for i in model.get_ports() + model.get_wires():
+
+      path   = scopes[-1] + '.' + mangle_name( i.name )
+      parent = scopes + [ path ]
+      if include and not matches( include, parent ):
+        continue
+      if exclude and matches( exclude, parent ):
+        continue
+
+      net = i._signalvalue
+      if id( net ) not in symbols:
+        symbols[ id( net ) ] = vcd_symbol.next()
+        if i.name == 'clk':
+          clk[0] = symbols[ id( net ) ]
+        else:
+          nets.append( ( net, symbols[ id( net ) ] ) )
+
+      signals.append( ( path, net ) )
+      lines.append( "$var {type} {nbits} {symbol} {name} $end\n".format(
+          type='reg', nbits=i.nbits, symbol=symbols[ id( net ) ],
+          name=mangle_name( i.name ),
+      ) )
+
+    if depth is None or level < depth:
+      for submodel in model.get_submodules():
+        lines.extend( recurse_models( submodel, level+1, scopes +
+                      [ scopes[-1] + '.' + mangle_name( submodel.name ) ] ) )
+
+    if not lines:
+      return []
+    return [ "$scope module {name} $end\n".format( name=model.name ) ] + \
+           lines + [ "$upscope $end\n" ]
+
+  buf.extend( recurse_models( model, 0, [ model.name ] ) )
+  buf.append( "$enddefinitions $end\n\n" )
+
+  return signals, nets, clk[0]
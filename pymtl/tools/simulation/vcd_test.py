@@ -37,3 +37,184 @@ def local_setup_sim( model ):
 
   sim = SimulationTool( model )
   return model, sim
+
+#=======================================================================
+# VCDWriter Tests
+#=======================================================================
+
+import gzip
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+class Counter( Model ):
+  def __init__( s ):
+    s.en    = InPort ( 1 )
+    s.count = OutPort( 8 )
+    s.tmp   = Wire   ( 8 )
+
+    @s.combinational
+    def comb_logic():
+      s.tmp.value = 0
+      s.tmp.value = s.count + 1
+
+    @s.tick
+    def seq_logic():
+      if s.en:
+        s.count.next = s.tmp
+
+class Counters( Model ):
+  def __init__( s ):
+    s.en   = InPort ( 1 )
+    s.out  = OutPort( 8 )
+    s.ctrs = [ Counter() for i in range( 2 ) ]
+    for ctr in s.ctrs:
+      s.connect( s.en, ctr.en )
+    s.connect( s.out, s.ctrs[1].count )
+
+#-----------------------------------------------------------------------
+# run_vcd_writer
+#-----------------------------------------------------------------------
+# Simulates Counters with the given VCD options, returns the definitions
+# and the value changes of the VCD file.
+def run_vcd_writer( tmpdir, filename, **options ):
+
+  model = Counters()
+  for name, value in options.items():
+    setattr( model, name, value )
+  model.vcd_file = str( tmpdir.join( filename ) )
+  model.elaborate()
+
+  sim = SimulationTool( model )
+  for en in [ 1, 1, 0, 1 ]:
+    model.en.value = en
+    sim.cycle()
+  sim.vcd.close()
+
+  opener = gzip.open if filename.endswith( '.gz' ) else open
+  with opener( model.vcd_file, 'rb' ) as f:
+    defs, changes = f.read().split( '$enddefinitions $end\n' )
+  return defs, [ x for x in changes.splitlines() if x ]
+
+#-----------------------------------------------------------------------
+# test_VCDWriter
+#-----------------------------------------------------------------------
+# Nets are sampled once per cycle, so the glitch of tmp is not recorded.
+def test_VCDWriter( tmpdir ):
+
+  defs, changes = run_vcd_writer( tmpdir, 'counters.vcd', vcd_buffered=True )
+  assert defs.count( '$scope module' ) == 3
+  assert defs.count( '$var' ) == 14
+
+  symbols = [ x.split()[3:5] for x in defs.splitlines()
+              if x.startswith( '$var' ) ]
+  clk = [ sym for sym, name in symbols if name == 'clk' ][0]
+  out = [ sym for sym, name in symbols if name == 'out' ][0]
+  tmp = [ sym for sym, name in symbols if name == 'tmp' ]
+
+  assert changes[:2] == [ '#0', 'b0 ' + clk ]
+  assert changes.count( 'b1 ' + clk ) == 4
+  assert changes[-2:] == [ '#400', 'b0 ' + clk ]
+
+  assert [ x.split()[0] for x in changes if x.endswith( ' ' + out ) ] == \
+         [ 'b0', 'b1', 'b10', 'b11' ]
+
+  # Nets written by the first cycle, with the glitch of tmp filtered out
+
+  en    = [ sym for sym, name in symbols if name == 'en'    ][0]
+  count = [ sym for sym, name in symbols if name == 'count' ]
+
+  cycle = changes[ changes.index( '#50' ) + 1 : changes.index( '#100' ) ]
+  assert sorted( cycle ) == sorted( [ 'b1 ' + clk, 'b1 ' + en ] +
+                                    [ 'b1 '  + sym for sym in count ] +
+                                    [ 'b10 ' + sym for sym in tmp ] )
+
+#-----------------------------------------------------------------------
+# test_VCDWriter_filter
+#-----------------------------------------------------------------------
+def test_VCDWriter_filter( tmpdir ):
+
+  defs, changes = run_vcd_writer( tmpdir, 'counters.vcd.gz',
+                                  vcd_include=[ 'top.ctrs(1)' ],
+                                  vcd_exclude=[ '*.tmp', '*.clk' ] )
+  assert defs.count( '$scope module' ) == 2
+  names = [ x.split()[4] for x in defs.splitlines() if x.startswith( '$var' ) ]
+  assert names == [ 'en', 'reset', 'count' ]
+  assert '#350' in changes and changes[1] == 'b0 !'
+
+  defs, changes = run_vcd_writer( tmpdir, 'counters.vcd', vcd_depth=0 )
+  assert defs.count( '$scope module' ) == 1
+  assert defs.count( '$var' ) == 4
+
+#-----------------------------------------------------------------------
+# test_VCDProcessWriter
+#-----------------------------------------------------------------------
+# The writer process writes the same file as VCDWriter.
+def test_VCDProcessWriter( tmpdir ):
+
+  for filename in [ 'counters.vcd', 'counters.vcd.gz' ]:
+    ref = run_vcd_writer( tmpdir, 'ref_' + filename, vcd_buffered=True )
+    out = run_vcd_writer( tmpdir, filename, vcd_process=True )
+    assert out[0].split( '$version' )[1] == ref[0].split( '$version' )[1]
+    assert out[1] == ref[1]
+
+#-----------------------------------------------------------------------
+# test_VCDWriter_window
+#-----------------------------------------------------------------------
+# Capture from cycle 2 to cycle 3, with the changes of cycle 2 kept in
+# the history and the state at cycle 1 written as the initial state.
+def test_VCDWriter_window( tmpdir ):
+
+  for writer in [ 'vcd_buffered', 'vcd_process' ]:
+
+    defs, changes = run_vcd_writer( tmpdir, 'counters.vcd', vcd_start=2,
+                                    vcd_stop=3, vcd_history=1,
+                                    **{ writer : True } )
+
+    symbols = dict( x.split()[3:5][::-1] for x in defs.splitlines()
+                    if x.startswith( '$var' ) )
+    clk, out = symbols['clk'], symbols['out']
+
+    assert changes[:2] == [ '#100', 'b0 ' + clk ]
+    assert [ x for x in changes if x[0] == '#' and x[1:].isdigit() ] == \
+           [ '#100', '#150', '#200', '#250', '#300' ]
+    assert [ x.split()[0] for x in changes if x.endswith( ' ' + out ) ] == \
+           [ 'b1', 'b10' ]
+
+#-----------------------------------------------------------------------
+# test_VCDWriter_trigger
+#-----------------------------------------------------------------------
+def test_VCDWriter_trigger( tmpdir ):
+
+  from vcd import VCDWriter
+
+  model = Counters()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  path   = str( tmpdir.join( 'counters.vcd' ) )
+  writer = VCDWriter( sim, path, trigger=lambda: model.out == 2,
+                      stop=lambda: model.out == 4 )
+
+  for i in range( 8 ):
+    model.en.value = 1
+    sim.cycle()
+  writer.close()
+
+  changes = open( path ).read().split( '$enddefinitions $end\n' )[1].split()
+  assert [ x for x in changes if x[0] == '#' and x[1:].isdigit() ] == \
+         [ '#200', '#250', '#300', '#350', '#400' ]
+
+  # Manual capture
+
+  writer = VCDWriter( sim, path, start=float( 'inf' ) )
+  sim.cycle()
+  writer.start_capture()
+  sim.cycle()
+  writer.stop_capture()
+  sim.cycle()
+  writer.close()
+
+  changes = open( path ).read().split( '$enddefinitions $end\n' )[1].split()
+  assert [ x for x in changes if x[0] == '#' and x[1:].isdigit() ] == \
+         [ '#900', '#950', '#1000' ]
@@ -0,0 +1,569 @@
+#=======================================================================
+# waveform.py
+#=======================================================================
+# Compact binary waveforms with random access.
+#
+# A VCD file is text which must be parsed from the start to find the
+# value of a signal at a given cycle. A WaveformWriter instead stores
+# the changes of each net in separate, zlib-compressed columns, split in
+# chunks of chunk_cycles cycles, and ends the file with an index of
+# fixed-size binary tables giving the location of each column. A
+# Waveform memory-maps the file and reads the tables of the index in
+# place, so opening a waveform does not depend on its size, and only
+# decodes the chunks of the signals which are read:
+#
+#   writer = sim.record_waveform( 'trace.wave' )
+#   sim.run( 100000 )
+#   writer.close()
+#
+#   wave = Waveform.open( 'trace.wave' )
+#   pc   = wave.signal( 'top.core.pc' )[ 1000:2000 ]
+#
+# Signals are read as NumPy arrays holding their value at each cycle,
+# indexed by cycle count: the value at cycle t is the value once t
+# cycles were simulated. Signals wider than 64 bits are read as arrays
+# of Python ints.
+#
+# File format (all integers little endian):
+#
+#   magic           8 bytes, 'PYMTLWF2'
+#   columns         the columns of each chunk:
+#                   - a change column for each net which changed during
+#                     the chunk, the zlib compressed concatenation of the
+#                     cycles of the changes (uint32, relative to the
+#                     start of the chunk) and of their values
+#                   - init columns, the zlib compressed values of the
+#                     nets before the chunk, one column per group of
+#                     init_group consecutive nets
+#                   values are uint8 to uint64 depending on the width of
+#                   the net, or big endian bytes for nets wider than 64
+#                   bits
+#   index           header and tables, see WaveformWriter._write_index
+#   trailer         offset and size of the index (uint64), magic
+
+from __future__ import print_function
+
+import binascii
+import functools
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+from vcd import _write_filtered_defs, _open_writers
+
+MAGIC   = 'PYMTLWF2'
+TRAILER = struct.Struct( '<QQ8s' )
+HEADER  = struct.Struct( '<QQQQQ' )
+
+# Tables of the index
+
+COLUMN = np.dtype( [ ( 'net',    '<u4' ), ( 'count', '<u4' ),
+                     ( 'offset', '<u8' ), ( 'size',  '<u8' ) ] )
+INIT   = np.dtype( [ ( 'offset', '<u8' ), ( 'size',  '<u8' ) ] )
+
+#-----------------------------------------------------------------------
+# WaveformError
+#-----------------------------------------------------------------------
+class WaveformError( Exception ):
+  pass
+
+#-----------------------------------------------------------------------
+# WaveformWriter
+#-----------------------------------------------------------------------
+# Records the changes of the nets of a simulator in a waveform file.
+# Signals are selected with include and exclude patterns and a depth,
+# like the signals of a VCDWriter (see vcd.create_vcd_writer()). Nets
+# are marked dirty when they change and sampled at the end of each
+# cycle, like with a VCDWriter, and the changes are appended to a list
+# per net until the chunk is written.
+#
+# Cycles skipped with run( skip_idle=True ) are not sampled, but since
+# no net changes during these cycles the waveform is still complete.
+class WaveformWriter( object ):
+
+  CHUNK_CYCLES = 4096
+  INIT_GROUP   = 1024
+
+  def __init__( self, sim, path, include=None, exclude=None, depth=None,
+                chunk_cycles=CHUNK_CYCLES, init_group=INIT_GROUP ):
+
+    if not 0 < chunk_cycles < 2**32:
+      raise ValueError( "chunk_cycles must be between 1 and 2**32-1!" )
+    if not init_group > 0:
+      raise ValueError( "init_group must be positive!" )
+
+    self.sim          = sim
+    self.chunk_cycles = chunk_cycles
+    self.init_group   = init_group
+
+    signals, nets, clk = _write_filtered_defs( [], sim.model,
+                           include, exclude, depth )
+
+    # The clock is not recorded, it is not a net of the simulator
+
+    self._nets   = [ net for net, symbol in nets ]
+    index        = dict( ( id( net ), i ) for i, net in
+                         enumerate( self._nets ) )
+    self.paths   = [ ( x, index[ id( net ) ] ) for x, net in signals
+                     if id( net ) in index ]
+
+    self._file = open( path, 'wb' )
+    self._file.write( MAGIC )
+
+    # Rows of the tables of the index, written when the writer is closed
+
+    self._chunks  = []
+    self._columns = []
+    self._inits   = []
+
+    self._last   = [ net._uint for net in self._nets ]
+    self._dirty  = set()
+    self._start_chunk( sim.ncycles )
+
+    mark = self._dirty.add
+    for i, net in enumerate( self._nets ):
+      net.register_slice( functools.partial( mark, i ) )
+
+    sim.add_cycle_hook( self.sample )
+    _open_writers.add( self )
+
+  #---------------------------------------------------------------------
+  # sample
+  #---------------------------------------------------------------------
+  # Records the nets which changed during the cycle which just ended.
+  def sample( self ):
+
+    ncycles = self.sim.ncycles
+
+    dirty = self._dirty
+    if dirty:
+      nets   = self._nets
+      last   = self._last
+      cycles = self._cycles
+      values = self._values
+      for i in dirty:
+        value = nets[i]._uint
+        if value != last[i]:
+          last[i] = value
+          cycles[i].append( ncycles )
+          values[i].append( value )
+      dirty.clear()
+
+    if ncycles >= self._chunk_stop:
+      self._write_chunk( ncycles + 1 )
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # Writes the last chunk and the index, and closes the file.
+  def close( self ):
+
+    if self not in _open_writers:
+      return
+    _open_writers.discard( self )
+
+    self.sim.remove_cycle_hook( self.sample )
+    if self._chunk_start <= self.sim.ncycles:
+      self._write_chunk( self.sim.ncycles + 1 )
+    self._write_index()
+    self._file.close()
+
+  #---------------------------------------------------------------------
+  # _start_chunk
+  #---------------------------------------------------------------------
+  # Starts a chunk at cycle start and writes the init columns holding
+  # the values of the nets before it.
+  def _start_chunk( self, start ):
+
+    self._chunk_start = start
+    self._chunk_stop  = start + self.chunk_cycles - 1
+    self._cycles      = [ [] for net in self._nets ]
+    self._values      = [ [] for net in self._nets ]
+
+    group = self.init_group
+    for first in xrange( 0, len( self._nets ), group ):
+      nets = self._nets[ first:first+group ]
+      data = zlib.compress( ''.join(
+               _encode_values( [ value ], net.nbits ) for net, value
+               in zip( nets, self._last[ first:first+group ] ) ) )
+      self._inits.append( ( self._file.tell(), len( data ) ) )
+      self._file.write( data )
+
+  #---------------------------------------------------------------------
+  # _write_chunk
+  #---------------------------------------------------------------------
+  # Writes the columns of the nets which changed during the cycles of the
+  # current chunk, which ends before cycle stop, and starts the next one.
+  def _write_chunk( self, stop ):
+
+    start = self._chunk_start
+    self._chunks.append( ( start, stop, len( self._columns ) ) )
+
+    for i, cycles in enumerate( self._cycles ):
+      if cycles:
+        data = np.array( cycles, dtype=np.int64 ) - start
+        data = data.astype( '<u4' ).tostring() + \
+               _encode_values( self._values[i], self._nets[i].nbits )
+        data = zlib.compress( data )
+        self._columns.append( ( i, len( cycles ), self._file.tell(),
+                                len( data ) ) )
+        self._file.write( data )
+
+    self._start_chunk( stop )
+
+  #---------------------------------------------------------------------
+  # _write_index
+  #---------------------------------------------------------------------
+  # The index starts with a header giving the number of nets, signals,
+  # chunks and change columns, and the size of the groups of init
+  # columns, followed by tables which can be read in place:
+  #
+  #   starts, stops   uint64 per chunk, its first and last (excluded)
+  #                   cycle
+  #   firsts          uint64 per chunk, plus one, the index of its first
+  #                   change column
+  #   columns         per change column of each chunk, sorted by net:
+  #                   net, number of changes (uint32), offset, size
+  #                   (uint64)
+  #   inits           per chunk and group of nets: offset, size (uint64)
+  #                   of the init column
+  #   path offsets    uint64 per signal, plus one, offset of its path in
+  #                   the paths
+  #   nbits           uint32 per net, its width
+  #   signal nets     uint32 per signal, its net
+  #   signal order    uint32 per signal, the signals sorted by path
+  #   paths           the concatenated paths of the signals
+  def _write_index( self ):
+
+    paths   = [ x for x, net in self.paths ]
+    offsets = np.cumsum( [ 0 ] + map( len, paths ) )
+    order   = sorted( range( len( paths ) ), key=paths.__getitem__ )
+    ngroups = -( -len( self._nets ) // self.init_group )
+
+    # The init columns of the chunk started after the last one are not
+    # part of the index
+
+    chunks = np.array( self._chunks, dtype='<u8' ).reshape( -1, 3 )
+    inits  = self._inits[ :len( self._chunks ) * ngroups ]
+
+    index = ''.join( [
+      HEADER.pack( len( self._nets ), len( paths ), len( self._chunks ),
+                   len( self._columns ), self.init_group ),
+      chunks[:,0].tostring(),
+      chunks[:,1].tostring(),
+      np.array( list( chunks[:,2] ) + [ len( self._columns ) ],
+                dtype='<u8' ).tostring(),
+      np.array( self._columns, dtype=COLUMN ).tostring(),
+      np.array( inits, dtype=INIT ).tostring(),
+      np.array( offsets, dtype='<u8' ).tostring(),
+      np.array( [ net.nbits for net in self._nets ], '<u4' ).tostring(),
+      np.array( [ net for x, net in self.paths ], '<u4' ).tostring(),
+      np.array( order, dtype='<u4' ).tostring(),
+      ''.join( paths ),
+    ] )
+
+    offset = self._file.tell()
+    self._file.write( index )
+    self._file.write( TRAILER.pack( offset, len( index ), MAGIC ) )
+
+#-----------------------------------------------------------------------
+# Waveform
+#-----------------------------------------------------------------------
+# Reader of waveform files. The tables of the index are NumPy arrays
+# over the memory-mapped file, only the paths of the signals which are
+# looked up are read.
+class Waveform( object ):
+
+  def __init__( self, path ):
+
+    with open( path, 'rb' ) as f:
+      self._mmap = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+
+    data = self._mmap
+    if len( data ) < len( MAGIC ) + TRAILER.size or \
+       data[ :len( MAGIC ) ] != MAGIC:
+      raise WaveformError( "{} is not a waveform file".format( path ) )
+
+    offset, size, magic = TRAILER.unpack( data[ -TRAILER.size: ] )
+    if magic != MAGIC:
+      raise WaveformError( "{} is truncated, it was not closed by its "
+                           "writer".format( path ) )
+
+    nnets, nsignals, nchunks, ncolumns, self._init_group = \
+      HEADER.unpack_from( data, offset )
+    ngroups = -( -nnets // self._init_group )
+
+    self._pos = offset + HEADER.size
+
+    self._starts        = self._table( '<u8',  nchunks      )
+    self._stops         = self._table( '<u8',  nchunks      )
+    self._firsts        = self._table( '<u8',  nchunks+1    )
+    self._columns       = self._table( COLUMN, ncolumns     )
+    self._inits         = self._table( INIT,   nchunks*ngroups )
+    self._path_offsets  = self._table( '<u8',  nsignals+1   )
+    self._nbits         = self._table( '<u4',  nnets        )
+    self._signal_nets   = self._table( '<u4',  nsignals     )
+    self._signal_order  = self._table( '<u4',  nsignals     )
+    self._paths_offset  = self._pos
+
+    self._inits = self._inits.reshape( nchunks, ngroups )
+
+  def _table( self, dtype, count ):
+    table      = np.frombuffer( self._mmap, dtype, count, self._pos )
+    self._pos += table.nbytes
+    return table
+
+  #---------------------------------------------------------------------
+  # open
+  #---------------------------------------------------------------------
+  @classmethod
+  def open( cls, path ):
+    return cls( path )
+
+  #---------------------------------------------------------------------
+  # close
+  #---------------------------------------------------------------------
+  # The tables reference the memory map, they are released first.
+  def close( self ):
+    for name in [ '_starts', '_stops', '_firsts', '_columns', '_inits',
+                  '_path_offsets', '_nbits', '_signal_nets',
+                  '_signal_order' ]:
+      setattr( self, name, None )
+    self._mmap.close()
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
+
+  #---------------------------------------------------------------------
+  # start, stop
+  #---------------------------------------------------------------------
+  # First cycle recorded, and first cycle not recorded.
+  @property
+  def start( self ):
+    return int( self._starts[0] )
+
+  @property
+  def stop( self ):
+    return int( self._stops[-1] )
+
+  #---------------------------------------------------------------------
+  # paths
+  #---------------------------------------------------------------------
+  # Paths of all the signals, in the order of their definition.
+  @property
+  def paths( self ):
+    return [ self._path( i ) for i in xrange( len( self._signal_nets ) ) ]
+
+  def _path( self, i ):
+    base = self._paths_offset
+    return self._mmap[ base + int( self._path_offsets[i]   ) :
+                       base + int( self._path_offsets[i+1] ) ]
+
+  #---------------------------------------------------------------------
+  # signal
+  #---------------------------------------------------------------------
+  # Looks up the path with a binary search over the sorted signals.
+  def signal( self, path ):
+
+    order = self._signal_order
+    lo, hi = 0, len( order )
+    while lo < hi:
+      mid = ( lo + hi ) // 2
+      if self._path( order[mid] ) < path: lo = mid + 1
+      else:                               hi = mid
+
+    if lo == len( order ) or self._path( order[lo] ) != path:
+      raise KeyError( "no signal {} in the waveform".format( path ) )
+    return WaveformSignal( self, path, int( self._signal_nets[ order[lo] ] ) )
+
+  #---------------------------------------------------------------------
+  # _read_column
+  #---------------------------------------------------------------------
+  # Returns the arrays of the cycles and values of the changes of a net
+  # during a chunk.
+  def _read_column( self, chunk, net ):
+
+    nbits   = int( self._nbits[ net ] )
+    columns = self._columns[ int( self._firsts[ chunk ] ) :
+                             int( self._firsts[ chunk+1 ] ) ]
+    i       = np.searchsorted( columns['net'], net )
+    if i == len( columns ) or columns['net'][i] != net:
+      return np.zeros( 0, np.int64 ), _empty_values( nbits )
+
+    count  = int( columns['count'][i] )
+    data   = self._read_zlib( columns[i] )
+    cycles = np.frombuffer( data, '<u4', count ).astype( np.int64 )
+    values = _decode_values( data[ 4*count: ], count, nbits )
+    return cycles + int( self._starts[ chunk ] ), values
+
+  #---------------------------------------------------------------------
+  # _read_init
+  #---------------------------------------------------------------------
+  # Returns the value of a net before a chunk, from the init column of
+  # its group of nets.
+  def _read_init( self, chunk, net ):
+
+    group, i = divmod( net, self._init_group )
+    first    = group * self._init_group
+    nbytes   = [ _value_nbytes( int( x ) ) for x in
+                 self._nbits[ first:net+1 ] ]
+    offset   = sum( nbytes[:-1] )
+
+    data = self._read_zlib( self._inits[ chunk, group ] )
+    return _decode_values( data[ offset:offset+nbytes[-1] ], 1,
+                           int( self._nbits[ net ] ) )[0]
+
+  def _read_zlib( self, entry ):
+    offset, size = int( entry['offset'] ), int( entry['size'] )
+    return zlib.decompress( self._mmap[ offset:offset+size ] )
+
+  #---------------------------------------------------------------------
+  # _get_chunks
+  #---------------------------------------------------------------------
+  # Returns the indexes of the chunks holding cycles start to stop
+  # (excluded).
+  def _get_chunks( self, start, stop ):
+    first = max( np.searchsorted( self._starts, start, 'right' ) - 1, 0 )
+    last  = np.searchsorted( self._starts, stop, 'left' )
+    return xrange( first, last )
+
+#-----------------------------------------------------------------------
+# WaveformSignal
+#-----------------------------------------------------------------------
+# A signal of a waveform. Indexing it with a cycle returns the value of
+# the signal at this cycle, and slicing it with a range of cycles
+# returns an array of the values at each cycle of the range.
+class WaveformSignal( object ):
+
+  def __init__( self, wave, path, net ):
+    self.wave  = wave
+    self.path  = path
+    self.nbits = int( wave._nbits[ net ] )
+    self._net  = net
+
+  def __getitem__( self, key ):
+
+    if isinstance( key, slice ):
+      if key.step not in ( None, 1 ):
+        raise ValueError( "waveform slices cannot have a step" )
+      start, stop = self._check_range( key.start, key.stop )
+      return self._read( start, stop )
+
+    start, stop = self._check_range( key, key + 1 )
+    return self._read( start, stop )[0]
+
+  #---------------------------------------------------------------------
+  # changes
+  #---------------------------------------------------------------------
+  # Returns the arrays of the cycles where the signal changed, from start
+  # to stop (excluded), and of its new values.
+  def changes( self, start=None, stop=None ):
+
+    start, stop = self._check_range( start, stop )
+    cycles, values = [], []
+    for chunk in self.wave._get_chunks( start, stop ):
+      c, v = self.wave._read_column( chunk, self._net )
+      keep = ( c >= start ) & ( c < stop )
+      cycles.append( c[ keep ] )
+      values.append( v[ keep ] )
+
+    if not cycles:
+      return np.zeros( 0, np.int64 ), _empty_values( self.nbits )
+    return np.concatenate( cycles ), np.concatenate( values )
+
+  def _check_range( self, start, stop ):
+
+    wave  = self.wave
+    start = wave.start if start is None else start
+    stop  = wave.stop  if stop  is None else stop
+    if not wave.start <= start <= stop <= wave.stop:
+      raise IndexError( "cycles {}:{} not in the waveform, which holds "
+                        "cycles {}:{}".format( start, stop,
+                                               wave.start, wave.stop ) )
+    return start, stop
+
+  # Returns the values at each cycle of the range. Only the init column
+  # of the first chunk is read, the value before each following chunk is
+  # the last value of the previous one.
+
+  def _read( self, start, stop ):
+
+    wave  = self.wave
+    dtype = _value_dtype( self.nbits ) or object
+    out   = [ np.empty( 0, dtype ) ]
+    init  = None
+
+    for chunk in wave._get_chunks( start, stop ):
+
+      cycles, values = wave._read_column( chunk, self._net )
+      lo = max( start, int( wave._starts[ chunk ] ) )
+      hi = min( stop,  int( wave._stops [ chunk ] ) )
+      if init is None:
+        init = wave._read_init( chunk, self._net )
+
+      # Value of the last change at or before each cycle, or the value
+      # before the chunk
+
+      full    = np.empty( hi - lo, dtype )
+      full[:] = init
+      if len( cycles ):
+        i       = np.searchsorted( cycles, np.arange( lo, hi ),
+                                   side='right' ) - 1
+        changed = i >= 0
+        full[ changed ] = values[ i[ changed ] ]
+        init    = values[-1]
+      out.append( full )
+
+    return np.concatenate( out )
+
+#-----------------------------------------------------------------------
+# _value_dtype
+#-----------------------------------------------------------------------
+# Returns the NumPy type of the values of a net, None if it is wider
+# than 64 bits.
+def _value_dtype( nbits ):
+  for n, dtype in [ ( 8, '<u1' ), ( 16, '<u2' ), ( 32, '<u4' ),
+                    ( 64, '<u8' ) ]:
+    if nbits <= n:
+      return np.dtype( dtype )
+  return None
+
+def _value_nbytes( nbits ):
+  dtype = _value_dtype( nbits )
+  return dtype.itemsize if dtype is not None else ( nbits + 7 ) // 8
+
+def _empty_values( nbits ):
+  return np.zeros( 0, _value_dtype( nbits ) or object )
+
+#-----------------------------------------------------------------------
+# _encode_values
+#-----------------------------------------------------------------------
+def _encode_values( values, nbits ):
+
+  dtype = _value_dtype( nbits )
+  if dtype is not None:
+    return np.array( values, dtype=dtype ).tostring()
+
+  nbytes = ( nbits + 7 ) // 8
+  return ''.join( binascii.unhexlify( '%0*x' % ( 2*nbytes, x ) )
+                  for x in values )
+
+#-----------------------------------------------------------------------
+# _decode_values
+#-----------------------------------------------------------------------
+def _decode_values( data, count, nbits ):
+
+  dtype = _value_dtype( nbits )
+  if dtype is not None:
+    return np.frombuffer( data, dtype, count )
+
+  nbytes = ( nbits + 7 ) // 8
+  values = np.empty( count, dtype=object )
+  for i in xrange( count ):
+    values[i] = int( binascii.hexlify( data[ i*nbytes:(i+1)*nbytes ] ), 16 )
+  return values
@@ -0,0 +1,123 @@
+#=======================================================================
+# waveform_test.py
+#=======================================================================
+
+import pytest
+
+from pymtl import *
+
+from waveform import Waveform, WaveformWriter, WaveformError
+
+#-----------------------------------------------------------------------
+# Counter
+#-----------------------------------------------------------------------
+# Counts the cycles where en is high, the wide output holds the count in
+# its top bits.
+class Counter( Model ):
+  def __init__( s ):
+    s.en    = InPort ( 1 )
+    s.count = OutPort( 8 )
+    s.wide  = OutPort( 100 )
+
+    @s.tick
+    def seq_logic():
+      if s.en:
+        s.count.next = s.count + 1
+
+    @s.combinational
+    def comb_logic():
+      s.wide.value = concat( s.count, Bits( 92, 0 ) )
+
+class Top( Model ):
+  def __init__( s ):
+    s.en  = InPort ( 1 )
+    s.out = OutPort( 8 )
+    s.ctr = Counter()
+    s.connect( s.en,  s.ctr.en    )
+    s.connect( s.out, s.ctr.count )
+
+#-----------------------------------------------------------------------
+# record
+#-----------------------------------------------------------------------
+# Simulates Top for ncycles cycles with en high every third cycle, and
+# returns the values of count and wide at each cycle.
+def record( path, ncycles, **kwargs ):
+
+  model = Top()
+  model.elaborate()
+  sim   = SimulationTool( model )
+
+  writer = WaveformWriter( sim, path, **kwargs )
+  ref    = [ ( 0, 0 ) ]
+  for i in range( ncycles ):
+    model.en.value = i % 3 == 0
+    sim.cycle()
+    ref.append( ( model.out.uint(), model.ctr.wide.uint() ) )
+  writer.close()
+
+  return ref
+
+#-----------------------------------------------------------------------
+# test_read
+#-----------------------------------------------------------------------
+# Small init groups split the values of the nets of different widths
+# before each chunk across several init columns.
+@pytest.mark.parametrize( 'chunk_cycles, init_group',
+  [ ( 1, 1024 ), ( 7, 1 ), ( 7, 2 ), ( 4096, 3 ) ] )
+def test_read( tmpdir, chunk_cycles, init_group ):
+
+  path = str( tmpdir.join( 'top.wave' ) )
+  ref  = record( path, 50, chunk_cycles=chunk_cycles,
+                 init_group=init_group )
+
+  with Waveform.open( path ) as wave:
+
+    assert ( wave.start, wave.stop ) == ( 0, 51 )
+    assert 'top.ctr.count' in wave.paths and 'top.clk' not in wave.paths
+
+    count = wave.signal( 'top.ctr.count' )
+    assert list( count[:] ) == [ x for x, y in ref ]
+    assert list( wave.signal( 'top.out' )[10:20] ) == \
+           [ x for x, y in ref[10:20] ]
+    assert count[37] == ref[37][0]
+    assert count[:].dtype == 'uint8'
+
+    wide = wave.signal( 'top.ctr.wide' )
+    assert list( wide[5:45] ) == [ y for x, y in ref[5:45] ]
+    assert wide[50] == ref[50][1]
+
+    cycles, values = count.changes( 10, 20 )
+    assert list( cycles ) == [ 10, 13, 16, 19 ]
+    assert list( values ) == [ 4, 5, 6, 7 ]
+
+    with pytest.raises( IndexError ):
+      count[40:60]
+    with pytest.raises( KeyError ):
+      wave.signal( 'top.missing' )
+
+#-----------------------------------------------------------------------
+# test_filter
+#-----------------------------------------------------------------------
+def test_filter( tmpdir ):
+
+  path = str( tmpdir.join( 'top.wave' ) )
+  record( path, 10, include=[ 'top.ctr' ], exclude=[ '*.wide' ] )
+
+  with Waveform.open( path ) as wave:
+    assert wave.paths == [ 'top.ctr.en', 'top.ctr.reset', 'top.ctr.count' ]
+
+#-----------------------------------------------------------------------
+# test_errors
+#-----------------------------------------------------------------------
+def test_errors( tmpdir ):
+
+  path = tmpdir.join( 'top.wave' )
+  path.write( 'not a waveform' )
+  with pytest.raises( WaveformError ):
+    Waveform.open( str( path ) )
+
+  record( str( path ), 10 )
+  data = path.read( 'rb' )
+  path.write( data[:-4], 'wb' )
+  with pytest.raises( WaveformError ):
+    Waveform.open( str( path ) )
@@ -136,6 +136,8 @@ pytestmark = requires_verilator
      test_MissingValueInCombinationalBlock,),
     ('PyMTLErrors are raised only in the simulator',
      test_MissingListValueInCombinationalBlock,),
+    ('Verilog cannot index a part-select',
+     test_NestedSliceSensitivity,),
 ]]
 
 #-----------------------------------------------------------------------
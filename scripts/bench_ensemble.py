@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_ensemble.py
+#========================================================================
+# Benchmark for the ensemble simulator. Simulates a NormalQueue with
+# random enqueue/dequeue stimulus in an increasing number of lanes and
+# reports the time per cycle, compared with simulating a single copy of
+# the queue with the scalar SimulationTool.
+#
+#  % ./bench_ensemble.py
+#  % ./bench_ensemble.py 10 1000
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..' ) )
+
+from pymtl                                        import SimulationTool
+from pymtl.tools.simulation.EnsembleSimulationTool import \
+    EnsembleSimulationTool
+from pclib.rtl.queues                             import NormalQueue
+
+NCYCLES       = 500
+DEFAULT_LANES = [ 1, 10, 100, 1000, 10000 ]
+
+#------------------------------------------------------------------------
+# bench_scalar
+#------------------------------------------------------------------------
+def bench_scalar( stimulus ):
+
+  model = NormalQueue( 4, 8 )
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  start = time.time()
+  for enq_val, deq_rdy in stimulus[ :, :, 0 ]:
+    model.enq.val.value = int( enq_val )
+    model.deq.rdy.value = int( deq_rdy )
+    sim.cycle()
+  return time.time() - start
+
+#------------------------------------------------------------------------
+# bench_ensemble
+#------------------------------------------------------------------------
+def bench_ensemble( stimulus ):
+
+  model = NormalQueue( 4, 8 )
+  model.elaborate()
+  sim   = EnsembleSimulationTool( model, stimulus.shape[2] )
+  sim.reset()
+
+  start = time.time()
+  for enq_val, deq_rdy in stimulus:
+    sim[ model.enq.val ] = enq_val
+    sim[ model.deq.rdy ] = deq_rdy
+    sim.cycle()
+  return time.time() - start
+
+#------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------
+def main():
+
+  lanes = [ int( x ) for x in sys.argv[1:] ] or DEFAULT_LANES
+  rng   = np.random.RandomState( 0 )
+
+  scalar = bench_scalar( rng.randint( 0, 2, ( NCYCLES, 2, 1 ) ) )
+
+  print( '{:>8} {:>10} {:>14} {:>10}'.format(
+         'lanes', 'seconds', 'us/lane-cycle', 'speedup' ) )
+
+  for nlanes in lanes:
+    seconds = bench_ensemble( rng.randint( 0, 2, ( NCYCLES, 2, nlanes ) ) )
+    print( '{:>8} {:>10.3f} {:>14.3f} {:>10.1f}'.format(
+           nlanes, seconds, seconds / NCYCLES / nlanes * 1e6,
+           scalar * nlanes / seconds ) )
+
+if __name__ == "__main__":
+  main()
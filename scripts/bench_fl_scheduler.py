@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_fl_scheduler.py
+#========================================================================
+# Benchmark for the execution of @tick_fl blocks. Simulates a number of
+# FL consumers popping messages from an input queue through a queue
+# port proxy, and reports the time per cycle when the FL blocks run in
+# greenlets and when they run as coroutines on the FL scheduler. A new
+# message is made valid every period cycles, so the FL blocks are
+# blocked waiting on their input queue most of the time for long
+# periods. Each configuration is simulated a few times and the fastest
+# run is reported.
+#
+#  % ./bench_fl_scheduler.py
+#  % ./bench_fl_scheduler.py 1 10 100
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..' ) )
+
+from pymtl      import *
+from pclib.ifcs import InValRdyBundle
+from pclib.fl   import InQueuePortProxy
+
+NCYCLES         = 2000
+NMODELS         = 64
+NREPEATS        = 3
+DEFAULT_PERIODS = [ 1, 10, 100 ]
+
+#------------------------------------------------------------------------
+# Consumer
+#------------------------------------------------------------------------
+class Consumer( Model ):
+
+  def __init__( s, coroutine ):
+
+    s.in_ = InValRdyBundle( 32 )
+    s.out = OutPort( 32 )
+
+    s.in_queue = InQueuePortProxy( s.in_ )
+
+    if not coroutine:
+      @s.tick_fl
+      def logic():
+        s.out.next = s.in_queue.popleft()
+
+    else:
+      @s.tick_fl
+      def logic():
+        msg = yield s.in_queue.co_popleft()
+        s.out.next = msg
+
+#------------------------------------------------------------------------
+# Harness
+#------------------------------------------------------------------------
+class Harness( Model ):
+
+  def __init__( s, coroutine ):
+
+    s.val = InPort( 1  )
+    s.msg = InPort( 32 )
+
+    s.consumers = [ Consumer( coroutine ) for _ in range( NMODELS ) ]
+
+    for x in s.consumers:
+      s.connect( s.val, x.in_.val )
+      s.connect( s.msg, x.in_.msg )
+
+#------------------------------------------------------------------------
+# bench
+#------------------------------------------------------------------------
+def bench( period, coroutine ):
+
+  model = Harness( coroutine )
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  start = time.time()
+  for i in range( NCYCLES ):
+    model.val.value = ( i % period == 0 )
+    model.msg.value = i
+    sim.cycle()
+  return time.time() - start
+
+#------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------
+def main():
+
+  periods = [ int( x ) for x in sys.argv[1:] ] or DEFAULT_PERIODS
+
+  print( '{:>8} {:>14} {:>14} {:>10}'.format(
+         'period', 'greenlet us/c', 'coroutine us/c', 'speedup' ) )
+
+  for period in periods:
+    greenlets  = min( bench( period, False ) for _ in range( NREPEATS ) )
+    coroutines = min( bench( period, True  ) for _ in range( NREPEATS ) )
+    print( '{:>8} {:>14.1f} {:>14.1f} {:>10.2f}'.format(
+           period, greenlets / NCYCLES * 1e6, coroutines / NCYCLES * 1e6,
+           greenlets / coroutines ) )
+
+if __name__ == "__main__":
+  main()
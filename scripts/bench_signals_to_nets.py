@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_signals_to_nets.py
+#========================================================================
+# Benchmark for the net construction performed by the simulator. Builds
+# synthetic connection graphs of 10k to 1M signals and reports the time
+# taken by sim_utils.signals_to_nets.
+#
+# Each synthetic design is a collection of nets of four signals, which
+# are connected as a chain with a mix of src->dest directions. Every
+# eighth net is also connected to the next net through a bit slice, so
+# slice connections are exercised as well.
+#
+#  % ./bench_signals_to_nets.py
+#  % ./bench_signals_to_nets.py 10000 50000
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..' ) )
+
+from pymtl                          import Wire
+from pymtl.model.ConnectionEdge     import ConnectionEdge
+from pymtl.tools.simulation         import sim_utils
+
+NET_SIZE      = 4
+SLICE_EVERY   = 8
+DEFAULT_SIZES = [ 10000, 100000, 1000000 ]
+
+#------------------------------------------------------------------------
+# build_design
+#------------------------------------------------------------------------
+# Returns the set of signals of a synthetic design with nsignals signals.
+def build_design( nsignals ):
+
+  signals = [ Wire( 8 ) for _ in range( nsignals ) ]
+
+  for i in range( 0, nsignals, NET_SIZE ):
+    net = signals[ i:i+NET_SIZE ]
+    for j in range( len( net ) - 1 ):
+      if j % 2: ConnectionEdge( net[j+1], net[j]   )
+      else:     ConnectionEdge( net[j],   net[j+1] )
+
+  for i in range( 0, nsignals - NET_SIZE, NET_SIZE * SLICE_EVERY ):
+    ConnectionEdge( signals[i][0:4], signals[i+NET_SIZE][4:8] )
+
+  return set( signals )
+
+#------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------
+def main():
+
+  sizes = [ int( x ) for x in sys.argv[1:] ] or DEFAULT_SIZES
+
+  print( '{:>10} {:>10} {:>10} {:>10}'.format(
+         'signals', 'nets', 'slices', 'seconds' ) )
+
+  for nsignals in sizes:
+    signals = build_design( nsignals )
+
+    start = time.time()
+    nets, slice_connects = sim_utils.signals_to_nets( signals )
+    elapsed = time.time() - start
+
+    print( '{:>10} {:>10} {:>10} {:>10.3f}'.format(
+           nsignals, len( nets ), len( slice_connects ), elapsed ) )
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_specialize.py
+#========================================================================
+# Benchmark for the specialization of blocks. Simulates a NormalQueue
+# with random enqueue/dequeue stimulus, with the event-driven and with
+# the static schedule, and reports the time per cycle without and with
+# specialized blocks. Each configuration is simulated a few times and
+# the fastest run is reported.
+#
+#  % ./bench_specialize.py
+#  % ./bench_specialize.py 20000
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..' ) )
+
+from pymtl            import SimulationTool
+from pclib.rtl.queues import NormalQueue
+
+DEFAULT_NCYCLES = 5000
+NREPEATS        = 3
+
+#------------------------------------------------------------------------
+# bench
+#------------------------------------------------------------------------
+def bench( stimulus, static_schedule, specialize ):
+
+  model = NormalQueue( 4, 32 )
+  model.elaborate()
+  sim   = SimulationTool( model, static_schedule=static_schedule,
+                          specialize=specialize )
+  sim.reset()
+
+  start = time.time()
+  for enq_val, deq_rdy, msg in stimulus:
+    model.enq.val.value = enq_val
+    model.enq.msg.value = msg
+    model.deq.rdy.value = deq_rdy
+    sim.cycle()
+  return time.time() - start
+
+#------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------
+def main():
+
+  ncycles  = int( sys.argv[1] ) if len( sys.argv ) > 1 else DEFAULT_NCYCLES
+  rng      = np.random.RandomState( 0 )
+  stimulus = [ ( int( a ), int( b ), int( c ) ) for a, b, c in
+               zip( rng.randint( 0, 2, ncycles ), rng.randint( 0, 2, ncycles ),
+                    rng.randint( 0, 2**32, ncycles ) ) ]
+
+  print( '{:>10} {:>14} {:>14} {:>10}'.format(
+         'schedule', 'generic us/c', 'special us/c', 'speedup' ) )
+
+  for static_schedule in [ False, True ]:
+    generic = min( bench( stimulus, static_schedule, False )
+                   for _ in range( NREPEATS ) )
+    special = min( bench( stimulus, static_schedule, True  )
+                   for _ in range( NREPEATS ) )
+    print( '{:>10} {:>14.1f} {:>14.1f} {:>10.2f}'.format(
+           'static' if static_schedule else 'events',
+           generic / ncycles * 1e6, special / ncycles * 1e6,
+           generic / special ) )
+
+if __name__ == "__main__":
+  main()
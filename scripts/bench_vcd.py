@@ -0,0 +1,93 @@
+#! /usr/bin/env python
+#========================================================================
+# bench_vcd.py
+#========================================================================
+# Benchmark for VCD dumping. Simulates a NormalQueue with random
+# enqueue/dequeue stimulus without a VCD file, with the unbuffered
+# writer (VCDUtil), with the buffered writer (VCDWriter) and with the
+# writer formatting in a separate process (VCDProcessWriter), plain and
+# compressed, and reports the time per cycle and the size of the file.
+# Each configuration is simulated a few times and the fastest run is
+# reported.
+#
+#  % ./bench_vcd.py
+#  % ./bench_vcd.py 20000
+
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), '..' ) )
+
+from pymtl            import SimulationTool
+from pclib.rtl.queues import NormalQueue
+
+DEFAULT_NCYCLES = 5000
+NREPEATS        = 3
+
+#------------------------------------------------------------------------
+# bench
+#------------------------------------------------------------------------
+def bench( stimulus, vcd_file, writer ):
+
+  model = NormalQueue( 4, 32 )
+  if vcd_file:
+    model.vcd_file     = vcd_file
+    model.vcd_buffered = writer == 'buffered'
+    model.vcd_process  = writer == 'process'
+  model.elaborate()
+  sim   = SimulationTool( model )
+  sim.reset()
+
+  start = time.time()
+  for enq_val, deq_rdy, msg in stimulus:
+    model.enq.val.value = enq_val
+    model.enq.msg.value = msg
+    model.deq.rdy.value = deq_rdy
+    sim.cycle()
+  if vcd_file:
+    sim.vcd.close()
+  return time.time() - start
+
+#------------------------------------------------------------------------
+# main
+#------------------------------------------------------------------------
+def main():
+
+  ncycles  = int( sys.argv[1] ) if len( sys.argv ) > 1 else DEFAULT_NCYCLES
+  rng      = np.random.RandomState( 0 )
+  stimulus = [ ( int( a ), int( b ), int( c ) ) for a, b, c in
+               zip( rng.randint( 0, 2, ncycles ), rng.randint( 0, 2, ncycles ),
+                    rng.randint( 0, 2**32, ncycles ) ) ]
+
+  tmpdir = tempfile.mkdtemp()
+
+  print( '{:>12} {:>10} {:>10}'.format( 'writer', 'us/cycle', 'KiB' ) )
+
+  for name, filename, writer in [
+    ( 'none',       None,             None       ),
+    ( 'VCDUtil',    'util.vcd',       None       ),
+    ( 'VCDWriter',  'writer.vcd',     'buffered' ),
+    ( 'writer gz',  'writer.vcd.gz',  'buffered' ),
+    ( 'process',    'process.vcd',    'process'  ),
+    ( 'process gz', 'process.vcd.gz', 'process'  ),
+  ]:
+    path    = os.path.join( tmpdir, filename ) if filename else None
+    seconds = min( bench( stimulus, path, writer )
+                   for _ in range( NREPEATS ) )
+    size    = os.path.getsize( path ) / 1024.0 if path else 0.0
+    print( '{:>12} {:>10.1f} {:>10.1f}'.format(
+           name, seconds / ncycles * 1e6, size ) )
+
+    if path:
+      os.remove( path )
+
+  os.rmdir( tmpdir )
+
+if __name__ == "__main__":
+  main()
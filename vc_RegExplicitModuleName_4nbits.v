@@ -0,0 +1,227 @@
+//-----------------------------------------------------------------------------
+// vc_RegExplicitModuleName_4nbits
+//-----------------------------------------------------------------------------
+// PyMTL: dump_vcd = True
+// PyMTL: verilog_test {"nbits": 4}
+// PyMTL: verilator_xinit = zeros
+`default_nettype none
+module vc_RegExplicitModuleName_4nbits
+(
+  input  wire [   0:0] clk,
+  input  wire [   3:0] in_,
+  output wire [   3:0] out,
+  input  wire [   0:0] reset
+);
+
+  // Imported Verilog source from:
+  // /root/package/pymtl/tools/integration/verilog_tests/vc-regs.v
+
+  vc_RegExplicitModuleName#(
+    .p_nbits ( 4 )
+  )  verilog_module
+  (
+    .clk ( clk ),
+    .d   ( in_ ),
+    .q   ( out )
+  );
+
+endmodule // vc_RegExplicitModuleName_4nbits
+`default_nettype wire
+
+`line 1 "vc-regs.v" 0
+//========================================================================
+// Verilog Components: Registers
+//========================================================================
+
+// Note that we place the register output earlier in the port list since
+// this is one place we might actually want to use positional port
+// binding like this:
+//
+//  wire [p_nbits-1:0] result_B;
+//  vc_Reg#(p_nbits) result_AB( clk, result_B, result_A );
+
+`ifndef VC_REGS_V
+`define VC_REGS_V
+
+`line 1 "vc-assert.v" 0
+//========================================================================
+// vc-Assert
+//========================================================================
+
+`ifndef VC_ASSERT_V
+`define VC_ASSERT_V
+
+//------------------------------------------------------------------------
+// VC_PROPAGATE_X
+//------------------------------------------------------------------------
+
+`define VC_PROPAGATE_X( i_, o_ )                                        \
+  if ((|(i_ ^ i_)) == 1'b0);                                            \
+  else                                                                  \
+    o_ = o_ + 1'bx
+
+//------------------------------------------------------------------------
+// VC_ASSERT
+//------------------------------------------------------------------------
+
+`define VC_ASSERT( expr_ )                                              \
+  if ( expr_ );                                                         \
+  else begin                                                            \
+    $display( "\n VC_ASSERT FAILED\n  - assertion       :%s\n  - module instance : %m\n  - time            : %0d\n", \
+              "expr_", $time );                                         \
+    $finish;                                                            \
+  end                                                                   \
+  if (1)
+
+//------------------------------------------------------------------------
+// VC_ASSERT_FAIL
+//------------------------------------------------------------------------
+
+`define VC_ASSERT_FAIL( msg_ )                                         \
+  $display( "\n VC_ASSERT FAILED\n  - assertion       :%s\n  - module instance : %m\n  - time            : %0d\n", \
+            msg_, $time );                                             \
+  $finish;                                                             \
+  if (1)
+
+//------------------------------------------------------------------------
+// VC_ASSERT_NOT_X
+//------------------------------------------------------------------------
+
+`define VC_ASSERT_NOT_X( net_ )                                         \
+  if ((|(net_ ^ net_)) == 1'b0);                                        \
+  else begin                                                            \
+    $display( "\n VC_ASSERT FAILED\n  - assertion that net not contain X's failed\n  - module instance : %m\n  - net             :%s\n  - time            : %0d\n", \
+              "net_", $time );                                          \
+    $finish;                                                            \
+  end                                                                   \
+  if (1)
+
+`endif /* VC_ASSERT_V */
+
+
+`line 16 "vc-regs.v" 0
+
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop
+//------------------------------------------------------------------------
+
+module vc_Reg
+#(
+  parameter p_nbits = 1
+)(
+  input                clk, // Clock input
+  output [p_nbits-1:0] q,   // Data output
+  input  [p_nbits-1:0] d    // Data input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    q <= d;
+
+endmodule
+
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop
+//------------------------------------------------------------------------
+// Just a copy of vc_Reg used for testing explicit module names
+
+module vc_RegExplicitModuleName
+#(
+  parameter p_nbits = 1
+)(
+  input                clk, // Clock input
+  output [p_nbits-1:0] q,   // Data output
+  input  [p_nbits-1:0] d    // Data input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    q <= d;
+
+endmodule
+
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop with reset
+//------------------------------------------------------------------------
+
+module vc_ResetReg
+#(
+  parameter p_nbits       = 1,
+  parameter p_reset_value = 0
+)(
+  input                clk,   // Clock input
+  input                reset, // Sync reset input (sampled on rising edge)
+  output [p_nbits-1:0] q,     // Data output
+  input  [p_nbits-1:0] d      // Data input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    q <= reset ? p_reset_value : d;
+
+endmodule
+
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop with enable
+//------------------------------------------------------------------------
+
+module vc_EnReg
+#(
+  parameter p_nbits = 1
+)(
+  input                clk,   // Clock input
+  input                reset, // Sync reset input (sampled on rising edge)
+  output [p_nbits-1:0] q,     // Data output
+  input  [p_nbits-1:0] d,     // Data input (sampled on rising clk edge)
+  input                en     // Enable input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    if ( en )
+      q <= d;
+
+  // Assertions
+
+  always @( posedge clk )
+    if ( !reset )
+      `VC_ASSERT_NOT_X( en );
+
+endmodule
+
+//------------------------------------------------------------------------
+// Postive-edge triggered flip-flop with enable and reset
+//------------------------------------------------------------------------
+
+module vc_EnResetReg
+#(
+  parameter p_nbits       = 1,
+  parameter p_reset_value = 0
+)(
+  input                clk,   // Clock input
+  input                reset, // Sync reset input (sampled on rising edge)
+  output [p_nbits-1:0] q,     // Data output
+  input  [p_nbits-1:0] d,     // Data input (sampled on rising clk edge)
+  input                en     // Enable input (sampled on rising clk edge)
+);
+
+  reg q;
+
+  always @( posedge clk )
+    if ( reset || en )
+      q <= reset ? p_reset_value : d;
+
+  // Assertions
+
+  always @( posedge clk )
+    if ( !reset )
+      `VC_ASSERT_NOT_X( en );
+
+endmodule
+
+`endif /* VC_REGS_V */
+